@@ -0,0 +1,134 @@
+import os
+import time
+
+
+class CpuMeter:
+    """Uso de CPU de todo el equipo (0-1) a partir de /proc/stat.
+
+    Si /proc/stat no existe (fuera de Linux) usa el load average por núcleo.
+    """
+
+    def __init__(self):
+        self.last = self._read()
+
+    def _read(self):
+        try:
+            with open("/proc/stat", "r") as f:
+                values = [int(v) for v in f.readline().split()[1:]]
+            idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+            return idle, sum(values)
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def usage(self):
+        current = self._read()
+        if current is None or self.last is None:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        idle = current[0] - self.last[0]
+        total = current[1] - self.last[1]
+        self.last = current
+        return 1.0 - idle / total if total > 0 else 0.0
+
+
+class AdaptiveRate:
+    """Cadencia adaptativa de detección y captura de una cámara.
+
+    Con la escena quieta se procesa 1 de cada `idle_stride` frames; apenas
+    hay movimiento (o la alarma está armada) se pasa a `active_stride`
+    (cada frame). Si el CPU o el atraso de la detección suben, se espacia la
+    detección hasta `max_stride` y después se saltean frames en la captura
+    (hasta `max_capture_stride`). Al aliviarse, se recupera en orden inverso.
+
+    `armed` y `capture_stride` son valores compartidos: el primero lo escribe
+    el proceso web y el segundo lo lee el proceso de captura.
+    """
+
+    CHECK_INTERVAL = 1.0  # Segundos entre mediciones de CPU
+
+    def __init__(self, det_config: dict, fps, armed=None, capture_stride=None):
+        rate_config = det_config.get("adaptive") or {}
+        static_stride = det_config.get("process_every_n_frames", 2) + 1
+
+        self.enabled = rate_config.get("enabled", True)
+        self.idle_stride = rate_config.get("idle_stride", static_stride)
+        self.active_stride = rate_config.get("active_stride", 1)
+        self.max_stride = max(self.idle_stride, rate_config.get("max_stride", 10))
+        self.max_capture_stride = rate_config.get("max_capture_stride", 2)
+        self.motion_hold = rate_config.get("motion_hold_seconds", 10)
+        self.cpu_high = rate_config.get("cpu_high", 0.85)
+        self.cpu_low = rate_config.get("cpu_low", 0.6)
+        self.lag_high = rate_config.get("lag_high_frames", 3)
+
+        self.fps = fps
+        self.armed = armed
+        self.capture_stride = capture_stride
+        if self.capture_stride is not None:
+            self.capture_stride.value = 1
+
+        self.cpu = CpuMeter()
+        self.cpu_load = 0.0
+        self.backoff = 0
+        self.max_lag = 0
+        self.last_motion = 0
+        self.last_check = time.time()
+        self.mode = "reposo"
+        self.detection_stride = self.idle_stride if self.enabled else static_stride
+
+    def update(self, motion, lag_frames):
+        """Registrar el resultado de una detección y recalcular la cadencia"""
+        if not self.enabled:
+            return self.detection_stride
+
+        now = time.time()
+        if motion:
+            self.last_motion = now
+        self.max_lag = max(self.max_lag, lag_frames)
+
+        if self.armed is not None and self.armed.value:
+            self.mode = "armada"
+        elif now - self.last_motion < self.motion_hold:
+            self.mode = "movimiento"
+        else:
+            self.mode = "reposo"
+        base = self.idle_stride if self.mode == "reposo" else self.active_stride
+
+        if now - self.last_check >= self.CHECK_INTERVAL:
+            self.last_check = now
+            self._adjust_backoff(base)
+
+        self.detection_stride = min(self.max_stride, base + self.backoff)
+        return self.detection_stride
+
+    def _adjust_backoff(self, base):
+        """Espaciar o recuperar según CPU y atraso del último intervalo"""
+        self.cpu_load = self.cpu.usage()
+        overloaded = self.cpu_load > self.cpu_high or self.max_lag > self.lag_high
+        relaxed = self.cpu_load < self.cpu_low and self.max_lag <= 1
+        self.max_lag = 0
+
+        capture_stride = self.capture_stride.value if self.capture_stride is not None else 1
+        if overloaded:
+            if base + self.backoff < self.max_stride:
+                self.backoff += 1
+            elif self.capture_stride is not None and capture_stride < self.max_capture_stride:
+                self.capture_stride.value = capture_stride + 1
+                print(f"⚠️ CPU {self.cpu_load:.0%}: captura a 1 de cada {capture_stride + 1} frames")
+        elif relaxed:
+            if capture_stride > 1:
+                self.capture_stride.value = capture_stride - 1
+            elif self.backoff > 0:
+                self.backoff -= 1
+
+    def get_stats(self):
+        capture_stride = self.capture_stride.value if self.capture_stride is not None else 1
+        capture_fps = self.fps / capture_stride
+        return {
+            "enabled": self.enabled,
+            "mode": self.mode,
+            "detection_stride": self.detection_stride,
+            "capture_stride": capture_stride,
+            "capture_fps": round(capture_fps, 1),
+            "detection_fps": round(capture_fps / self.detection_stride, 1),
+            "backoff": self.backoff,
+            "cpu_load": round(self.cpu_load, 2),
+        }
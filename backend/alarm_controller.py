@@ -0,0 +1,120 @@
+import time
+import threading
+
+from incidents import IncidentCoalescer
+
+
+class AlarmController:
+    """Lógica de alarma común a todas las cámaras.
+
+    Consume los resultados de detección que llegan de los procesos de cada
+    cámara y decide qué hacer: LED parpadeante, buzzer y un incidente
+    (evento en la base de datos, clip en el almacén y alerta de Telegram con
+    el video). Las detecciones seguidas de una cámara se agrupan en el
+    incidente abierto en vez de disparar todo de nuevo.
+    """
+
+    def __init__(self, config: dict, is_alarm_enabled_func=None, clip_store=None, notifier=None, event_writer=None):
+        self.config = config
+        self.clip_store = clip_store
+        self.notifier = notifier  # TelegramDispatcher (envío en segundo plano)
+        self.incidents = IncidentCoalescer(config, clip_store=clip_store, notifier=notifier,
+                                           event_writer=event_writer)
+        self.is_alarm_enabled = is_alarm_enabled_func or (lambda: True)
+        self.running = True
+        self.alarm_triggered = False  # Alarma activada (LED parpadeando)
+        self.led_blink_thread = None
+        self.last_alert = {}         # cam_id -> última alerta (cooldown por cámara)
+        self.last_motion_print = {}  # cam_id -> último log con alarma desactivada
+
+        det_config = config.get("detection", {})
+        hw_config = config.get("hardware", {})
+        print(f" Buzzer: {hw_config.get('buzzer_duration', 60)}s por detección | "
+              f"Cooldown Telegram: {det_config.get('cooldown_seconds', 10)}s | "
+              f"Incidentes: ventana de {self.incidents.window}s")
+
+    def _led_blink_loop(self, blink_interval=0.3):
+        """Parpadeo continuo del LED rojo mientras la alarma está activa"""
+        from gpio_control import encender_rojo, apagar_rojo
+        while self.running and self.alarm_triggered and self.is_alarm_enabled():
+            encender_rojo()
+            time.sleep(blink_interval)
+            apagar_rojo()
+            time.sleep(blink_interval)
+        # Al terminar, apagar LED
+        apagar_rojo()
+
+    def _buzzer_pulse(self, duration):
+        """Activa el buzzer por un tiempo determinado"""
+        from gpio_control import encender_buzzer, apagar_buzzer
+        encender_buzzer()
+        time.sleep(duration)
+        apagar_buzzer()
+
+    def reset_alarm(self):
+        """Resetear estado de alarma (llamado desde web al desactivar)"""
+        self.alarm_triggered = False
+        from gpio_control import apagar_rojo, apagar_buzzer
+        apagar_rojo()
+        apagar_buzzer()
+
+    def handle_result(self, camera, result):
+        """Procesar un resultado de detección de una cámara"""
+        if not result["motion"]:
+            return
+
+        det_config = camera.config.get("detection", {})
+        cooldown = det_config.get("cooldown_seconds", 10)
+        motion_print_cooldown = det_config.get("log_cooldown_seconds", 5)
+        current_time = time.time()
+
+        # ✅ LÓGICA DE ALARMA - Persistente hasta desactivación manual
+        if self.is_alarm_enabled():
+            # Con un incidente abierto en esta cámara la detección solo se suma a él
+            if self.incidents.extend(camera, result.get("zone"), result.get("timestamp"), cooldown=cooldown):
+                return
+            # Si es una nueva detección (después del cooldown de esta cámara)
+            if (current_time - self.last_alert.get(camera.cam_id, 0)) > cooldown:
+                self.last_alert[camera.cam_id] = current_time
+                self._trigger_alarm(camera, result.get("zone"))
+
+        elif current_time - self.last_motion_print.get(camera.cam_id, 0) > motion_print_cooldown:
+            # Alarma desactivada pero hay movimiento
+            print(f" Movimiento detectado en {camera.name}, pero alarma desactivada.")
+            self.last_motion_print[camera.cam_id] = current_time
+
+    def _trigger_alarm(self, camera, zone=None):
+        """Activa LED, buzzer y abre un incidente (evento, clip y alerta de Telegram)"""
+        where = f"{camera.name} (zona {zone})" if zone else camera.name
+        hw_config = self.config.get("hardware", {})
+        buzzer_duration = hw_config.get("buzzer_duration", 60)
+        led_blink_interval = hw_config.get("led_blink_interval", 0.3)
+
+        # Si no había alarma activa, iniciar LED parpadeante
+        if not self.alarm_triggered:
+            self.alarm_triggered = True
+            print(f"🚨 ¡ALARMA ACTIVADA por {where}! LED parpadeando hasta desactivación manual")
+
+            # Iniciar parpadeo del LED en thread separado
+            self.led_blink_thread = threading.Thread(
+                target=self._led_blink_loop,
+                args=(led_blink_interval,),
+                daemon=True
+            )
+            self.led_blink_thread.start()
+        else:
+            print(f"🚨 Nueva detección de movimiento en {where}")
+
+        # Activar buzzer por 60 segundos (en thread separado)
+        threading.Thread(
+            target=self._buzzer_pulse,
+            args=(buzzer_duration,),
+            daemon=True
+        ).start()
+
+        # Evento, alerta de Telegram y un solo clip para todo el incidente
+        self.incidents.open(camera, zone)
+
+    def stop(self):
+        self.running = False
+        self.reset_alarm()
@@ -1,7 +1,15 @@
-from flask import Flask, render_template, jsonify, Response, redirect, url_for, session, request
-import cv2, yaml, os, time
+from flask import Flask, render_template, jsonify, Response, redirect, url_for, session, request, send_file
+import yaml, os, base64, json
+from sqlalchemy import DateTime, literal, tuple_
 from models import get_session_maker, Event
-from motion_detector import MotionDetector
+from camera_manager import CameraManager
+from clip_store import ClipStore
+import event_search
+import event_stats
+from clip_thumbnails import SPRITE_TILE_WIDTH, poster_name, sprite_name
+from telegram_notifier import TelegramDispatcher
+from alarm_controller import AlarmController
+from event_writer import EventWriter
 from gpio_control import encender_rojo, apagar_rojo, limpiar, encender_verde
 from auth import login_required, get_current_user
 from dotenv import load_dotenv
@@ -20,6 +28,8 @@ apagar_rojo()
 app = Flask(__name__)
 load_dotenv()
 app.secret_key = os.getenv("SECRET_KEY")
+# Detrás de nginx/apache, que el servidor web mande los clips (X-Sendfile) sin pasar por Python
+app.config["USE_X_SENDFILE"] = config.get("streaming", {}).get("x_sendfile", False)
 
 @app.after_request
 def add_no_cache_headers(response):
@@ -27,6 +37,10 @@ def add_no_cache_headers(response):
     if request.path.startswith("/google-login") or request.path.startswith("/callback"):
         return response
 
+    # Miniaturas de clips: inmutables, el navegador las guarda
+    if "immutable" in response.headers.get("Cache-Control", ""):
+        return response
+
     # Para todo lo demás sí bloquear cache
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, private, max-age=0'
     response.headers['Pragma'] = 'no-cache'
@@ -34,42 +48,36 @@ def add_no_cache_headers(response):
     return response
 
 
-SessionLocal = get_session_maker(config["database"]["path"])
+db_config = config.get("database", {})
+# Un solo engine con pool y PRAGMAs para todo el proceso; los eventos se insertan en lote desde un thread
+SessionLocal = get_session_maker(db_config["path"], db_config)
+event_writer = EventWriter(SessionLocal, db_config)
 
 def is_alarm_active():
     return config["schedule"]["alarm_enabled"]
 
-detector = MotionDetector(config["camera"]["rtsp_url"], config=config, is_alarm_enabled_func=is_alarm_active)
+# Clips de eventos en disco con índice, cuota y antigüedad máxima
+clip_store = ClipStore(config, SessionLocal)
+
+# Lógica de alarma en este proceso; captura y detección en un proceso por cámara
+notifier = TelegramDispatcher(config.get("telegram", {}))
+alarm = AlarmController(config, is_alarm_enabled_func=is_alarm_active, clip_store=clip_store, notifier=notifier,
+                        event_writer=event_writer)
+camera_manager = CameraManager(config, on_result=alarm.handle_result, is_armed=is_alarm_active)
 
 # Funciones de callback para el scheduler
 def auto_activate_alarm():
     """Activar alarma automáticamente"""
     config["schedule"]["alarm_enabled"] = True
     encender_rojo()
-    db = SessionLocal()
-    try:
-        evento = Event(event_type="alarma_activada", info="activada automáticamente por programación")
-        db.add(evento)
-        db.commit()
-    except:
-        db.rollback()
-    finally:
-        db.close()
+    event_writer.add("alarma_activada", "activada automáticamente por programación")
 
 def auto_deactivate_alarm():
     """Desactivar alarma automáticamente"""
     config["schedule"]["alarm_enabled"] = False
-    detector.reset_alarm()
+    alarm.reset_alarm()
     apagar_rojo()
-    db = SessionLocal()
-    try:
-        evento = Event(event_type="alarma_desactivada", info="desactivada automáticamente por programación")
-        db.add(evento)
-        db.commit()
-    except:
-        db.rollback()
-    finally:
-        db.close()
+    event_writer.add("alarma_desactivada", "desactivada automáticamente por programación")
 
 # Inicializar programador
 scheduler = AlarmScheduler(config, auto_activate_alarm, auto_deactivate_alarm)
@@ -130,7 +138,8 @@ def index():
     events = db.query(Event).order_by(Event.timestamp.desc()).limit(10).all()
     user = get_current_user(db)
     db.close()
-    return render_template("index.html", events=events, user=user)
+    cameras = [{"id": c.cam_id, "name": c.name} for c in camera_manager.list()]
+    return render_template("index.html", events=events, user=user, cameras=cameras)
 
 @app.route("/api/alarma/activar", methods=["POST"])
 @login_required
@@ -142,13 +151,8 @@ def activar_alarma():
         encender_rojo()
         user = get_current_user(db)
         print(f"🔴 Alarma ACTIVADA por {user.get('email')}")
-        evento = Event(event_type="alarma_activada", info=f"activada por {user.get('email')}")
-        db.add(evento)
-        db.commit()
+        event_writer.add("alarma_activada", f"activada por {user.get('email')}")
         return jsonify({"estado": "activada", "alarm_enabled": True, "manual_mode": True})
-    except Exception as e:
-        db.rollback()
-        raise e
     finally:
         db.close()
 
@@ -160,17 +164,12 @@ def desactivar_alarma():
     try:
         config["schedule"]["alarm_enabled"] = False
         scheduler.set_manual_override(True)
-        detector.reset_alarm()
+        alarm.reset_alarm()
         apagar_rojo()
         user = get_current_user(db)
         print(f"🟢 Alarma DESACTIVADA por {user.get('email')}")
-        evento = Event(event_type="alarma_desactivada", info=f"desactivada por {user.get('email')}")
-        db.add(evento)
-        db.commit()
+        event_writer.add("alarma_desactivada", f"desactivada por {user.get('email')}")
         return jsonify({"estado": "desactivada", "alarm_enabled": False, "manual_mode": True})
-    except Exception as e:
-        db.rollback()
-        raise e
     finally:
         db.close()
 
@@ -184,58 +183,138 @@ def estado_alarma():
     })
 
 
+@app.route("/api/camaras", methods=["GET"])
+@login_required
+def listar_camaras():
+    """Cámaras configuradas con sus estadísticas"""
+    return jsonify({
+        "cameras": [{
+            "id": camera.cam_id,
+            "name": camera.name,
+            "stats": camera.get_stats()
+        } for camera in camera_manager.list()]
+    })
+
+
+@app.route("/api/camara/stats", methods=["GET"])
+@app.route("/api/camaras/<cam_id>/stats", methods=["GET"])
+@login_required
+def estadisticas_camara(cam_id=None):
+    """Estadísticas del pipeline: frames capturados, descartados y atraso de la detección"""
+    camera = camera_manager.get(cam_id)
+    if camera is None:
+        return jsonify({"error": "Cámara no encontrada"}), 404
+    return jsonify(camera.get_stats())
+
+
+@app.route("/api/camaras/<cam_id>/frecuencia", methods=["GET"])
+@login_required
+def frecuencia_camara(cam_id):
+    """Cadencia efectiva: modo (reposo/movimiento/armada), FPS de captura y de detección"""
+    camera = camera_manager.get(cam_id)
+    if camera is None:
+        return jsonify({"error": "Cámara no encontrada"}), 404
+    return jsonify(camera.get_rate())
+
+
 @app.route("/video_feed")
+@app.route("/video_feed/<cam_id>")
 @login_required
-def video_feed():
-    def generate():
-        # Parámetros desde config
-        streaming_config = config.get("streaming", {})
-        jpeg_quality = [int(cv2.IMWRITE_JPEG_QUALITY), streaming_config.get("jpeg_quality", 60)]
-        target_fps = streaming_config.get("target_fps", 10)
-        max_width = streaming_config.get("max_width", 640)
-        frame_delay = 1.0 / target_fps
-        last_frame_time = 0
-        frame_skip_counter = 0
-
-        while True:
-            current_time = time.time()
-
-            # Control de FPS - limitar a 10 FPS
-            if current_time - last_frame_time < frame_delay:
-                time.sleep(0.01)  # Pequeña pausa para no consumir CPU
-                continue
-
-            frame = detector.get_frame()
-            if frame is None:
-                frame_skip_counter += 1
-                if frame_skip_counter > 50:  # Si falla mucho, pausa más
-                    time.sleep(0.5)
-                    frame_skip_counter = 0
-                continue
-
-            frame_skip_counter = 0
-
-            # Reducir resolución si es muy grande (mejora performance)
-            height, width = frame.shape[:2]
-            if width > max_width:
-                scale = max_width / width
-                new_width = max_width
-                new_height = int(height * scale)
-                frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
-
-            # Codificar con calidad reducida para menos latencia
-            success, buffer = cv2.imencode(".jpg", frame, jpeg_quality)
-
-            if not success:
-                continue
-
-            last_frame_time = current_time
+def video_feed(cam_id=None):
+    camera = camera_manager.get(cam_id)
+    if camera is None:
+        return jsonify({"error": "Cámara no encontrada"}), 404
+
+    # Todos los clientes comparten el mismo JPEG (uno por perfil de calidad)
+    profile = request.args.get("perfil")
+    # ?vista=deteccion: frame de detección con la máscara de movimiento
+    if request.args.get("vista") == "deteccion":
+        broadcaster = camera.detection_broadcaster
+    else:
+        broadcaster = camera.broadcaster
 
+    def generate():
+        for jpeg in broadcaster.subscribe(profile):
             yield (b"--frame\r\n"
-                   b"Content-Type: image/jpeg\r\n\r\n" + buffer.tobytes() + b"\r\n")
+                   b"Content-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n")
 
     return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
+@app.route("/api/events/writer/stats", methods=["GET"])
+@login_required
+def estadisticas_escritura_eventos():
+    """Filas por segundo, tamaño de lote y latencia de escritura de eventos"""
+    return jsonify(event_writer.get_stats())
+
+
+@app.route("/api/incidentes/stats", methods=["GET"])
+@login_required
+def estadisticas_incidentes():
+    """Incidentes abiertos y cuántas detecciones se agruparon"""
+    return jsonify(alarm.incidents.get_stats())
+
+
+@app.route("/api/notificaciones/stats", methods=["GET"])
+@login_required
+def estadisticas_notificaciones():
+    """Cola, reintentos y latencia de entrega de Telegram"""
+    return jsonify(notifier.get_stats())
+
+
+@app.route("/api/clips", methods=["GET"])
+@login_required
+def listar_clips():
+    """Clips grabados (filtros opcionales: camara, evento, limit)"""
+    clips = clip_store.list(
+        camera_id=request.args.get("camara"),
+        event_id=request.args.get("evento", type=int),
+        limit=request.args.get("limit", 50, type=int)
+    )
+    return jsonify({"clips": clips, "count": len(clips), "almacen": clip_store.get_stats()})
+
+
+@app.route("/api/clips/<int:clip_id>", methods=["GET"])
+@login_required
+def obtener_clip(clip_id):
+    """Clip MP4 con soporte de Range (saltar en el video), ETag/If-Modified-Since y envío sin copias.
+
+    Con ?descargar=1 se baja como adjunto. El archivo lo manda el servidor
+    con wsgi.file_wrapper (sendfile) o X-Sendfile si está configurado.
+    """
+    # Un reproductor pide muchos rangos: el acceso se registra solo al empezar desde el principio
+    byte_range = request.headers.get("Range", "")
+    clip, path = clip_store.get(clip_id, touch=not byte_range or byte_range.startswith("bytes=0-"))
+    if clip is None or not os.path.exists(path):
+        return jsonify({"error": "Clip no encontrado"}), 404
+    return _send_immutable(path, "video/mp4", download_name=clip["filename"],
+                           as_attachment=request.args.get("descargar") == "1")
+
+
+def _send_immutable(path, mimetype, **kwargs):
+    """send_file condicional (ETag, 304, 206 Range) con caché privada e inmutable"""
+    response = send_file(path, mimetype=mimetype, etag=True, conditional=True, **kwargs)
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/api/clips/<int:clip_id>/poster.jpg", methods=["GET"])
+@app.route("/api/clips/<int:clip_id>/sprite.jpg", methods=["GET"])
+@login_required
+def miniatura_clip(clip_id):
+    """Poster o sprite del clip (generados al grabar) con ETag y caché inmutable"""
+    clip, _ = clip_store.get(clip_id, touch=False)
+    if clip is None:
+        return jsonify({"error": "Clip no encontrado"}), 404
+    name = sprite_name(clip["filename"]) if request.path.endswith("sprite.jpg") else poster_name(clip["filename"])
+    path = clip_store.path(name)
+    if not os.path.exists(path):
+        return jsonify({"error": "Miniatura no disponible"}), 404
+    return _send_immutable(path, "image/jpeg")
+
+
 @app.route("/api/alarma/auto", methods=["POST"])
 @login_required
 def modo_automatico():
@@ -279,10 +358,34 @@ def get_schedules():
     })
 
 
+def _encode_cursor(direction, sort, values):
+    """Cursor opaco: dirección, orden y valores de la clave de orden en el borde de la página"""
+    raw = json.dumps([direction, sort, values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, cursor_sort, values = json.loads(raw)
+        if direction not in ("next", "prev") or cursor_sort != sort or not isinstance(values, list):
+            raise ValueError(f"{direction}/{cursor_sort}")
+        if sort == "recent":
+            values = [literal(datetime.fromisoformat(values[0]), DateTime), literal(int(values[1]))]
+        else:
+            values = [literal(value) for value in values]
+        return direction, values
+    except (TypeError, ValueError, IndexError, json.JSONDecodeError) as e:
+        raise ValueError(f"cursor inválido: {e}")
+
+
 @app.route("/api/events", methods=["GET"])
 @login_required
 def get_events():
-    """Obtener eventos con filtros"""
+    """Obtener eventos con filtros, paginados por cursor (`next_cursor` / `prev_cursor`).
+
+    `order=relevance` ordena una búsqueda por relevancia en vez de por fecha.
+    """
     db = SessionLocal()
     try:
         # Parámetros de filtro
@@ -290,9 +393,9 @@ def get_events():
         end_date = request.args.get('end_date')
         event_type = request.args.get('event_type')
         search = request.args.get('search')
-        limit = request.args.get('limit', 15, type=int)
-
-        page = request.args.get
+        limit = max(1, min(request.args.get('limit', 15, type=int), 200))
+        cursor = request.args.get('cursor')
+        order = request.args.get('order', 'recent')
 
         # Query base
         query = db.query(Event)
@@ -319,28 +422,96 @@ def get_events():
         if event_type and event_type != 'all':
             query = query.filter(Event.event_type == event_type)
 
-        # Búsqueda de texto
-        if search:
-            search_pattern = f"%{search}%"
-            query = query.filter(
-                (Event.event_type.like(search_pattern)) |
-                (Event.info.like(search_pattern))
-            )
+        # Búsqueda de texto: índice FTS5 (prefijos, frases, relevancia y fragmentos) o LIKE si no está
+        fts = event_search.match_expression(search) if search and event_search.fts_available(db) else None
+        if fts:
+            query = event_search.apply_fts(query, fts)
+        elif search:
+            query = query.filter(event_search.like_filter(search))
+
+        # Clave de orden (`sort` queda en el cursor):
+        #  - recent: (timestamp, id) del más nuevo al más viejo, por los índices de fecha
+        #  - recent_match: búsqueda FTS5 por rowid descendente; el índice ya los recorre en ese
+        #    orden y corta al completar la página (el id crece con el tiempo, igual que timestamp)
+        #  - relevance: (rank, id), BM25 sobre las coincidencias más recientes
+        if fts and order == 'relevance':
+            sort, sort_key, ascending = 'relevance', (event_search.rank(), Event.id), True
+            query = query.filter(event_search.rank_window(fts))
+        elif fts:
+            order = 'recent'
+            sort, sort_key, ascending = 'recent_match', (event_search.events_fts.c.rowid,), False
+        else:
+            order = 'recent'
+            sort, sort_key, ascending = 'recent', (Event.timestamp, Event.id), False
+
+        # Paginación por cursor sobre la clave: cada página cuesta lo mismo que la primera,
+        # sin importar cuántas filas quedan atrás
+        direction = "next"
+        if cursor:
+            try:
+                direction, edge_values = _decode_cursor(cursor, sort)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if len(sort_key) == 1:
+                key, edge = sort_key[0], edge_values[0]
+            else:
+                key, edge = tuple_(*sort_key), tuple_(*edge_values)
+            query = query.filter(key > edge if (direction == "next") == ascending else key < edge)
+
+        # Una fila de más para saber si hay otra página en esa dirección
+        forward = ascending != (direction == "prev")
+        rows = query.order_by(*[column.asc() if forward else column.desc() for column in sort_key]) \
+                    .limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == "prev":
+            rows.reverse()
+        # Con FTS cada fila es (evento, rank, fragmento)
+        hits = [tuple(row) if fts else (row, None, None) for row in rows]
+        events = [event for event, _, _ in hits]
+
+        def page_cursor(page_direction, hit):
+            event, rank, _ = hit
+            values = {
+                'recent': [event.timestamp.isoformat(), event.id],
+                'recent_match': [event.id],
+                'relevance': [rank, event.id],
+            }[sort]
+            return _encode_cursor(page_direction, sort, values)
+
+        next_cursor = prev_cursor = None
+        if hits:
+            if direction == "prev":
+                next_cursor = page_cursor("next", hits[-1])
+                prev_cursor = page_cursor("prev", hits[0]) if has_more else None
+            else:
+                next_cursor = page_cursor("next", hits[-1]) if has_more else None
+                prev_cursor = page_cursor("prev", hits[0]) if cursor else None
 
-        # Ordenar y limitar
-        events = query.order_by(Event.timestamp.desc()).limit(limit).all()
+        # Clips de los eventos (para las vistas previas)
+        clips = clip_store.for_events([event.id for event in events])
+        incidents = alarm.incidents.for_events([event.id for event in events])
 
         # Convertir a diccionario
         events_list = [{
             'id': event.id,
             'event_type': event.event_type,
             'info': event.info,
-            'timestamp': event.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        } for event in events]
+            'timestamp': event.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'clip': clips.get(event.id),
+            'incident': incidents.get(event.id),
+            'rank': rank,
+            'snippet': event_search.highlight(snippet)
+        } for event, rank, snippet in hits]
 
         return jsonify({
             'events': events_list,
-            'count': len(events_list)
+            'count': len(events_list),
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'order': order,
+            'search_mode': 'fts' if fts else ('like' if search else None),
+            'sprite_tile_width': SPRITE_TILE_WIDTH
         })
 
     except Exception as e:
@@ -432,42 +603,45 @@ def export_events():
 @app.route("/api/events/stats", methods=["GET"])
 @login_required
 def get_event_stats():
-    """Obtener estadísticas de eventos"""
+    """Obtener estadísticas de eventos (una sola lectura de los conteos por hora/día)"""
     db = SessionLocal()
     try:
-        from datetime import datetime, timedelta
-        from sqlalchemy import func
-
-        # Eventos hoy
-        today = datetime.now().date()
-        today_start = datetime.combine(today, datetime.min.time())
-        events_today = db.query(Event).filter(Event.timestamp >= today_start).count()
+        return jsonify(event_stats.summary(db))
 
-        # Eventos esta semana
-        week_start = today - timedelta(days=today.weekday())
-        week_start_dt = datetime.combine(week_start, datetime.min.time())
-        events_week = db.query(Event).filter(Event.timestamp >= week_start_dt).count()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
 
-        # Eventos este mes
-        month_start = today.replace(day=1)
-        month_start_dt = datetime.combine(month_start, datetime.min.time())
-        events_month = db.query(Event).filter(Event.timestamp >= month_start_dt).count()
 
-        # Total de eventos
-        events_total = db.query(Event).count()
+@app.route("/api/events/series", methods=["GET"])
+@login_required
+def get_event_series():
+    """Histograma de eventos por hora o por día (UTC) para graficar.
 
-        # Eventos por tipo
-        events_by_type = db.query(
-            Event.event_type,
-            func.count(Event.id)
-        ).group_by(Event.event_type).all()
+    `start_date` / `end_date` (YYYY-MM-DD, inclusive; por defecto los
+    últimos 7 días), `interval` hour|day (por defecto hour hasta 7 días) y
+    `event_type` opcional.
+    """
+    db = SessionLocal()
+    try:
+        try:
+            end_date = request.args.get('end_date')
+            end = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)) if end_date \
+                else datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            start_date = request.args.get('start_date')
+            start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else end - timedelta(days=7)
+            interval = request.args.get('interval') or ('hour' if end - start <= timedelta(days=7) else 'day')
+            types, points = event_stats.series(db, start, end, interval, request.args.get('event_type'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         return jsonify({
-            'today': events_today,
-            'week': events_week,
-            'month': events_month,
-            'total': events_total,
-            'by_type': [{'type': t, 'count': c} for t, c in events_by_type]
+            'interval': interval,
+            'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'end': end.strftime('%Y-%m-%d %H:%M:%S'),
+            'types': types,
+            'series': points
         })
 
     except Exception as e:
@@ -478,6 +652,10 @@ def get_event_stats():
 # Limpiar al cerrar
 import atexit
 atexit.register(lambda: scheduler.stop())
+atexit.register(lambda: camera_manager.stop())
+atexit.register(lambda: clip_store.stop())
+atexit.register(lambda: notifier.stop())
+atexit.register(lambda: event_writer.stop())
 
 if __name__ == "__main__":
     try:
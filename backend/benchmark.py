@@ -0,0 +1,142 @@
+"""Benchmark de motores de detección con videos grabados.
+
+Reproduce los archivos a máxima velocidad (sin esperas) por cada motor y
+reporta frames/seg, tiempo por etapa y acuerdo con el motor de referencia,
+para elegir el motor más barato que igual detecta intrusos en este equipo.
+
+Uso:
+    python benchmark.py video1.mp4 [video2.mp4 ...] [--engines mog2,knn] [--reference mog2] [--cascade]
+"""
+import argparse
+import time
+
+import cv2
+import yaml
+
+from detection_engines import ENGINES, create_engine, downscale
+from zones import ZoneMasks, load_zones
+
+
+def replay(path, det_config, engine_names, stride=1, max_frames=None, cascade=False):
+    """Pasar cada frame del video por todos los motores.
+
+    Decodificación y reducción se hacen una vez por frame y se comparten.
+    Con cascade=True cada motor corre también detrás del prefiltro en cascada.
+    Devuelve (frames, tiempos_comunes, {motor: {etapas..., motion: [bool]}}).
+    """
+    engines = {}
+    for name in engine_names:
+        engines[name] = create_engine(det_config, name, cascade=False)
+        if cascade:
+            engine = create_engine(det_config, name, cascade=True)
+            engines[engine.name] = engine
+    min_area = det_config.get("min_area", 5000)
+    zone_list = load_zones(det_config)
+    zones = ZoneMasks(zone_list) if zone_list else None
+    results = {name: {"prefilter_ms": 0.0, "subtract_ms": 0.0, "morphology_ms": 0.0, "contours_ms": 0.0,
+                      "prefiltered": 0, "motion": []}
+               for name in engines}
+    common = {"decode_ms": 0.0, "resize_ms": 0.0}
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"❌ No se pudo abrir {path}")
+        return 0, common, results
+
+    frames = 0
+    index = 0
+    while max_frames is None or frames < max_frames:
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        t1 = time.perf_counter()
+        if not ret:
+            break
+        index += 1
+        if (index - 1) % stride:
+            continue  # Misma cadencia que process_every_n_frames
+        common["decode_ms"] += (t1 - t0) * 1000
+
+        small, _ = downscale(frame)
+        common["resize_ms"] += (time.perf_counter() - t1) * 1000
+
+        for name, engine in engines.items():
+            fgmask, boxes, _ = engine.detect(small, min_area, zones)
+            for stage, ms in engine.timings.items():
+                results[name][stage] += ms
+            if fgmask is None:
+                results[name]["prefiltered"] += 1
+            results[name]["motion"].append(len(boxes) > 0)
+        frames += 1
+
+    cap.release()
+    return frames, common, results
+
+
+def agreement(motion, reference):
+    """Acuerdo frame a frame y recall respecto a los frames con movimiento de la referencia"""
+    same = sum(1 for a, b in zip(motion, reference) if a == b)
+    ref_hits = sum(reference)
+    caught = sum(1 for a, b in zip(motion, reference) if a and b)
+    return (same / len(reference) * 100 if reference else 0.0,
+            caught / ref_hits * 100 if ref_hits else None)
+
+
+def print_report(path, frames, common, results, reference):
+    print(f"\n=== {path} ({frames} frames) ===")
+    if not frames:
+        return
+    print(f"Decodificación: {common['decode_ms'] / frames:.2f} ms/frame | "
+          f"Reducción: {common['resize_ms'] / frames:.2f} ms/frame")
+    print(f"{'Motor':<20} {'FPS':>8} {'Prefilt.':>8} {'Resta':>8} {'Morfol.':>8} {'Contorn.':>8} "
+          f"{'Descart.%':>9} {'Mov.%':>7} {'Acuerdo%':>9} {'Recall%':>8}")
+
+    ref_motion = results[reference]["motion"] if reference in results else []
+    for name, r in results.items():
+        total_ms = r["prefilter_ms"] + r["subtract_ms"] + r["morphology_ms"] + r["contours_ms"]
+        fps = frames / (total_ms / 1000) if total_ms else 0.0
+        motion_pct = sum(r["motion"]) / frames * 100
+        same, recall = agreement(r["motion"], ref_motion) if ref_motion else (0.0, None)
+        print(f"{name:<20} {fps:>8.1f} {r['prefilter_ms'] / frames:>8.2f} {r['subtract_ms'] / frames:>8.2f} "
+              f"{r['morphology_ms'] / frames:>8.2f} {r['contours_ms'] / frames:>8.2f} "
+              f"{r['prefiltered'] / frames * 100:>9.1f} {motion_pct:>7.1f} {same:>9.1f} "
+              f"{'-' if recall is None else f'{recall:.1f}':>8}")
+    print("(tiempos en ms/frame; FPS solo de detección; acuerdo y recall contra "
+          f"'{reference}')")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de motores de detección de movimiento")
+    parser.add_argument("videos", nargs="+", help="Archivos de video grabados")
+    parser.add_argument("--engines", default=",".join(ENGINES),
+                        help=f"Motores separados por coma ({', '.join(ENGINES)})")
+    parser.add_argument("--reference", default="mog2", help="Motor contra el que se mide el acuerdo")
+    parser.add_argument("--config", default="config.yaml", help="Configuración (usa la sección detection:)")
+    parser.add_argument("--stride", type=int, default=None,
+                        help="Procesar 1 de cada N frames (por defecto process_every_n_frames + 1)")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--cascade", action="store_true",
+                        help="Medir también cada motor detrás del prefiltro en cascada")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = yaml.safe_load(f)
+    det_config = config.get("detection", {})
+
+    engine_names = [name.strip() for name in args.engines.split(",") if name.strip()]
+    unknown = [name for name in engine_names if name not in ENGINES]
+    if unknown:
+        parser.error(f"motores desconocidos: {', '.join(unknown)}")
+    if args.reference not in engine_names:
+        engine_names.insert(0, args.reference)
+
+    stride = args.stride or det_config.get("process_every_n_frames", 2) + 1
+    print(f"Motores: {', '.join(engine_names)} | 1 de cada {stride} frames | "
+          f"área mínima {det_config.get('min_area', 5000)}px")
+
+    for path in args.videos:
+        frames, common, results = replay(path, det_config, engine_names, stride, args.max_frames, args.cascade)
+        print_report(path, frames, common, results, args.reference)
+
+
+if __name__ == "__main__":
+    main()
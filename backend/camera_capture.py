@@ -0,0 +1,161 @@
+import cv2
+import os
+import time
+import threading
+
+
+class CameraCapture:
+    """Etapa de captura de una cámara: escribe cada frame decodificado en el FrameRing.
+
+    No hace nada más que leer del stream, así que el buffer RTSP nunca se
+    llena aunque la detección (que corre en otro proceso) vaya lenta.
+    """
+
+    def __init__(self, rtsp_url: str, frame_ring, config: dict = None, capture_stride=None,
+                 active=None, label="stream"):
+        self.rtsp_url = rtsp_url
+        self.frame_ring = frame_ring
+        self.config = config or {}
+        self.capture_stride = capture_stride  # Valor compartido: publicar 1 de cada N frames
+        self.active = active  # Valor compartido: con 0 el stream se cierra y no se decodifica
+        self.label = label
+        self.running = True
+        self.stats = {"frames_captured": 0, "frames_skipped": 0}
+        self.thread = threading.Thread(target=self._capture_frames, daemon=True)
+        self.thread.start()
+
+    def _open_capture(self, buffer_size, fps):
+        cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+        cap.set(cv2.CAP_PROP_FPS, fps)
+        return cap
+
+    def _capture_frames(self):
+        """Etapa de captura: lee del stream lo más rápido posible y conserva solo el último frame.
+
+        No hace ningún procesamiento pesado, así el buffer RTSP nunca se llena
+        aunque la detección vaya lenta. Si la fuente es un archivo de video
+        (pruebas sin cámara) se reproduce a `fps` y vuelve a empezar al terminar.
+        """
+        cam_config = self.config.get("camera", {})
+
+        # Parámetros de cámara
+        buffer_size = cam_config.get("buffer_size", 1)
+        fps = cam_config.get("fps", 10)
+        reconnect_delay = cam_config.get("reconnect_delay", 2)
+        max_reconnect_attempts = cam_config.get("max_reconnect_attempts", 5)
+        transport = cam_config.get("transport", "tcp")
+
+        # Archivo local en lugar de cámara: simular tiempo real
+        is_file = os.path.isfile(self.rtsp_url)
+        loop_file = cam_config.get("loop", True)
+        frame_delay = 1.0 / fps
+        next_frame_time = time.time()
+
+        # Configurar transporte RTSP (TCP más estable que UDP)
+        if transport == "tcp":
+            os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|rtsp_flags;prefer_tcp"
+
+        cap = None
+        if self.active is None or self.active.value:
+            cap = self._open_capture(buffer_size, fps)
+
+            if not cap.isOpened():
+                print(f"❌ Error: No se pudo abrir el stream de la cámara ({self.rtsp_url}).")
+                self.running = False
+                self.frame_ring.close()
+                return
+
+        reconnect_attempts = 0
+        frame_index = 0
+
+        while self.running:
+            # Stream a demanda: mientras no se necesita no se decodifica nada
+            if self.active is not None and not self.active.value:
+                if cap is not None:
+                    cap.release()
+                    cap = None
+                    print(f"⏸️ Stream {self.label} en pausa")
+                time.sleep(0.5)
+                continue
+            if cap is None:
+                print(f"▶️ Abriendo stream {self.label}")
+                cap = self._open_capture(buffer_size, fps)
+                next_frame_time = time.time()
+
+            if is_file:
+                next_frame_time += frame_delay
+                delay = next_frame_time - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_time = time.time()
+
+            # Con CPU alto se saltean frames: grab() sin convertir ni copiar al ring
+            frame_index += 1
+            stride = self.capture_stride.value if self.capture_stride is not None else 1
+            skip = stride > 1 and frame_index % stride != 0
+
+            if skip:
+                slot, frame = None, None
+                ret = cap.grab()
+            else:
+                # Decodificar directo en un slot libre del ring (sin copias)
+                slot, target = self.frame_ring.begin_write()
+                if target is not None:
+                    ret, frame = cap.read(target)
+                else:
+                    ret, frame = cap.read()
+
+            if not ret:
+                self.frame_ring.cancel_write(slot)
+
+                if is_file:
+                    if not loop_file:
+                        print(f"📼 Fin del archivo {self.rtsp_url}")
+                        break
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+
+                reconnect_attempts += 1
+                if reconnect_attempts >= max_reconnect_attempts:
+                    print(f"⚠️ Stream perdido ({reconnect_attempts} intentos). Esperando {reconnect_delay * 5}s...")
+                    time.sleep(reconnect_delay * 5)
+                    reconnect_attempts = 0
+                else:
+                    print("⚠️ Stream perdido. Reintentando...")
+                    time.sleep(reconnect_delay)
+
+                cap.release()
+                cap = self._open_capture(buffer_size, fps)
+                continue
+
+            reconnect_attempts = 0
+            if skip:
+                self.stats["frames_skipped"] += 1
+                continue
+
+            # Publicar el frame; la detección solo toma el más reciente
+            if self.frame_ring.commit_write(slot, frame) is not None:
+                self.stats["frames_captured"] += 1
+
+        if cap is not None:
+            cap.release()
+        self.running = False
+
+    def get_stats(self):
+        """Estadísticas de la captura"""
+        stats = dict(self.stats)
+        stats["active"] = self.active is None or bool(self.active.value)
+        stats["frame_age_ms"] = None
+        ref = self.frame_ring.latest()
+        if ref is not None:
+            with ref:
+                stats["frame_age_ms"] = round((time.time() - ref.timestamp) * 1000, 1)
+        stats["ring"] = self.frame_ring.get_stats()
+        return stats
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
@@ -0,0 +1,532 @@
+import multiprocessing as mp
+import queue
+import signal
+import threading
+import time
+from multiprocessing import resource_tracker
+
+from detection_results import ResultRing
+from encoded_buffer import EncodedFrameBuffer
+from event_recorder import EventRecorder
+from frame_ring import FrameRing
+from stream_broadcaster import FrameBroadcaster
+from video_recorder import VideoRecorder
+from zones import ZoneMasks, load_zones
+
+
+def load_camera_configs(config: dict):
+    """Lista de cámaras a partir de `cameras:`.
+
+    Cada entrada hereda los valores de `camera:`, `detection:` y `recording:`
+    y puede sobreescribirlos. Si no hay lista `cameras:` se usa `camera:` como única
+    cámara. Devuelve [(cam_id, nombre, config_de_la_cámara)].
+    """
+    base_camera = config.get("camera", {})
+    base_detection = config.get("detection", {})
+    base_recording = config.get("recording") or {}
+    cameras = config.get("cameras") or [dict(id="cam1", name="CAM-01")]
+
+    result = []
+    for i, cam in enumerate(cameras):
+        if not cam.get("enabled", True):
+            continue
+        cam_id = str(cam.get("id", f"cam{i + 1}"))
+        camera_section = dict(base_camera)
+        camera_section.update({k: v for k, v in cam.items() if k not in ("detection", "recording")})
+        cam_config = {
+            "camera": camera_section,
+            "detection": dict(base_detection, **(cam.get("detection") or {})),
+            "recording": dict(base_recording, **(cam.get("recording") or {})),
+        }
+        result.append((cam_id, cam.get("name", cam_id), cam_config))
+    return result
+
+
+ANNOTATED_SLOTS = 4  # El frame anotado solo se usa para la vista de detección
+
+
+def stream_urls(cam_config):
+    """(detection_url, recording_url) de la cámara; recording_url es None con un solo stream.
+
+    Sin `detection_url` se usa `rtsp_url`. Si `recording_url` falta o es el
+    mismo stream, el ring de detección también es el buffer pre-evento.
+    """
+    camera = cam_config.get("camera", {})
+    detection_url = camera.get("detection_url") or camera.get("rtsp_url")
+    recording_url = camera.get("recording_url")
+    if not recording_url or recording_url == detection_url:
+        return detection_url, None
+    return detection_url, recording_url
+
+
+FALLBACK_SECONDS = 5  # Con dos streams, lo que guarda el sub-stream para clips de respaldo
+
+
+def pre_event_seconds(cam_config):
+    return cam_config.get("recording", {}).get("max_buffer_seconds", VideoRecorder.MAX_BUFFER_SECONDS)
+
+
+def jpeg_pre_event(cam_config):
+    """Con recording.format: "jpeg" el pre-evento se guarda comprimido (EncodedFrameBuffer)"""
+    return cam_config.get("recording", {}).get("format", "raw") == "jpeg"
+
+
+def ring_slots(cam_config, pre_event=True):
+    """Slots del ring: el buffer pre-evento del grabador (si lo es) más holgura para lectores"""
+    fps = cam_config.get("camera", {}).get("fps", 10)
+    seconds = pre_event_seconds(cam_config) if pre_event else FALLBACK_SECONDS
+    return fps * seconds + FrameRing.EXTRA_SLOTS
+
+
+def pre_event_ring_slots(cam_config):
+    """Ring crudo que alimenta el pre-evento: con formato jpeg alcanza con uno corto"""
+    return ring_slots(cam_config, pre_event=not jpeg_pre_event(cam_config))
+
+
+def detection_ring_slots(cam_config):
+    """Con dos streams el ring de detección no es el pre-evento: solo un respaldo corto"""
+    if stream_urls(cam_config)[1] is None:
+        return pre_event_ring_slots(cam_config)
+    return ring_slots(cam_config, pre_event=False)
+
+
+def buffer_budget_mb(cam_config):
+    """Presupuesto de memoria del buffer pre-evento (None = sin límite)"""
+    return cam_config.get("recording", {}).get("buffer_mb")
+
+
+def ring_budget_mb(cam_config):
+    """Presupuesto del ring crudo pre-evento (con formato jpeg lo aplica el buffer comprimido)"""
+    return None if jpeg_pre_event(cam_config) else buffer_budget_mb(cam_config)
+
+
+def _capture_process(cam_id, cam_config, frame_cond, recording_cond, capture_stride, armed,
+                     events, stop_event, stats_interval, seq_bases):
+    """Proceso de captura de una cámara: decodifica y escribe en los FrameRing compartidos.
+
+    El stream de detección (sub-stream de baja resolución) se decodifica
+    siempre. Si la cámara tiene `recording_url`, el stream principal va a
+    su propio ring pre-evento y solo se decodifica con la alarma armada
+    (o siempre, con recording_decode: "always").
+
+    `seq_bases` son las últimas secuencias que vieron los lectores de cada
+    ring, para que un proceso relanzado no vuelva a numerar desde 1.
+    """
+    # Ctrl+C lo maneja el proceso web, que nos detiene con stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from camera_capture import CameraCapture
+
+    detection_url, recording_url = stream_urls(cam_config)
+    ring = FrameRing(
+        detection_ring_slots(cam_config),
+        cond=frame_cond,
+        shared=True,
+        on_allocate=lambda name, shape, slots: events.put(("ring", cam_id, name, shape, slots)),
+        max_mb=None if recording_url else ring_budget_mb(cam_config),
+        seq_base=seq_bases["ring"]
+    )
+    capture = CameraCapture(detection_url, ring, config=cam_config,
+                            capture_stride=capture_stride, label="de detección")
+
+    recording_ring = recording_capture = None
+    if recording_url:
+        recording_ring = FrameRing(
+            pre_event_ring_slots(cam_config),
+            cond=recording_cond,
+            shared=True,
+            on_allocate=lambda name, shape, slots: events.put(("recording_ring", cam_id, name, shape, slots)),
+            max_mb=ring_budget_mb(cam_config),
+            seq_base=seq_bases["recording_ring"]
+        )
+        always = cam_config["camera"].get("recording_decode", "armed") == "always"
+        recording_capture = CameraCapture(recording_url, recording_ring, config=cam_config,
+                                          capture_stride=capture_stride,
+                                          active=None if always else armed, label="principal")
+    try:
+        # Sin stop_event.wait(): si el proceso muere esperando en el Event, el
+        # set() del watchdog se queda esperando que este proceso lo "despierte"
+        next_stats = time.time() + stats_interval
+        while not stop_event.is_set():
+            time.sleep(0.5)
+            if time.time() < next_stats:
+                continue
+            stats = capture.get_stats()
+            if recording_capture is not None:
+                stats["recording"] = recording_capture.get_stats()
+            events.put(("stats", cam_id, "capture", stats))
+            next_stats = time.time() + stats_interval
+            if not capture.running:
+                break
+    finally:
+        capture.stop()
+        ring.destroy()
+        if recording_capture is not None:
+            recording_capture.stop()
+            recording_ring.destroy()
+
+
+def _detection_process(cam_id, cam_config, frame_cond, ring_updates, result_name, result_cond,
+                       annotated_cond, armed, capture_stride, events, stop_event, stats_interval,
+                       seq_bases):
+    """Proceso de detección de una cámara.
+
+    Lee los frames del ring que escribe el proceso de captura y devuelve los
+    resultados (ResultRing) y los frames anotados (otro FrameRing) también
+    por memoria compartida: los píxeles nunca pasan por pickle.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from adaptive_rate import AdaptiveRate
+    from motion_detector import MotionDetector
+
+    frame_ring = FrameRing(detection_ring_slots(cam_config), cond=frame_cond)
+    results = ResultRing(result_cond, name=result_name)
+    annotated_ring = FrameRing(
+        ANNOTATED_SLOTS,
+        cond=annotated_cond,
+        shared=True,
+        on_allocate=lambda name, shape, slots: events.put(("annotated_ring", cam_id, name, shape, slots)),
+        seq_base=seq_bases["annotated_ring"]
+    )
+    rate = AdaptiveRate(
+        cam_config.get("detection", {}),
+        cam_config.get("camera", {}).get("fps", 10),
+        armed=armed,
+        capture_stride=capture_stride
+    )
+    detector = MotionDetector(
+        frame_ring,
+        config=cam_config,
+        on_result=lambda result: results.write(result["seq"], result["timestamp"], result["boxes"], result["zone"]),
+        annotated_ring=annotated_ring,
+        rate=rate
+    )
+    try:
+        next_stats = time.time() + stats_interval
+        while not stop_event.is_set():
+            # El proceso web nos avisa cada vez que la captura (re)crea su ring
+            try:
+                name, shape, slots = ring_updates.get(timeout=0.5)
+                frame_ring.attach(name, shape, slots)
+            except queue.Empty:
+                pass
+            if time.time() >= next_stats:
+                events.put(("stats", cam_id, "detection", detector.get_stats()))
+                next_stats = time.time() + stats_interval
+    finally:
+        detector.stop()
+        annotated_ring.destroy()
+        frame_ring.destroy()
+        results.close()
+
+
+class _AnnotatedSource:
+    """Adaptador para transmitir los frames anotados del proceso de detección"""
+
+    def __init__(self, frame_ring):
+        self.frame_ring = frame_ring
+
+    def get_motion_boxes(self):
+        return []  # Ya vienen dibujados
+
+
+class Camera:
+    """Una cámara vista desde el proceso web.
+
+    Cada cámara tiene dos procesos hijos: captura y detección. Desde acá se
+    leen los frames del ring compartido, los resultados de detección y los
+    frames anotados, todo por memoria compartida. Tiene su propio grabador y
+    sus broadcasters para /video_feed/<cam_id>. Con recording.format: "jpeg"
+    el pre-evento lo guarda un EncodedFrameBuffer de este proceso.
+    """
+
+    def __init__(self, cam_id, name, config, ctx, armed=None):
+        self.cam_id = cam_id
+        self.name = name
+        self.config = config
+        self.ctx = ctx
+        self.lock = threading.Lock()
+        self.motion_boxes = []
+        self.capture_stats = {}
+        self.detection_stats = {}
+        self.capture_process = None
+        self.detection_process = None
+        self.stop_event = None
+        self.ring_info = None
+        self.restarts = 0
+        self.on_result = None
+        self.running = True
+
+        fps = config.get("camera", {}).get("fps", 10)
+        # Con dos streams el buffer pre-evento es el ring del stream principal
+        self.dual_stream = stream_urls(config)[1] is not None
+        budget = ring_budget_mb(config)
+        self.frame_ring = FrameRing(detection_ring_slots(config), cond=ctx.Condition(),
+                                    max_mb=None if self.dual_stream else budget)
+        self.recording_ring = FrameRing(pre_event_ring_slots(config), cond=ctx.Condition(),
+                                        max_mb=budget) if self.dual_stream else None
+        self.annotated_ring = FrameRing(ANNOTATED_SLOTS, cond=ctx.Condition())
+        self.results = ResultRing(ctx.Condition())
+        self.ring_updates = ctx.Queue()
+        self.zones = ZoneMasks(load_zones(config.get("detection", {})))  # Solo para los nombres
+        # Sin lock: un solo proceso escribe cada valor
+        self.armed = armed if armed is not None else ctx.Value("b", 0, lock=False)
+        self.capture_stride = ctx.Value("i", 1, lock=False)
+        max_buffer_seconds = pre_event_seconds(config)
+        encoder_config = config.get("recording", {})
+        if self.dual_stream:
+            self.video_recorder = VideoRecorder(self.recording_ring, fps=fps, fallback_ring=self.frame_ring,
+                                                max_buffer_seconds=max_buffer_seconds,
+                                                encoder_config=encoder_config)
+        else:
+            self.video_recorder = VideoRecorder(self.frame_ring, fps=fps, max_buffer_seconds=max_buffer_seconds,
+                                                encoder_config=encoder_config)
+        self.event_recorder = EventRecorder(self.video_recorder, config.get("recording", {}), name=cam_id)
+        self.encoded_buffer = None
+        self.broadcaster = None
+        self.detection_broadcaster = None
+        self.results_thread = None
+
+    def start(self, events, stats_interval):
+        """Lanzar (o relanzar) los procesos de captura y detección"""
+        self.stop_event = self.ctx.Event()
+        seq_bases = {
+            "ring": self.frame_ring.latest_seq,
+            "recording_ring": self.recording_ring.latest_seq if self.recording_ring is not None else 0,
+            "annotated_ring": self.annotated_ring.latest_seq,
+        }
+        self.capture_process = self.ctx.Process(
+            target=_capture_process,
+            args=(self.cam_id, self.config, self.frame_ring.cond, self._recording_cond(),
+                  self.capture_stride, self.armed, events, self.stop_event, stats_interval, seq_bases),
+            name=f"captura-{self.cam_id}",
+            daemon=True
+        )
+        self.detection_process = self.ctx.Process(
+            target=_detection_process,
+            args=(self.cam_id, self.config, self.frame_ring.cond, self.ring_updates, self.results.name,
+                  self.results.cond, self.annotated_ring.cond, self.armed, self.capture_stride, events,
+                  self.stop_event, stats_interval, seq_bases),
+            name=f"deteccion-{self.cam_id}",
+            daemon=True
+        )
+        self.capture_process.start()
+        self.detection_process.start()
+        print(f"📷 Cámara {self.name} ({self.cam_id}): captura pid {self.capture_process.pid}, "
+              f"detección pid {self.detection_process.pid}")
+
+    def _recording_cond(self):
+        return self.recording_ring.cond if self.recording_ring is not None else None
+
+    def start_consumers(self, streaming_config, on_result):
+        """Threads de este proceso: resultados de detección y streaming"""
+        self.on_result = on_result
+        if jpeg_pre_event(self.config):
+            recording = self.config.get("recording", {})
+            self.encoded_buffer = EncodedFrameBuffer(
+                self.recording_ring if self.dual_stream else self.frame_ring,
+                max_seconds=pre_event_seconds(self.config),
+                max_mb=buffer_budget_mb(self.config),
+                jpeg_quality=recording.get("jpeg_quality", 70),
+                max_width=recording.get("jpeg_max_width", 0)
+            )
+            self.video_recorder.encoded_buffer = self.encoded_buffer
+        self.broadcaster = FrameBroadcaster(self, streaming_config, encoded_buffer=self.encoded_buffer)
+        self.detection_broadcaster = FrameBroadcaster(_AnnotatedSource(self.annotated_ring), streaming_config)
+        self.results_thread = threading.Thread(target=self._results_loop, daemon=True)
+        self.results_thread.start()
+
+    def _results_loop(self):
+        """Consumir los resultados que el proceso de detección deja en memoria compartida"""
+        counter = 0
+        while self.running:
+            counter, results = self.results.wait_newer(counter)
+            for result in results:
+                result["zone"] = self.zones.name(result["zone"])
+                if result["motion"]:
+                    self.event_recorder.notify_motion(result["timestamp"])
+                with self.lock:
+                    self.motion_boxes = result["boxes"]
+                if self.on_result:
+                    try:
+                        self.on_result(self, result)
+                    except Exception as e:
+                        print(f"❌ Error procesando detección de {self.name}: {e}")
+
+    def attach_ring(self, name, shape, slots):
+        """La captura (re)creó su ring: abrirlo acá y avisarle al proceso de detección"""
+        self.ring_info = (name, shape, slots)
+        self.frame_ring.attach(name, shape, slots, unlink_previous=True)
+        self.ring_updates.put(self.ring_info)
+
+    def restart(self, events, stats_interval):
+        """Relanzar ambos procesos (comparten locks y colas, uno caído pudo dejarlos tomados)"""
+        self.stop_event.set()
+        for process in (self.capture_process, self.detection_process):
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.restarts += 1
+        # Cola nueva: la vieja pudo quedar con su lock tomado y con avisos de rings
+        # que ya no existen (el nuevo proceso de captura manda el suyo)
+        self.ring_updates = self.ctx.Queue()
+        self.frame_ring.cond = self.ctx.Condition()
+        self.annotated_ring.cond = self.ctx.Condition()
+        if self.recording_ring is not None:
+            self.recording_ring.cond = self.ctx.Condition()
+        self.results.cond = self.ctx.Condition()
+        self.start(events, stats_interval)
+
+    def processes_alive(self):
+        return all(p is not None and p.is_alive() for p in (self.capture_process, self.detection_process))
+
+    def get_frame(self):
+        """Referencia de solo lectura (con su seq) al último frame, o None"""
+        return self.frame_ring.latest()
+
+    def get_motion_boxes(self):
+        with self.lock:
+            return list(self.motion_boxes)
+
+    def get_rate(self):
+        """Cadencia efectiva de captura y detección (la decide el proceso de detección)"""
+        rate = dict(self.detection_stats.get("rate", {}))
+        rate["frames_skipped"] = self.capture_stats.get("frames_skipped", 0)
+        return rate
+
+    def get_stats(self):
+        stats = dict(self.capture_stats)
+        stats.update(self.detection_stats)
+        stats["alive"] = self.processes_alive()
+        stats["restarts"] = self.restarts
+        stats["results_lost"] = self.results.lost
+        stats["recorder"] = self.video_recorder.get_stats()
+        stats["event_recorder"] = self.event_recorder.get_stats()
+        if self.broadcaster is not None:
+            stats["stream"] = self.broadcaster.get_stats()
+        return stats
+
+    def stop(self):
+        self.running = False
+        for broadcaster in (self.broadcaster, self.detection_broadcaster):
+            if broadcaster is not None:
+                broadcaster.stop()
+        if self.encoded_buffer is not None:
+            self.encoded_buffer.stop()
+        if self.stop_event is not None:
+            self.stop_event.set()
+        for process in (self.capture_process, self.detection_process):
+            if process is not None:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        if self.results_thread is not None and self.results_thread.is_alive():
+            self.results_thread.join(timeout=2)
+        self.frame_ring.destroy(unlink=True)
+        self.annotated_ring.destroy(unlink=True)
+        if self.recording_ring is not None:
+            self.recording_ring.destroy(unlink=True)
+        self.results.close()
+
+
+class CameraManager:
+    """Corre por cada cámara un proceso de captura y otro de detección.
+
+    Usa el contexto `fork` para que los hijos no vuelvan a ejecutar app.py.
+    Los frames, los resultados y los frames anotados viajan por memoria
+    compartida; por la cola de eventos solo pasan mensajes chicos (rings
+    nuevos y estadísticas). Un watchdog relanza las cámaras que se caen.
+    """
+
+    STATS_INTERVAL = 2     # Segundos entre envíos de estadísticas de cada proceso
+    WATCHDOG_INTERVAL = 5  # Segundos entre revisiones de procesos caídos
+
+    def __init__(self, config: dict, on_result=None, is_armed=None):
+        self.config = config
+        self.on_result = on_result
+        self.is_armed = is_armed or (lambda: False)
+        self.ctx = mp.get_context("fork")
+        self.events = self.ctx.Queue()
+        # Alarma armada: la detección pasa a cada frame (lo leen todas las cámaras)
+        self.armed = self.ctx.Value("b", int(bool(self.is_armed())), lock=False)
+        self.running = True
+
+        # Un solo resource tracker para todos los procesos (lo heredan al hacer fork)
+        resource_tracker.ensure_running()
+
+        self.cameras = {}
+        for cam_id, name, cam_config in load_camera_configs(config):
+            self.cameras[cam_id] = Camera(cam_id, name, cam_config, self.ctx, armed=self.armed)
+
+        # Primero los procesos (antes de crear threads en este proceso)
+        for camera in self.cameras.values():
+            camera.start(self.events, self.STATS_INTERVAL)
+
+        streaming_config = config.get("streaming", {})
+        for camera in self.cameras.values():
+            camera.start_consumers(streaming_config, on_result)
+
+        self.thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self.thread.start()
+
+    def _dispatch_loop(self):
+        """Recibir los mensajes de los procesos de cámara"""
+        last_watchdog = time.time()
+
+        while self.running:
+            try:
+                kind, cam_id, *payload = self.events.get(timeout=1.0)
+            except queue.Empty:
+                kind = None
+            except (EOFError, OSError):
+                break
+
+            self.armed.value = int(bool(self.is_armed()))
+
+            camera = self.cameras.get(cam_id) if kind else None
+            try:
+                if camera is None:
+                    pass
+                elif kind == "ring":
+                    camera.attach_ring(*payload)
+                elif kind == "recording_ring" and camera.recording_ring is not None:
+                    camera.recording_ring.attach(*payload, unlink_previous=True)
+                elif kind == "annotated_ring":
+                    camera.annotated_ring.attach(*payload, unlink_previous=True)
+                elif kind == "stats":
+                    source, stats = payload
+                    if source == "capture":
+                        camera.capture_stats = stats
+                    else:
+                        camera.detection_stats = stats
+            except Exception as e:
+                print(f"❌ Error procesando mensaje de {cam_id}: {e}")
+
+            if time.time() - last_watchdog > self.WATCHDOG_INTERVAL:
+                last_watchdog = time.time()
+                self._watchdog()
+
+    def _watchdog(self):
+        """Relanzar las cámaras con algún proceso caído"""
+        for camera in self.cameras.values():
+            if self.running and camera.capture_process is not None and not camera.processes_alive():
+                codes = (camera.capture_process.exitcode, camera.detection_process.exitcode)
+                print(f"⚠️ Procesos de {camera.name} terminaron (códigos {codes}). Relanzando...")
+                camera.restart(self.events, self.STATS_INTERVAL)
+
+    def get(self, cam_id=None):
+        """Cámara por id (o la primera si no se indica). None si no existe."""
+        if cam_id is None:
+            return next(iter(self.cameras.values()), None)
+        return self.cameras.get(cam_id)
+
+    def list(self):
+        return list(self.cameras.values())
+
+    def stop(self):
+        self.running = False
+        for camera in self.cameras.values():
+            camera.stop()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
@@ -0,0 +1,183 @@
+import cv2
+import math
+import shutil
+import subprocess
+
+from mp4_faststart import faststart
+
+
+TELEGRAM_LIMIT_MB = 50  # Telegram no acepta videos más grandes (sendVideo)
+
+
+def _even(value):
+    return max(2, int(value) // 2 * 2)  # Los codecs de video piden dimensiones pares
+
+
+def plan_clip(width, height, fps, max_seconds, target_mb, bits_per_pixel):
+    """Resolución y bitrate para que `max_seconds` de video entren en `target_mb`.
+
+    Con el bitrate que permite el tamaño objetivo se calcula cuántos píxeles
+    por segundo se pueden codificar con `bits_per_pixel` (calidad mínima del
+    codec) y se reduce la resolución, manteniendo el aspecto, solo si hace
+    falta. Devuelve (ancho, alto, bitrate_kbps).
+    """
+    bitrate = target_mb * 8 * 1024 * 1024 / max(1.0, max_seconds)
+    max_pixels = bitrate / (bits_per_pixel * max(1, fps))
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    return _even(width * scale), _even(height * scale), int(bitrate / 1000)
+
+
+class ClipWriter:
+    """Escritor de clips de una sola pasada: reduce cada frame al tamaño planeado y lo codifica.
+
+    Cada escritor concreto (OpenCV, ffmpeg) agrega `_write`, `isOpened` y
+    `release`, la misma interfaz que cv2.VideoWriter.
+    """
+
+    name = "base"
+    BITS_PER_PIXEL = 0.1
+
+    def __init__(self, path, fps, size, bitrate_kbps):
+        self.path = path
+        self.fps = fps
+        self.size = size  # (ancho, alto) de salida
+        self.bitrate_kbps = bitrate_kbps
+
+    def write(self, frame):
+        height, width = frame.shape[:2]
+        if (width, height) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        self._write(frame)
+
+
+class OpenCVClipWriter(ClipWriter):
+    """mp4v con cv2.VideoWriter: sin control de bitrate, el tamaño se ajusta con la resolución.
+
+    Al cerrar se mueve el moov al principio (fast start) para poder reproducir
+    y saltar en el navegador sin bajar el clip entero.
+    """
+
+    name = "opencv"
+    BITS_PER_PIXEL = 0.1  # Estimación conservadora de lo que ocupa mp4v por píxel
+
+    def __init__(self, path, fps, size, bitrate_kbps):
+        super().__init__(path, fps, size, bitrate_kbps)
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.out = cv2.VideoWriter(path, fourcc, fps, size)
+
+    def _write(self, frame):
+        self.out.write(frame)
+
+    def isOpened(self):
+        return self.out.isOpened()
+
+    def release(self):
+        opened = self.out.isOpened()
+        self.out.release()
+        if opened:
+            try:
+                faststart(self.path)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ No se pudo aplicar fast start a {self.path}: {e}")
+
+
+class FFmpegClipWriter(ClipWriter):
+    """H.264 con un proceso ffmpeg: bitrate real y MP4 listo para reproducir mientras descarga"""
+
+    name = "ffmpeg"
+    BITS_PER_PIXEL = 0.04  # H.264 necesita bastante menos que mp4v para la misma calidad
+    _probed = {}  # preset -> si ffmpeg codifica con él (se prueba una vez por proceso)
+
+    @classmethod
+    def available(cls, preset="veryfast"):
+        """ffmpeg instalado y capaz de codificar H.264 con `preset`: se codifica un frame de prueba.
+
+        Sin esto un ffmpeg sin libx264 o un preset inválido recién fallan en
+        el primer `write` (BrokenPipe) y se pierde el clip entero.
+        """
+        if preset not in cls._probed:
+            ok = False
+            ffmpeg = shutil.which("ffmpeg")
+            if ffmpeg:
+                try:
+                    probe = subprocess.run(
+                        [ffmpeg, "-loglevel", "error",
+                         "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", "64x64", "-i", "-",
+                         "-frames:v", "1", "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p",
+                         "-f", "null", "-"],
+                        input=bytes(64 * 64 * 3), capture_output=True, timeout=10
+                    )
+                    ok = probe.returncode == 0
+                    if not ok:
+                        error = probe.stderr.decode(errors="replace").strip()
+                        print(f"⚠️ ffmpeg no puede codificar H.264 (preset {preset}): {error}")
+                except (OSError, subprocess.TimeoutExpired) as e:
+                    print(f"⚠️ No se pudo probar ffmpeg: {e}")
+            cls._probed[preset] = ok
+        return cls._probed[preset]
+
+    def __init__(self, path, fps, size, bitrate_kbps, preset="veryfast"):
+        super().__init__(path, fps, size, bitrate_kbps)
+        width, height = size
+        self.process = subprocess.Popen(
+            [shutil.which("ffmpeg"), "-y", "-loglevel", "error",
+             "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+             "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p",
+             "-b:v", f"{bitrate_kbps}k", "-maxrate", f"{bitrate_kbps}k", "-bufsize", f"{bitrate_kbps * 2}k",
+             "-movflags", "+faststart", path],
+            stdin=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+
+    def _write(self, frame):
+        self.process.stdin.write(frame.tobytes())
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def release(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        if self.process.returncode:
+            error = self.process.stderr.read().decode(errors="replace").strip()
+            print(f"❌ ffmpeg terminó con código {self.process.returncode}: {error}")
+
+
+def open_clip_writer(path, fps, frame_size, max_seconds, rec_config: dict = None):
+    """Abrir un escritor planeado para que el clip más largo posible entre en el tamaño objetivo.
+
+    `recording.encoder`: "auto" (ffmpeg si está instalado), "ffmpeg" u
+    "opencv". Si ffmpeg no está o no codifica H.264 se usa OpenCV.
+    """
+    rec_config = rec_config or {}
+    encoder = rec_config.get("encoder", "auto")
+    preset = rec_config.get("ffmpeg_preset", "veryfast")
+    target_mb = min(rec_config.get("target_mb", 45), TELEGRAM_LIMIT_MB)
+    width, height = frame_size
+
+    backends = [OpenCVClipWriter]
+    if encoder in ("auto", "ffmpeg"):
+        if FFmpegClipWriter.available(preset):
+            backends.insert(0, FFmpegClipWriter)
+        elif encoder == "ffmpeg":
+            print("⚠️ ffmpeg no está instalado o no codifica H.264, se usa OpenCV para los clips")
+
+    for backend in backends:
+        out_width, out_height, bitrate_kbps = plan_clip(width, height, fps, max_seconds, target_mb,
+                                                        backend.BITS_PER_PIXEL)
+        if backend is FFmpegClipWriter:
+            writer = backend(path, fps, (out_width, out_height), bitrate_kbps, preset=preset)
+        else:
+            writer = backend(path, fps, (out_width, out_height), bitrate_kbps)
+        if writer.isOpened():
+            print(f"🎞️ Clip {backend.name}: {out_width}x{out_height} @ {fps} fps, {bitrate_kbps} kbps "
+                  f"(hasta {max_seconds:.0f}s en {target_mb} MB)")
+            return writer
+        writer.release()
+    return None
@@ -0,0 +1,203 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+from clip_thumbnails import poster_name, sprite_name
+from models import Clip
+
+
+class ClipStore:
+    """Clips de eventos en disco, indexados en la tabla `clips`.
+
+    Los clips se graban directamente en `recording.clips_dir` y quedan
+    disponibles por la API. Un solo thread (el janitor) borra los que
+    superan `clips_max_age_days` y, si el directorio pasa de `clips_max_mb`,
+    los menos vistos primero. Al iniciar se concilia el índice con los
+    archivos, así nada queda huérfano tras un reinicio.
+    """
+
+    def __init__(self, config: dict, session_maker):
+        rec_config = config.get("recording", {})
+        self.clips_dir = os.path.abspath(clips_dir(config))
+        self.max_bytes = int(rec_config.get("clips_max_mb", 2048) * 1024 * 1024)
+        self.max_age = timedelta(days=rec_config.get("clips_max_age_days", 7))
+        self.interval = rec_config.get("janitor_interval_seconds", 600)
+        self.SessionLocal = session_maker
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = True
+        self.stats = {"clips_evicted": 0, "bytes_evicted": 0, "last_run": None}
+
+        os.makedirs(self.clips_dir, exist_ok=True)
+        self._reconcile()
+
+        self.thread = threading.Thread(target=self._janitor_loop, daemon=True)
+        self.thread.start()
+        print(f"🗂️ Clips en {self.clips_dir} (máx. {rec_config.get('clips_max_mb', 2048)} MB, "
+              f"{self.max_age.days} días)")
+
+    def path(self, filename):
+        return os.path.join(self.clips_dir, filename)
+
+    def add(self, file_path, camera_id=None, event_id=None, duration=None):
+        """Indexar un clip recién grabado (si está fuera del directorio se mueve adentro)"""
+        filename = os.path.basename(file_path)
+        target = os.path.join(self.clips_dir, filename)
+        if os.path.abspath(file_path) != os.path.abspath(target):
+            os.replace(file_path, target)
+            # Poster y sprite viajan con el clip
+            source_dir = os.path.dirname(file_path)
+            for name in (poster_name(filename), sprite_name(filename)):
+                if os.path.exists(os.path.join(source_dir, name)):
+                    os.replace(os.path.join(source_dir, name), self.path(name))
+
+        db = self.SessionLocal()
+        try:
+            clip = Clip(event_id=event_id, camera_id=camera_id, filename=filename,
+                        duration=duration, size_bytes=os.path.getsize(target))
+            db.add(clip)
+            db.commit()
+            result = clip.to_dict()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.wakeup.set()  # Revisar la cuota ya, sin esperar al próximo ciclo
+        return result
+
+    def get(self, clip_id, touch=True):
+        """(clip, ruta) o (None, None). Marca el acceso para el desalojo por LRU."""
+        db = self.SessionLocal()
+        try:
+            clip = db.query(Clip).filter(Clip.id == clip_id).first()
+            if clip is None:
+                return None, None
+            if touch:
+                clip.last_access = datetime.utcnow()
+                db.commit()
+            return clip.to_dict(), self.path(clip.filename)
+        finally:
+            db.close()
+
+    def for_events(self, event_ids):
+        """{event_id: clip} de los eventos que tienen clip (una sola consulta)"""
+        if not event_ids:
+            return {}
+        db = self.SessionLocal()
+        try:
+            clips = db.query(Clip).filter(Clip.event_id.in_(list(event_ids))).all()
+            return {clip.event_id: clip.to_dict() for clip in clips}
+        finally:
+            db.close()
+
+    def list(self, camera_id=None, event_id=None, limit=50):
+        db = self.SessionLocal()
+        try:
+            query = db.query(Clip)
+            if camera_id:
+                query = query.filter(Clip.camera_id == camera_id)
+            if event_id:
+                query = query.filter(Clip.event_id == event_id)
+            return [clip.to_dict() for clip in query.order_by(Clip.created_at.desc()).limit(limit).all()]
+        finally:
+            db.close()
+
+    def get_stats(self):
+        db = self.SessionLocal()
+        try:
+            clips = db.query(Clip).count()
+            total = sum(size for (size,) in db.query(Clip.size_bytes).all())
+        finally:
+            db.close()
+        return dict(
+            self.stats,
+            clips=clips,
+            total_mb=round(total / (1024 * 1024), 1),
+            quota_mb=round(self.max_bytes / (1024 * 1024), 1),
+            max_age_days=self.max_age.days,
+        )
+
+    def _delete(self, db, clip):
+        try:
+            os.remove(self.path(clip.filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ No se pudo borrar {clip.filename}: {e}")
+            return
+        for name in (poster_name(clip.filename), sprite_name(clip.filename)):
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+        self.stats["clips_evicted"] += 1
+        self.stats["bytes_evicted"] += clip.size_bytes
+        db.delete(clip)
+
+    def _reconcile(self):
+        """Quitar del índice los clips sin archivo e indexar los archivos sin fila"""
+        db = self.SessionLocal()
+        try:
+            known = set()
+            for clip in db.query(Clip).all():
+                if os.path.exists(self.path(clip.filename)):
+                    known.add(clip.filename)
+                else:
+                    db.delete(clip)
+            for filename in os.listdir(self.clips_dir):
+                path = os.path.join(self.clips_dir, filename)
+                if filename in known or not filename.endswith(".mp4") or not os.path.isfile(path):
+                    continue
+                # Clip de una grabación que terminó sin indexarse (reinicio): motion_<cam>_<fecha>.mp4
+                parts = filename[:-4].split("_")
+                camera_id = "_".join(parts[1:-2]) if len(parts) > 3 else None
+                db.add(Clip(camera_id=camera_id, filename=filename, size_bytes=os.path.getsize(path),
+                            created_at=datetime.utcfromtimestamp(os.path.getmtime(path))))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Error conciliando clips: {e}")
+        finally:
+            db.close()
+
+    def enforce(self):
+        """Borrar los clips vencidos y, si se pasa la cuota, los menos vistos primero"""
+        with self.lock:
+            db = self.SessionLocal()
+            try:
+                cutoff = datetime.utcnow() - self.max_age
+                for clip in db.query(Clip).filter(Clip.created_at < cutoff).all():
+                    self._delete(db, clip)
+                db.flush()
+
+                total = sum(size for (size,) in db.query(Clip.size_bytes).all())
+                if total > self.max_bytes:
+                    for clip in db.query(Clip).order_by(Clip.last_access.asc()).all():
+                        if total <= self.max_bytes:
+                            break
+                        total -= clip.size_bytes
+                        self._delete(db, clip)
+                db.commit()
+                self.stats["last_run"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            except Exception as e:
+                db.rollback()
+                print(f"❌ Error limpiando clips: {e}")
+            finally:
+                db.close()
+
+    def _janitor_loop(self):
+        while self.running:
+            self.enforce()
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+
+def clips_dir(config: dict):
+    """Directorio de clips (`recording.clips_dir`)"""
+    return config.get("recording", {}).get("clips_dir", "clips")
@@ -0,0 +1,67 @@
+import cv2
+import os
+
+import numpy as np
+
+
+POSTER_WIDTH = 320      # Ancho del poster (imagen fija del evento)
+SPRITE_TILE_WIDTH = 160  # Ancho de cada cuadro del sprite
+SPRITE_FRAMES = 8        # Cuadros del sprite, repartidos a lo largo del clip
+JPEG_QUALITY = 70
+
+
+def poster_name(clip_filename):
+    return os.path.splitext(clip_filename)[0] + ".jpg"
+
+
+def sprite_name(clip_filename):
+    return os.path.splitext(clip_filename)[0] + "_sprite.jpg"
+
+
+def _resize(frame, width):
+    height, frame_width = frame.shape[:2]
+    if frame_width <= width:
+        return frame.copy()
+    return cv2.resize(frame, (width, int(height * width / frame_width)), interpolation=cv2.INTER_AREA)
+
+
+class ThumbnailCollector:
+    """Poster y sprite de un clip con los frames que el grabador ya tiene en memoria.
+
+    El poster es el primer frame desde el disparo; para el sprite se guarda
+    una miniatura por segundo y al cerrar el clip se eligen `SPRITE_FRAMES`
+    repartidas en el tiempo. El video nunca se vuelve a decodificar.
+    """
+
+    def __init__(self, trigger, interval=1.0):
+        self.trigger = trigger
+        self.interval = interval
+        self.poster = None
+        self.tiles = []
+        self.last_tile = None
+
+    def add(self, timestamp, frame):
+        if self.poster is None and timestamp >= self.trigger:
+            self.poster = _resize(frame, POSTER_WIDTH)
+        if self.last_tile is None or timestamp - self.last_tile >= self.interval:
+            self.last_tile = timestamp
+            self.tiles.append(_resize(frame, SPRITE_TILE_WIDTH))
+
+    def save(self, clip_path):
+        """Escribir poster y sprite junto al clip. Devuelve cuántos cuadros tiene el sprite."""
+        if not self.tiles:
+            return 0
+        directory, filename = os.path.split(clip_path)
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY]
+
+        poster = self.poster if self.poster is not None else _resize(self.tiles[len(self.tiles) // 2],
+                                                                     POSTER_WIDTH)
+        cv2.imwrite(os.path.join(directory, poster_name(filename)), poster, params)
+
+        count = min(SPRITE_FRAMES, len(self.tiles))
+        indexes = np.linspace(0, len(self.tiles) - 1, count).round().astype(int)
+        tiles = [self.tiles[i] for i in indexes]
+        height = min(tile.shape[0] for tile in tiles)
+        sprite = np.hstack([tile[:height] for tile in tiles])
+        cv2.imwrite(os.path.join(directory, sprite_name(filename)), sprite, params)
+        return count
@@ -5,7 +5,7 @@ import yaml
 with open("config.yaml", "r") as f:
     config = yaml.safe_load(f)
 
-SessionLocal = get_session_maker(config["database"]["path"])
+SessionLocal = get_session_maker(config["database"]["path"], config["database"])
 
 
 def create_user(username, password, name):
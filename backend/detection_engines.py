@@ -0,0 +1,270 @@
+import cv2
+import time
+
+import numpy as np
+
+
+DETECTION_WIDTH = 640  # La detección corre a este ancho como máximo
+
+
+def downscale(frame, max_width=DETECTION_WIDTH):
+    """Reducir el frame para detección. Devuelve (frame_chico, escala_para_volver)."""
+    height, width = frame.shape[:2]
+    if width <= max_width:
+        return frame, 1
+    small = cv2.resize(frame, (max_width, int(height * max_width / width)), interpolation=cv2.INTER_LINEAR)
+    return small, width / max_width
+
+
+def to_gray(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+
+class DetectionEngine:
+    """Motor de detección de movimiento: frame -> máscara -> rectángulos.
+
+    Los motores con background subtractor de OpenCV solo crean `self.fgbg`;
+    los de diferencia de frames reemplazan `_subtract` (la máscara de primer
+    plano). La limpieza morfológica, las zonas y la búsqueda de contornos son
+    comunes.
+    Los tiempos de cada etapa de la última llamada quedan en `timings` (ms).
+    """
+
+    name = None
+
+    def __init__(self, det_config: dict = None):
+        det_config = det_config or {}
+        self.sensitivity = det_config.get("sensitivity", 25)
+        self.detect_shadows = det_config.get("detect_shadows", False)
+        self.bg_history = det_config.get("background_history", 100)
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        self.timings = {"subtract_ms": 0.0, "morphology_ms": 0.0, "contours_ms": 0.0}
+        self.last_diff = None
+        self.fgbg = None  # Background subtractor de OpenCV (MOG2, KNN)
+
+    def _subtract(self, frame):
+        return self.fgbg.apply(frame)
+
+    def difference(self, frame):
+        """Diferencia de intensidad contra el fondo (para la sensibilidad por zona)"""
+        if self.fgbg is not None:
+            background = self.fgbg.getBackgroundImage()
+            if background is not None and background.shape[:2] == frame.shape[:2]:
+                return cv2.absdiff(to_gray(frame), to_gray(background))
+        if self.last_diff is None or self.last_diff.shape != frame.shape[:2]:
+            return np.zeros(frame.shape[:2], dtype=np.uint8)
+        return self.last_diff
+
+    def update_background(self, frame):
+        """Solo actualizar el modelo de fondo (sin morfología ni contornos)"""
+        self._subtract(frame)
+
+    def detect(self, frame, min_area, zones=None):
+        """Devuelve (máscara, [(x, y, w, h, área)], [zona de cada rectángulo]).
+
+        Con `zones` (ZoneMasks) la máscara se recorta con las zonas ya
+        rasterizadas antes de buscar contornos, y cada zona usa su propio
+        min_area y sensibilidad. La zona es -1 si no hay zonas `include`.
+        """
+        t0 = time.perf_counter()
+        fgmask = self._subtract(frame)
+        t1 = time.perf_counter()
+
+        # Aplicar filtros para reducir ruido
+        fgmask = cv2.morphologyEx(fgmask, cv2.MORPH_OPEN, self.kernel)
+        fgmask = cv2.morphologyEx(fgmask, cv2.MORPH_CLOSE, self.kernel)
+        t2 = time.perf_counter()
+
+        regions = zones.regions(fgmask.shape) if zones is not None else [(-1, None, None, None)]
+        diff = None
+        boxes = []
+        box_zones = []
+        for zone_index, zone_mask, zone_min_area, zone_sensitivity in regions:
+            zone_fg = fgmask if zone_mask is None else cv2.bitwise_and(fgmask, zone_mask)
+            if zone_sensitivity is not None:
+                if diff is None:
+                    diff = self.difference(frame)
+                _, sensitive = cv2.threshold(diff, zone_sensitivity, 255, cv2.THRESH_BINARY)
+                zone_fg = cv2.bitwise_and(zone_fg, sensitive)
+
+            area_limit = min_area if zone_min_area is None else zone_min_area
+            contours, _ = cv2.findContours(zone_fg, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for cnt in contours:
+                area = cv2.contourArea(cnt)
+                if area > area_limit:
+                    x, y, w, h = cv2.boundingRect(cnt)
+                    boxes.append((x, y, w, h, int(area)))
+                    box_zones.append(zone_index)
+        t3 = time.perf_counter()
+
+        self.timings["subtract_ms"] = (t1 - t0) * 1000
+        self.timings["morphology_ms"] = (t2 - t1) * 1000
+        self.timings["contours_ms"] = (t3 - t2) * 1000
+        return fgmask, boxes, box_zones
+
+
+class MOG2Engine(DetectionEngine):
+    """Background subtractor MOG2 (el motor original)"""
+
+    name = "mog2"
+
+    def __init__(self, det_config: dict = None):
+        super().__init__(det_config)
+        self.fgbg = cv2.createBackgroundSubtractorMOG2(
+            history=self.bg_history,
+            varThreshold=self.sensitivity,
+            detectShadows=self.detect_shadows
+        )
+
+
+class KNNEngine(DetectionEngine):
+    """Background subtractor KNN: más robusto a ruido, algo más caro que MOG2"""
+
+    name = "knn"
+
+    def __init__(self, det_config: dict = None):
+        super().__init__(det_config)
+        self.fgbg = cv2.createBackgroundSubtractorKNN(
+            history=self.bg_history,
+            dist2Threshold=(det_config or {}).get("knn_threshold", 400.0),
+            detectShadows=self.detect_shadows
+        )
+
+
+class FrameDiffEngine(DetectionEngine):
+    """Diferencia contra el frame anterior: el más barato, no detecta objetos quietos"""
+
+    name = "framediff"
+
+    def __init__(self, det_config: dict = None):
+        super().__init__(det_config)
+        self.previous = None
+
+    def _gray(self, frame):
+        return cv2.GaussianBlur(to_gray(frame), (5, 5), 0)
+
+    def _subtract(self, frame):
+        gray = self._gray(frame)
+        if self.previous is None or self.previous.shape != gray.shape:
+            self.previous = gray
+            return np.zeros_like(gray)
+        diff = cv2.absdiff(gray, self.previous)
+        self.previous = gray
+        self.last_diff = diff
+        _, fgmask = cv2.threshold(diff, self.sensitivity, 255, cv2.THRESH_BINARY)
+        return fgmask
+
+
+class RunningAverageEngine(FrameDiffEngine):
+    """Diferencia contra un promedio móvil del fondo (cv2.accumulateWeighted)"""
+
+    name = "running_avg"
+
+    def __init__(self, det_config: dict = None):
+        super().__init__(det_config)
+        self.alpha = (det_config or {}).get("running_average_alpha", 0.05)
+        self.background = None
+
+    def _subtract(self, frame):
+        gray = self._gray(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            return np.zeros_like(gray)
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, self.alpha)
+        self.last_diff = diff
+        _, fgmask = cv2.threshold(diff, self.sensitivity, 255, cv2.THRESH_BINARY)
+        return fgmask
+
+
+class CascadeEngine:
+    """Cascada: un prefiltro muy barato decide si vale la pena correr el motor completo.
+
+    El prefiltro compara el frame en escala de grises reducido a `width`
+    píxeles contra un promedio móvil. Si casi nada cambió el frame se
+    descarta (detect devuelve máscara None) y el fondo del motor se
+    actualiza solo cada `idle_update_every` frames. Cuando algo cambia, el
+    motor completo corre al menos `hold_frames` frames seguidos (y mientras
+    siga encontrando movimiento), así el recall es el mismo del motor solo.
+    """
+
+    def __init__(self, engine, det_config: dict = None):
+        cascade_config = (det_config or {}).get("cascade") or {}
+        self.engine = engine
+        self.name = f"{engine.name}+cascada"
+        self.width = cascade_config.get("width", 64)
+        self.threshold = cascade_config.get("threshold", 15)
+        self.alpha = cascade_config.get("alpha", 0.1)
+        self.hold_frames = cascade_config.get("hold_frames", 10)
+        self.idle_update_every = max(1, cascade_config.get("idle_update_every", 5))
+        self.reference = None
+        self.active_frames = 0
+        self.idle_frames = 0
+        self.timings = dict(engine.timings, prefilter_ms=0.0)
+
+    def _changed(self, frame, min_area, zones=None):
+        """¿Cambió algo del tamaño de `min_area` (proporcional) respecto al fondo?"""
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.width / width)
+        tiny = to_gray(cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                                  interpolation=cv2.INTER_AREA))
+
+        if self.reference is None or self.reference.shape != tiny.shape:
+            self.reference = tiny.astype(np.float32)
+            return True
+
+        diff = cv2.absdiff(tiny, cv2.convertScaleAbs(self.reference))
+        cv2.accumulateWeighted(tiny, self.reference, self.alpha)
+        _, changed = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        if zones is not None:
+            # Lo que pasa en zonas excluidas (árboles, calle) no despierta al motor
+            changed = cv2.bitwise_and(changed, zones.allowed(changed.shape))
+            min_area = zones.smallest_area(min_area)
+
+        # Un cuarto del área mínima (ya escalada) alcanza para despertar al motor
+        min_changed = max(1, min_area * scale * scale * 0.25)
+        return cv2.countNonZero(changed) >= min_changed
+
+    def detect(self, frame, min_area, zones=None):
+        t0 = time.perf_counter()
+        if self._changed(frame, min_area, zones):
+            self.active_frames = self.hold_frames
+        self.timings["prefilter_ms"] = (time.perf_counter() - t0) * 1000
+
+        if self.active_frames > 0:
+            self.active_frames -= 1
+            fgmask, boxes, box_zones = self.engine.detect(frame, min_area, zones)
+            self.timings.update(self.engine.timings)
+            if boxes:
+                self.active_frames = self.hold_frames
+            return fgmask, boxes, box_zones
+
+        # Escena quieta: el motor completo no corre
+        for stage in self.engine.timings:
+            self.timings[stage] = 0.0
+        self.idle_frames += 1
+        if self.idle_frames % self.idle_update_every == 0:
+            t1 = time.perf_counter()
+            self.engine.update_background(frame)
+            self.timings["subtract_ms"] = (time.perf_counter() - t1) * 1000
+        return None, [], []
+
+
+ENGINES = {engine.name: engine for engine in (MOG2Engine, KNNEngine, FrameDiffEngine, RunningAverageEngine)}
+
+
+def create_engine(det_config: dict = None, name: str = None, cascade: bool = None):
+    """Crear el motor indicado (o `detection.engine`, por defecto mog2).
+
+    Con cascade=None se usa `detection.cascade.enabled` (por defecto activo).
+    """
+    det_config = det_config or {}
+    name = name or det_config.get("engine", "mog2")
+    if name not in ENGINES:
+        print(f"⚠️ Motor de detección desconocido '{name}', usando mog2 ({', '.join(ENGINES)})")
+        name = "mog2"
+    engine = ENGINES[name](det_config)
+
+    if cascade is None:
+        cascade = (det_config.get("cascade") or {}).get("enabled", True)
+    return CascadeEngine(engine, det_config) if cascade else engine
@@ -0,0 +1,83 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class ResultRing:
+    """Resultados de detección en memoria compartida.
+
+    El proceso de detección escribe registros de tamaño fijo (seq, hora,
+    rectángulos) y el proceso web los lee sin que nada pase por pickle. Cada
+    escritura incrementa un contador; el lector recuerda el último que vio.
+    """
+
+    SLOTS = 64
+    MAX_BOXES = 16
+
+    RECORD = np.dtype([
+        ("seq", np.int64),
+        ("timestamp", np.float64),
+        ("count", np.int32),
+        ("zone", np.int32),  # Índice de la zona que disparó (-1 = sin zonas)
+        ("boxes", np.int32, (MAX_BOXES, 5)),  # x, y, w, h, area
+    ])
+
+    def __init__(self, cond, name=None):
+        """Sin `name` crea la memoria compartida; con `name` se conecta a una existente"""
+        self.cond = cond
+        size = 8 + self.SLOTS * self.RECORD.itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.counter = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.records = np.ndarray((self.SLOTS,), dtype=self.RECORD, buffer=self.shm.buf, offset=8)
+        self.lost = 0  # Resultados que el lector no alcanzó a leer
+
+    def write(self, seq, timestamp, boxes, zone=-1):
+        with self.cond:
+            n = int(self.counter[0])
+            record = self.records[n % self.SLOTS]
+            count = min(len(boxes), self.MAX_BOXES)
+            record["seq"] = seq
+            record["timestamp"] = timestamp
+            record["count"] = count
+            record["zone"] = zone
+            if count:
+                record["boxes"][:count] = boxes[:count]
+            self.counter[0] = n + 1
+            self.cond.notify_all()
+
+    def wait_newer(self, after, timeout=1.0):
+        """Esperar resultados nuevos. Devuelve (nuevo_contador, [resultados])."""
+        with self.cond:
+            self.cond.wait_for(lambda: int(self.counter[0]) > after, timeout=timeout)
+            n = int(self.counter[0])
+            if n - after > self.SLOTS:
+                self.lost += n - after - self.SLOTS
+                after = n - self.SLOTS
+            results = []
+            for i in range(after, n):
+                record = self.records[i % self.SLOTS]
+                count = int(record["count"])
+                boxes = [tuple(int(v) for v in box) for box in record["boxes"][:count]]
+                results.append({
+                    "seq": int(record["seq"]),
+                    "timestamp": float(record["timestamp"]),
+                    "motion": count > 0,
+                    "boxes": boxes,
+                    "zone": int(record["zone"]),
+                })
+            return n, results
+
+    def close(self):
+        self.counter = self.records = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
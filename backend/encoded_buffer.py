@@ -0,0 +1,144 @@
+import cv2
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class EncodedFrame:
+    """Frame del buffer comprimido. Se decodifica recién cuando se pide `frame`."""
+
+    __slots__ = ("seq", "timestamp", "jpeg", "_frame")
+
+    def __init__(self, seq, timestamp, jpeg):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.jpeg = jpeg
+        self._frame = None
+
+    @property
+    def frame(self):
+        if self._frame is None and self.jpeg is not None:
+            self._frame = cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return self._frame
+
+    def release(self):
+        self._frame = None  # Misma interfaz que FrameRef
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class EncodedFrameBuffer:
+    """Buffer pre-evento comprimido: guarda JPEGs en lugar de frames BGR.
+
+    Un thread codifica cada frame nuevo del ring crudo (que entonces alcanza
+    con que sea corto) y lo agrega a una cola acotada por segundos y por MB.
+    Un JPEG ocupa 10-50 veces menos que el frame crudo, así que entran 60+
+    segundos por cámara. Los perfiles de /video_feed con `source: pre_event`
+    transmiten estos mismos JPEGs sin volver a codificar.
+    """
+
+    def __init__(self, frame_ring, max_seconds=60, max_mb=None, jpeg_quality=70, max_width=0):
+        self.frame_ring = frame_ring
+        self.max_seconds = max_seconds
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self.jpeg_quality = jpeg_quality
+        self.max_width = max_width
+        self.frames = deque()
+        self.total_bytes = 0
+        self.cond = threading.Condition()
+        self.running = True
+        self.stats = {
+            "frames_encoded": 0,
+            "frames_missed": 0,   # Frames del ring que no se alcanzaron a codificar
+            "evicted_by_budget": 0,  # Frames descartados antes de tiempo por el presupuesto de MB
+            "encode_ms": 0.0,
+        }
+
+        self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self.thread.start()
+
+    def _encode_loop(self):
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality]
+        last_seq = 0
+
+        while self.running:
+            ref = self.frame_ring.wait_newer(last_seq)
+            if ref is None:
+                continue
+
+            start = time.time()
+            with ref:
+                if last_seq and ref.seq > last_seq + 1:
+                    self.stats["frames_missed"] += ref.seq - last_seq - 1
+                last_seq = ref.seq
+                timestamp = ref.timestamp
+                frame = ref.frame
+                height, width = frame.shape[:2]
+                if self.max_width and width > self.max_width:
+                    frame = cv2.resize(frame, (self.max_width, int(height * self.max_width / width)),
+                                       interpolation=cv2.INTER_AREA)
+                success, buffer = cv2.imencode(".jpg", frame, params)
+            if not success:
+                continue
+
+            item = EncodedFrame(last_seq, timestamp, buffer.tobytes())
+            with self.cond:
+                self.frames.append(item)
+                self.total_bytes += len(item.jpeg)
+                # Recortar por antigüedad y por presupuesto (O(1) por frame)
+                while self.frames and (self.frames[0].timestamp < timestamp - self.max_seconds
+                                       or (self.max_bytes and self.total_bytes > self.max_bytes)):
+                    old = self.frames.popleft()
+                    self.total_bytes -= len(old.jpeg)
+                    if old.timestamp >= timestamp - self.max_seconds:
+                        self.stats["evicted_by_budget"] += 1
+                self.stats["frames_encoded"] += 1
+                self.stats["encode_ms"] = round((time.time() - start) * 1000, 1)
+                self.cond.notify_all()
+
+    def wait_newer(self, after_seq, timeout=1.0, not_before=0):
+        """Esperar un JPEG con seq > after_seq. Devuelve el último EncodedFrame o None (como FrameRing).
+
+        Con `not_before` además se espera uno capturado desde ese momento
+        (los streams lo usan para limitar los FPS sin dormir).
+        """
+        def ready():
+            return self.frames and self.frames[-1].seq > after_seq and self.frames[-1].timestamp >= not_before
+
+        with self.cond:
+            self.cond.wait_for(lambda: not self.running or ready(), timeout=timeout)
+            if ready():
+                latest = self.frames[-1]
+                return EncodedFrame(latest.seq, latest.timestamp, latest.jpeg)
+            return None
+
+    def snapshot(self, since=None):
+        """Frames guardados (opcionalmente desde `since`), en orden"""
+        with self.cond:
+            return [EncodedFrame(f.seq, f.timestamp, f.jpeg) for f in self.frames
+                    if since is None or f.timestamp >= since]
+
+    def get_stats(self):
+        with self.cond:
+            seconds = self.frames[-1].timestamp - self.frames[0].timestamp if len(self.frames) > 1 else 0
+            return dict(
+                self.stats,
+                frames=len(self.frames),
+                memory_mb=round(self.total_bytes / (1024 * 1024), 1),
+                budget_mb=round(self.max_bytes / (1024 * 1024), 1) if self.max_bytes else None,
+                buffer_seconds=round(seconds, 1),
+                avg_frame_kb=round(self.total_bytes / len(self.frames) / 1024, 1) if self.frames else 0,
+            )
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
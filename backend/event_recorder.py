@@ -0,0 +1,246 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+
+from clip_thumbnails import ThumbnailCollector
+from encoded_buffer import EncodedFrame
+
+
+class EventRecorder:
+    """Grabación de un evento completo: pre-roll, lo que pasa después y post-roll.
+
+    Al dispararse escribe los últimos `pre_roll_seconds` del buffer
+    pre-evento y sigue agregando frames en vivo hasta que pasan
+    `post_roll_seconds` sin movimiento (o se llega a `max_clip_seconds`).
+
+    Un thread lector copia cada frame nuevo a una cola acotada y otro thread
+    lo escribe al archivo. Si el escritor se atrasa y la cola se llena se
+    descartan frames (el escritor repite el anterior para mantener el
+    tiempo real del clip); nunca se retienen slots del ring de la captura.
+    El pre-roll crudo se pasa a JPEG en memoria propia antes de escribirlo,
+    liberando cada slot apenas se codifica: con el ring recortado por
+    `buffer_mb` el pre-roll puede ocupar casi todos los slots y la captura
+    se quedaría sin lugar mientras el codificador avanza.
+    """
+
+    SPARE_SLOTS = 4  # Slots que el pre-roll deja libres a la captura mientras se codifica
+
+    def __init__(self, video_recorder, rec_config: dict = None, name="cam"):
+        rec_config = rec_config or {}
+        self.video_recorder = video_recorder
+        self.name = name
+        # El pre-roll no puede ser más largo que el buffer pre-evento
+        self.pre_roll = min(rec_config.get("pre_roll_seconds", 5), video_recorder.max_buffer_seconds)
+        self.post_roll = rec_config.get("post_roll_seconds", 5)
+        self.max_seconds = rec_config.get("max_clip_seconds", 60)
+        self.queue_frames = rec_config.get("writer_queue_frames", 100)
+        self.pre_roll_quality = rec_config.get("pre_roll_jpeg_quality", 90)
+        # Se graba directo en el almacén de clips (ClipStore lo indexa al terminar)
+        self.output_dir = rec_config.get("clips_dir", "clips")
+        self.lock = threading.Lock()
+        self.recording = False
+        self.last_motion = 0
+        self.stats = {
+            "clips": 0,
+            "frames_written": 0,
+            "frames_dropped": 0,  # Descartados por cola llena (escritor atrasado)
+            "queue_max": 0,
+            "last_clip_seconds": 0.0,
+        }
+
+    def notify_motion(self, timestamp=None):
+        """Hubo movimiento: extiende la grabación en curso"""
+        self.last_motion = max(self.last_motion, timestamp or time.time())
+
+    def record(self, post_roll=None):
+        """Grabar un evento. Bloquea hasta cerrar el clip y devuelve (ruta, segundos).
+
+        `post_roll` reemplaza a `post_roll_seconds` para esta grabación (un
+        incidente la mantiene abierta durante toda su ventana). Si ya hay una
+        grabación en curso devuelve (None, 0): esa grabación ya incluye esta
+        detección.
+        """
+        post_roll = self.post_roll if post_roll is None else post_roll
+        with self.lock:
+            if self.recording:
+                return None, 0
+            self.recording = True
+
+        try:
+            trigger = time.time()
+            self.notify_motion(trigger)
+            source, pre_roll = self.video_recorder.snapshot(self.pre_roll)
+            if source is None:
+                print("⚠️ No hay buffer de frames para grabar")
+                return None, 0
+            pre_roll = self._detach(source, pre_roll)
+
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            os.makedirs(self.output_dir, exist_ok=True)
+            output_path = os.path.join(self.output_dir, f"motion_{self.name}_{timestamp}.mp4")
+            fps = self.video_recorder.clip_fps(pre_roll)
+            print(f"🎥 Grabando evento de {self.name}: {len(pre_roll)} frames de pre-roll, "
+                  f"hasta {post_roll}s sin movimiento (máx. {self.max_seconds}s)")
+
+            frames = queue.Queue(maxsize=self.queue_frames)
+            result = {}
+            last_seq = pre_roll[-1].seq if pre_roll else 0
+            feeder = threading.Thread(target=self._feed_loop, args=(source, last_seq, trigger, post_roll, frames),
+                                      daemon=True)
+            thumbnails = ThumbnailCollector(trigger)
+            writer = threading.Thread(target=self._write_loop,
+                                      args=(output_path, fps, pre_roll, frames, thumbnails, result),
+                                      daemon=True)
+            feeder.start()
+            writer.start()
+            writer.join()
+            feeder.join()
+
+            if not result.get("frames") or not os.path.exists(output_path):
+                print("❌ El archivo de video no se creó correctamente")
+                return None, 0
+
+            thumbnails.save(output_path)
+            seconds = round(result["frames"] / fps, 1)
+            file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
+            self.stats["clips"] += 1
+            self.stats["last_clip_seconds"] = seconds
+            print(f"✅ Evento grabado: {output_path}")
+            print(f"📹 Frames: {result['frames']} ({seconds}s) | Tamaño: {file_size_mb:.2f} MB")
+            self.video_recorder.check_size(file_size_mb)
+            return output_path, seconds
+
+        except Exception as e:
+            print(f"❌ Error grabando evento: {e}")
+            return None, 0
+        finally:
+            with self.lock:
+                self.recording = False
+
+    def _detach(self, source, refs):
+        """Pasar el pre-roll crudo a JPEG propios, liberando cada slot apenas se codifica.
+
+        Codificar es más rápido que el tiempo real, así que se repite con los
+        frames que llegaron mientras tanto hasta alcanzar al último: el
+        lector en vivo sigue desde ahí sin hueco. Si el pre-roll ocupa el ring
+        entero se sueltan los frames más viejos hasta dejar `SPARE_SLOTS`
+        libres, así la captura tiene dónde escribir mientras tanto.
+        """
+        if all(isinstance(ref, EncodedFrame) for ref in refs):
+            return refs  # Buffer comprimido: ya no retiene nada del ring
+        excess = max(0, len(refs) - (source.num_slots - self.SPARE_SLOTS))
+        for ref in refs[:excess]:
+            ref.release()
+        refs = refs[excess:]
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.pre_roll_quality]
+        detached = []
+        try:
+            for _ in range(10):
+                for ref in refs:
+                    with ref:
+                        success, buffer = cv2.imencode(".jpg", ref.frame, params)
+                        if success:
+                            detached.append(EncodedFrame(ref.seq, ref.timestamp, buffer.tobytes()))
+                if not detached:
+                    break
+                last = detached[-1]
+                refs = []
+                for ref in source.snapshot(since=last.timestamp):
+                    if ref.seq > last.seq:
+                        refs.append(ref)
+                    else:
+                        ref.release()
+                if not refs:
+                    break
+        finally:
+            for ref in refs:
+                ref.release()
+        return detached
+
+    def _feed_loop(self, source, last_seq, trigger, post_roll, frames):
+        """Copiar los frames en vivo a la cola hasta que termina el evento"""
+        try:
+            while True:
+                now = time.time()
+                if now - self.last_motion > post_roll or now - trigger > self.max_seconds:
+                    break
+                ref = source.wait_newer(last_seq, timeout=0.5)
+                if ref is None:
+                    continue
+                with ref:
+                    last_seq = ref.seq
+                    # Los JPEG se decodifican recién al escribir; los frames crudos se copian
+                    # para liberar el slot del ring enseguida
+                    frame = ref if isinstance(ref, EncodedFrame) else ref.frame.copy()
+                    item = (ref.timestamp, frame)
+                try:
+                    frames.put_nowait(item)
+                except queue.Full:
+                    self.stats["frames_dropped"] += 1
+                self.stats["queue_max"] = max(self.stats["queue_max"], frames.qsize())
+        finally:
+            frames.put(None)
+
+    def _write_loop(self, output_path, fps, pre_roll, frames, thumbnails, result):
+        """Escribir el pre-roll y después lo que llegue por la cola, a tiempo real"""
+        out = None
+        size = None
+        start = None
+        written = 0
+        try:
+            def write(timestamp, frame):
+                nonlocal out, size, start, written
+                if out is None:
+                    size = frame.shape[:2]
+                    start = timestamp
+                    # Planeado para el clip más largo posible: se codifica una sola vez
+                    out = self.video_recorder.open_writer(output_path, fps, (size[1], size[0]),
+                                                          self.pre_roll + self.max_seconds)
+                    if out is None:
+                        raise RuntimeError("no se pudo crear el archivo de video")
+                if frame.shape[:2] != size:
+                    return
+                thumbnails.add(timestamp, frame)
+                # Repetir el frame si faltan (cola llena o captura más lenta); saltearlo si sobra
+                target = int(round((timestamp - start) * fps))
+                while written <= target:
+                    out.write(frame)
+                    written += 1
+
+            # Pre-roll directo desde el buffer, liberando cada slot apenas se escribe
+            for ref in pre_roll:
+                write(ref.timestamp, ref.frame)
+                ref.release()
+
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                timestamp, frame = item
+                write(timestamp, frame.frame if isinstance(frame, EncodedFrame) else frame)
+
+        except Exception as e:
+            print(f"❌ Error escribiendo evento: {e}")
+            # Vaciar la cola para que el lector no quede bloqueado al terminar
+            while frames.get() is not None:
+                pass
+        finally:
+            for ref in pre_roll:
+                ref.release()
+            if out is not None:
+                out.release()
+            self.stats["frames_written"] += written
+            result["frames"] = written
+
+    def get_stats(self):
+        return dict(
+            self.stats,
+            recording=self.recording,
+            pre_roll_seconds=self.pre_roll,
+            post_roll_seconds=self.post_roll,
+            max_clip_seconds=self.max_seconds,
+        )
@@ -0,0 +1,93 @@
+"""Búsqueda de texto en eventos con FTS5, o LIKE si SQLite no lo trae.
+
+La tabla `events_fts` la crea la migración 2 y la mantienen los triggers
+sobre `events`. En la búsqueda las palabras se buscan completas, salvo la
+última (se está escribiendo: `pat` encuentra "Patio") y las que terminan
+en `*`; lo que va entre comillas es una frase exacta. Sin tildes ni
+mayúsculas de por medio.
+
+Los prefijos se limitan a eso porque FTS5 junta todos los términos que
+empiezan igual: con años de detecciones un prefijo común es mucho más
+lento que una palabra completa, que se recorre de a poco.
+"""
+import html
+import re
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, func, literal_column, text
+
+from models import Event
+
+
+# Fuera de Base.metadata: create_all no debe intentar crearla como tabla común
+events_fts = Table("events_fts", MetaData(),
+                   Column("rowid", Integer), Column("event_type", Text), Column("info", Text))
+
+_FTS = literal_column("events_fts")
+_MARK_START, _MARK_END = "\x02", "\x03"  # Delimitadores del fragmento; se pasan a <mark> al escapar
+_available = {}  # url de la base -> tiene events_fts
+
+# La relevancia se calcula sobre las N coincidencias más recientes: BM25 tiene que puntuar
+# cada fila, y con una palabra que aparece en todos los eventos serían millones
+RANK_WINDOW = 2000
+
+
+def fts_available(db):
+    """La base tiene el índice FTS5 (se consulta una vez por proceso)"""
+    url = str(db.get_bind().url)
+    if url not in _available:
+        _available[url] = db.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events_fts'"
+        )).first() is not None
+    return _available[url]
+
+
+def match_expression(search):
+    """Texto del usuario -> consulta FTS5 (todas las palabras deben aparecer).
+
+    'movimiento "zona a" pat' -> '"movimiento" "zona a" "pat"*'. Cada término
+    va entre comillas, así ningún carácter del usuario se interpreta como
+    sintaxis de FTS5.
+    """
+    tokens = re.findall(r'"([^"]*)"|(\S+)', search or "")
+    terms = []
+    for index, (phrase, word) in enumerate(tokens):
+        if phrase and re.search(r"\w", phrase):
+            terms.append(f'"{phrase.strip()}"')
+        elif word and re.search(r"\w", word):
+            prefix = word.endswith("*") or index == len(tokens) - 1
+            terms.append(f'"{word.replace(chr(34), "").rstrip("*")}"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+def apply_fts(query, expression):
+    """Filtrar por la consulta FTS5 y sumar (rank, fragmento de `info`) a cada fila"""
+    return (query.join(events_fts, events_fts.c.rowid == Event.id)
+            .filter(_FTS.op("MATCH")(expression))
+            .add_columns(rank(), func.snippet(_FTS, 1, _MARK_START, _MARK_END, "…", 32)))
+
+
+def rank():
+    """Relevancia BM25 de la fila (menor es más relevante)"""
+    return func.bm25(_FTS)
+
+
+def rank_window(expression):
+    """Condición para rankear solo las RANK_WINDOW coincidencias más recientes (por rowid)"""
+    oldest = text(
+        "(SELECT rowid FROM events_fts WHERE events_fts MATCH :rank_match "
+        "ORDER BY rowid DESC LIMIT 1 OFFSET :rank_offset)"
+    ).bindparams(rank_match=expression, rank_offset=RANK_WINDOW - 1)
+    return events_fts.c.rowid >= func.coalesce(oldest, 0)
+
+
+def like_filter(search):
+    """Búsqueda sin FTS5: recorre toda la tabla"""
+    pattern = f"%{search}%"
+    return Event.event_type.like(pattern) | Event.info.like(pattern)
+
+
+def highlight(snippet):
+    """Fragmento escapado para HTML con los términos encontrados en <mark>"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
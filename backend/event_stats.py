@@ -0,0 +1,125 @@
+"""Estadísticas de eventos leídas de `event_rollups` en vez de contar `events`.
+
+Los triggers de la migración 3 suman cada evento a su hora y a su día, así
+que los conteos cuestan lo mismo con mil eventos que con millones. Los
+buckets están en UTC, igual que Event.timestamp.
+"""
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func, or_
+
+from models import Event, EventRollup
+
+
+MAX_BUCKETS = 5000  # Tope de puntos de una serie (≈ 7 meses por hora)
+
+
+def _utc(local_dt):
+    """Hora local (sin zona) -> UTC"""
+    return datetime.utcfromtimestamp(time.mktime(local_dt.timetuple()))
+
+
+def _ceil_hour(dt):
+    floor = dt.replace(minute=0, second=0, microsecond=0)
+    return floor if floor == dt else floor + timedelta(hours=1)
+
+
+def _partial_hour(db, start):
+    """Eventos entre `start` y la hora UTC siguiente (zonas con offset de :30 o :45).
+
+    Ese pedazo de hora no tiene bucket propio: se cuenta en `events` por el
+    índice de timestamp, a lo sumo una hora de filas.
+    """
+    end = _ceil_hour(start)
+    if end == start:
+        return 0
+    return db.query(func.count(Event.id)).filter(Event.timestamp >= start, Event.timestamp < end).scalar() or 0
+
+
+def summary(db, now=None):
+    """Hoy, semana, mes, total y por tipo en una sola lectura.
+
+    Los límites (medianoche, lunes, día 1) son de la hora local, pasados a
+    UTC; hoy/semana/mes salen de los buckets por hora que empiezan desde
+    ese límite y el total, de los buckets por día. Si el offset local no es
+    de horas enteras el límite cae a mitad de un bucket: ese bucket no se
+    usa (tiene eventos del día anterior) y sus minutos se cuentan en `events`.
+    """
+    today = (now or datetime.now()).date()
+    today_start = _utc(datetime.combine(today, datetime.min.time()))
+    week_start = _utc(datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time()))
+    month_start = _utc(datetime.combine(today.replace(day=1), datetime.min.time()))
+    since = _ceil_hour(min(week_start, month_start))
+
+    hourly = EventRollup.period == "hour"
+
+    def count_since(start):
+        return func.coalesce(func.sum(case((and_(hourly, EventRollup.bucket >= _ceil_hour(start)),
+                                            EventRollup.event_count), else_=0)), 0)
+
+    rows = db.query(
+        EventRollup.event_type,
+        count_since(today_start),
+        count_since(week_start),
+        count_since(month_start),
+        func.coalesce(func.sum(case((EventRollup.period == "day", EventRollup.event_count), else_=0)), 0),
+    ).filter(
+        or_(EventRollup.period == "day", and_(hourly, EventRollup.bucket >= since))
+    ).group_by(EventRollup.event_type).all()
+
+    return {
+        'today': sum(row[1] for row in rows) + _partial_hour(db, today_start),
+        'week': sum(row[2] for row in rows) + _partial_hour(db, week_start),
+        'month': sum(row[3] for row in rows) + _partial_hour(db, month_start),
+        'total': sum(row[4] for row in rows),
+        'by_type': [{'type': row[0], 'count': row[4]} for row in rows if row[4]],
+    }
+
+
+def _floor(dt, interval):
+    dt = dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0) if interval == "day" else dt
+
+
+def series(db, start, end, interval="hour", event_type=None):
+    """Histograma [start, end) por hora o por día, con los buckets vacíos en cero.
+
+    Devuelve (tipos, [{bucket, total, by_type}]). ValueError si el rango
+    pide más de MAX_BUCKETS puntos.
+    """
+    if interval not in ("hour", "day"):
+        raise ValueError("interval debe ser 'hour' o 'day'")
+    step = timedelta(hours=1) if interval == "hour" else timedelta(days=1)
+    start, end = _floor(start, interval), end
+    if end <= start:
+        raise ValueError("el rango está vacío")
+    if (end - start) / step > MAX_BUCKETS:
+        raise ValueError(f"rango demasiado grande para interval={interval} (máx. {MAX_BUCKETS} puntos)")
+
+    query = db.query(EventRollup.bucket, EventRollup.event_type, EventRollup.event_count).filter(
+        EventRollup.period == interval,
+        EventRollup.bucket >= start,
+        EventRollup.bucket < end,
+        EventRollup.event_count > 0,
+    )
+    if event_type and event_type != 'all':
+        query = query.filter(EventRollup.event_type == event_type)
+
+    counts = {}
+    types = set()
+    for bucket, kind, count in query.all():
+        counts.setdefault(bucket, {})[kind] = count
+        types.add(kind)
+
+    points = []
+    bucket = start
+    while bucket < end:
+        by_type = counts.get(bucket, {})
+        points.append({
+            'bucket': bucket.strftime('%Y-%m-%d %H:%M:%S'),
+            'total': sum(by_type.values()),
+            'by_type': by_type,
+        })
+        bucket += step
+    return sorted(types), points
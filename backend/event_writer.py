@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+
+from models import Event
+
+
+class EventWriter:
+    """Escritura de eventos en lote desde un solo thread.
+
+    Detecciones, programador y rutas de la API encolan los eventos con
+    `add` y siguen de largo. El thread junta hasta `batch_max_rows` filas o
+    lo que llegue en `batch_interval_ms` y las inserta en una sola
+    transacción, así una ráfaga de eventos es un commit en vez de uno por
+    fila. `add` devuelve un Future con el id del evento para quien lo
+    necesite (por ejemplo, para relacionar un incidente).
+    """
+
+    LATENCY_SAMPLES = 500
+
+    def __init__(self, session_maker, db_config: dict = None):
+        db_config = db_config or {}
+        self.SessionLocal = session_maker
+        self.max_rows = db_config.get("batch_max_rows", 100)
+        self.interval = db_config.get("batch_interval_ms", 200) / 1000.0
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.running = True
+        self.started = time.time()
+        self.stats = {"rows": 0, "batches": 0, "errors": 0, "max_batch": 0, "commit_seconds": 0.0}
+        self.latencies = deque(maxlen=self.LATENCY_SAMPLES)  # De `add` al commit
+        self.recent = deque(maxlen=self.LATENCY_SAMPLES)     # (momento, filas) de los últimos lotes
+
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def add(self, event_type, info=None, timestamp=None):
+        """Encolar un evento (no bloquea). Devuelve un Future con su id."""
+        future = Future()
+        if not self.running:
+            future.set_exception(RuntimeError("escritor de eventos detenido"))
+            return future
+        self.queue.put((time.time(), event_type, info, timestamp or datetime.utcnow(), future))
+        return future
+
+    def _next_batch(self):
+        """Esperar el primer evento y juntar los que lleguen dentro del intervalo"""
+        try:
+            first = self.queue.get(timeout=1.0)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.time() + self.interval
+        while len(batch) < self.max_rows:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [item for item in batch if item is not None]
+
+    def _write_loop(self):
+        while self.running or not self.queue.empty():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        start = time.time()
+        db = self.SessionLocal()
+        try:
+            # INSERT directo (sin el unit of work del ORM) dentro de una sola transacción
+            insert = Event.__table__.insert()
+            ids = [db.execute(insert, {"event_type": event_type, "info": info, "timestamp": timestamp})
+                   .inserted_primary_key[0]
+                   for _, event_type, info, timestamp, _ in batch]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            with self.lock:
+                self.stats["errors"] += 1
+            print(f"❌ Error guardando {len(batch)} eventos: {e}")
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        now = time.time()
+        with self.lock:
+            self.stats["rows"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            self.stats["commit_seconds"] += now - start
+            self.recent.append((now, len(batch)))
+            self.latencies.extend(now - queued_at for queued_at, *_ in batch)
+        for (*_, future), event_id in zip(batch, ids):
+            future.set_result(event_id)
+
+    def get_stats(self, window=60):
+        now = time.time()
+        with self.lock:
+            stats = dict(self.stats)
+            latencies = sorted(self.latencies)
+            recent_rows = sum(rows for at, rows in self.recent if now - at <= window)
+        batches = stats["batches"]
+        commit_seconds = stats.pop("commit_seconds")
+        stats["pending"] = self.queue.qsize()
+        stats["avg_batch"] = round(stats["rows"] / batches, 1) if batches else 0
+        stats["avg_commit_ms"] = round(commit_seconds / batches * 1000, 2) if batches else 0
+        stats["rows_per_second"] = round(recent_rows / min(window, max(1.0, now - self.started)), 2)
+        stats["latency_ms"] = {
+            "avg": round(sum(latencies) / len(latencies) * 1000, 1),
+            "p95": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1),
+        } if latencies else {}
+        stats["batch_max_rows"] = self.max_rows
+        stats["batch_interval_ms"] = int(self.interval * 1000)
+        return stats
+
+    def stop(self, timeout=5):
+        """Escribir lo pendiente y terminar"""
+        self.running = False
+        self.queue.put(None)
+        self.thread.join(timeout)
@@ -0,0 +1,292 @@
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameRef:
+    """Referencia de solo lectura a un frame del ring.
+
+    Mientras la referencia esté viva el slot no se sobreescribe. Hay que
+    liberarla con release() o usarla como context manager.
+    """
+
+    __slots__ = ("ring", "slot", "generation", "seq", "timestamp", "frame")
+
+    def __init__(self, ring, slot, generation, seq, timestamp, frame):
+        self.ring = ring
+        self.slot = slot
+        self.generation = generation
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+
+    def release(self):
+        if self.ring is not None:
+            self.ring._release(self.slot, self.generation)
+            self.ring = None
+            self.frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FrameRing:
+    """Ring preasignado de frames compartido por captura, detección, grabación y streaming.
+
+    La captura escribe cada frame una sola vez en un slot (idealmente con
+    cap.read(slot) para que el decoder escriba directo ahí). Los lectores
+    reciben vistas de solo lectura con número de secuencia y conteo de
+    referencias, así que nadie necesita hacer copias privadas.
+
+    Con shared=True el ring (frames y metadatos) vive en memoria compartida:
+    el proceso de la cámara lo crea y escribe, y los otros procesos lo abren
+    con attach() y leen los mismos slots sin copiar ni serializar píxeles. En
+    ese caso `cond` debe ser una multiprocessing.Condition común a todos.
+    El unlink lo hace siempre el proceso web (el único que sobrevive a los
+    reinicios de las cámaras), así el resource tracker compartido lo ve una
+    sola vez.
+    """
+
+    EXTRA_SLOTS = 8  # Slots de holgura para lectores (detección, streams, grabación)
+
+    # Cabecera: latest_seq, latest_slot, next_slot, overruns
+    _LATEST_SEQ, _LATEST_SLOT, _NEXT_SLOT, _OVERRUNS = range(4)
+    _HEADER_BYTES = 4 * 8
+
+    def __init__(self, num_slots: int, cond=None, shared=False, on_allocate=None, max_mb=None, seq_base=0):
+        self.wanted_slots = max(2, int(num_slots))
+        self.num_slots = self.wanted_slots
+        self.max_mb = max_mb  # Presupuesto de memoria: con frames grandes se usan menos slots
+        self.cond = cond or threading.Condition()
+        self.shared = shared
+        self.on_allocate = on_allocate  # Callback(nombre_shm, shape, slots) al crear un ring compartido
+        self.shm = None
+        self._retired = []
+        self.generation = 0
+        self.shape = None
+        self.buffer = None
+        # seq_base: al relanzar la captura se sigue desde la última secuencia que vieron los lectores
+        self.header = np.array([seq_base, -1, 0, 0], dtype=np.int64)
+        self.closed = False
+
+    # --- Layout -------------------------------------------------------
+
+    @classmethod
+    def layout_size(cls, num_slots, shape):
+        """Bytes necesarios para `num_slots` frames de `shape` más sus metadatos"""
+        meta = cls._HEADER_BYTES + 3 * 8 * num_slots
+        return meta + num_slots * int(np.prod(shape))
+
+    def slots_for(self, shape):
+        """Slots que entran en el presupuesto para frames de `shape` (al menos 2)"""
+        if not self.max_mb:
+            return self.wanted_slots
+        per_slot = int(np.prod(shape)) + 3 * 8
+        fit = int((self.max_mb * 1024 * 1024 - self._HEADER_BYTES) // per_slot)
+        return max(2, min(self.wanted_slots, fit))
+
+    def _map(self, buf, shape):
+        """Crear las vistas numpy (cabecera, seqs, tiempos, refs y píxeles) sobre `buf`"""
+        n = self.num_slots
+        offset = self._HEADER_BYTES
+        self.header = np.ndarray((4,), dtype=np.int64, buffer=buf, offset=0)
+        self.seqs = np.ndarray((n,), dtype=np.int64, buffer=buf, offset=offset)
+        self.times = np.ndarray((n,), dtype=np.float64, buffer=buf, offset=offset + 8 * n)
+        self.refs = np.ndarray((n,), dtype=np.int64, buffer=buf, offset=offset + 16 * n)  # -1 = en escritura
+        self.buffer = np.ndarray((n,) + tuple(shape), dtype=np.uint8, buffer=buf, offset=offset + 24 * n)
+        self.shape = tuple(shape)
+        self.generation += 1
+
+    def _allocate(self, shape):
+        """(Re)crear el buffer. Las referencias viejas mantienen vivo el buffer anterior."""
+        latest_seq = int(self.header[self._LATEST_SEQ])
+        overruns = int(self.header[self._OVERRUNS])
+        self.num_slots = self.slots_for(shape)
+        size = self.layout_size(self.num_slots, shape)
+
+        old_shm = self.shm
+        if self.shared:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            buf = self.shm.buf
+        else:
+            buf = np.zeros(size, dtype=np.uint8)
+
+        self._map(buf, shape)
+        self.header[:] = (latest_seq, -1, 0, overruns)  # Las secuencias siguen siendo crecientes
+        if old_shm is not None:
+            self._retire(old_shm)
+
+        mb = self.buffer.nbytes / (1024 * 1024)
+        print(f"🧮 Ring de frames: {self.num_slots} slots de {shape[1]}x{shape[0]} ({mb:.0f} MB)")
+        if self.num_slots < self.wanted_slots:
+            print(f"⚠️ El presupuesto de {self.max_mb} MB no alcanza para {self.wanted_slots} slots "
+                  f"de {shape[1]}x{shape[0]}: se usan {self.num_slots}")
+        if self.shared and self.on_allocate:
+            self.on_allocate(self.shm.name, self.shape, self.num_slots)
+
+    def attach(self, name, shape, num_slots=None, unlink_previous=False):
+        """Abrir (desde otro proceso) un ring compartido creado por el escritor"""
+        with self.cond:
+            if num_slots is not None:
+                self.num_slots = int(num_slots)
+            shm = shared_memory.SharedMemory(name=name)
+            old_shm = self.shm
+            self.shm = shm
+            self._map(shm.buf, shape)
+            if old_shm is not None:
+                self._retire(old_shm, unlink=unlink_previous)
+            self.cond.notify_all()
+
+    def _retire(self, shm, unlink=False):
+        """Cerrar memoria compartida vieja cuando ya nadie tiene vistas sobre ella"""
+        if unlink:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._retired.append(shm)
+        still_open = []
+        for old in self._retired:
+            try:
+                old.close()
+            except BufferError:
+                still_open.append(old)  # Todavía hay FrameRefs vivas
+        self._retired = still_open
+
+    @property
+    def latest_seq(self):
+        return int(self.header[self._LATEST_SEQ])
+
+    @property
+    def overruns(self):
+        return int(self.header[self._OVERRUNS])
+
+    # --- Escritura ----------------------------------------------------
+
+    def begin_write(self):
+        """Reservar el siguiente slot libre. Devuelve (slot, array escribible) o (None, None)."""
+        with self.cond:
+            if self.buffer is None:
+                return None, None
+            next_slot = int(self.header[self._NEXT_SLOT])
+            latest_slot = int(self.header[self._LATEST_SLOT])
+            for i in range(self.num_slots):
+                slot = (next_slot + i) % self.num_slots
+                if self.refs[slot] == 0 and slot != latest_slot:
+                    self.refs[slot] = -1
+                    self.seqs[slot] = 0
+                    self.header[self._NEXT_SLOT] = (slot + 1) % self.num_slots
+                    return slot, self.buffer[slot]
+            return None, None
+
+    def cancel_write(self, slot):
+        if slot is None:
+            return
+        with self.cond:
+            if self.buffer is not None and self.refs[slot] == -1:
+                self.refs[slot] = 0
+
+    def commit_write(self, slot, frame, timestamp=None):
+        """Publicar un frame. Si `frame` no es la memoria del slot, se copia una vez."""
+        with self.cond:
+            if self.shape != frame.shape:
+                if slot is not None:
+                    self.refs[slot] = 0
+                self._allocate(frame.shape)
+                slot = None
+            if slot is None:
+                slot, target = self.begin_write()
+                if slot is None:
+                    self.header[self._OVERRUNS] += 1
+                    return None
+            else:
+                target = self.buffer[slot]
+            if frame.ctypes.data != target.ctypes.data:
+                np.copyto(target, frame)
+
+            seq = int(self.header[self._LATEST_SEQ]) + 1
+            self.refs[slot] = 0
+            self.seqs[slot] = seq
+            self.times[slot] = timestamp or time.time()
+            self.header[self._LATEST_SEQ] = seq
+            self.header[self._LATEST_SLOT] = slot
+            self.cond.notify_all()
+            return seq
+
+    # --- Lectura ------------------------------------------------------
+
+    def _ref(self, slot):
+        """Crear una referencia (con el lock tomado)"""
+        self.refs[slot] += 1
+        view = self.buffer[slot].view()
+        view.flags.writeable = False
+        return FrameRef(self, slot, self.generation, int(self.seqs[slot]), float(self.times[slot]), view)
+
+    def _release(self, slot, generation):
+        with self.cond:
+            if generation == self.generation and self.refs[slot] > 0:
+                self.refs[slot] -= 1
+
+    def _latest_ref(self):
+        latest_slot = int(self.header[self._LATEST_SLOT])
+        if self.buffer is None or latest_slot < 0:
+            return None
+        return self._ref(latest_slot)
+
+    def latest(self):
+        """Referencia al frame más reciente, o None si todavía no hay frames"""
+        with self.cond:
+            return self._latest_ref()
+
+    def wait_newer(self, after_seq, timeout=1.0):
+        """Bloquear hasta que haya un frame con seq > after_seq. Devuelve su referencia o None."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.closed or self.latest_seq > after_seq, timeout=timeout)
+            if self.closed or self.latest_seq <= after_seq:
+                return None
+            return self._latest_ref()
+
+    def snapshot(self, since=None):
+        """Referencias a todos los frames guardados (opcionalmente desde `since`), en orden"""
+        with self.cond:
+            if self.buffer is None:
+                return []
+            valid = (self.seqs > 0) & (self.refs >= 0)
+            if since is not None:
+                valid &= self.times >= since
+            slots = np.flatnonzero(valid)
+            slots = slots[np.argsort(self.seqs[slots])]
+            return [self._ref(int(s)) for s in slots]
+
+    def get_stats(self):
+        with self.cond:
+            return {
+                "slots": self.num_slots,
+                "wanted_slots": self.wanted_slots,
+                "slots_in_use": int((self.refs != 0).sum()) if self.buffer is not None else 0,
+                "latest_seq": self.latest_seq,
+                "overruns": self.overruns,
+                "memory_mb": round(self.buffer.nbytes / (1024 * 1024), 1) if self.buffer is not None else 0,
+                "budget_mb": self.max_mb,
+                "shared": self.shared or self.shm is not None,
+            }
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def destroy(self, unlink=False):
+        """Cerrar la memoria compartida (y liberarla con unlink=True)"""
+        self.close()
+        self.generation += 1  # Las FrameRef pendientes ya no tocan los metadatos
+        self.header = self.header.copy()
+        self.buffer = self.seqs = self.times = self.refs = None
+        if self.shm is not None:
+            self._retire(self.shm, unlink=unlink)
+            self.shm = None
@@ -0,0 +1,223 @@
+import threading
+import time
+from datetime import datetime
+
+from event_writer import EventWriter
+from models import Event, Incident, get_session_maker
+
+
+def _duration(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 60}m {seconds % 60}s" if seconds >= 60 else f"{seconds}s"
+
+
+class ActiveIncident:
+    """Incidente abierto de una cámara (en memoria hasta que se cierra)"""
+
+    def __init__(self, camera, zone=None):
+        self.camera_id = camera.cam_id
+        self.camera_name = camera.name
+        self.zones = [zone] if zone else []
+        self.started = time.time()
+        self.last_hit = self.started     # Último frame con movimiento (mantiene abierto el incidente)
+        self.last_counted = self.started  # Última detección contada en `hits`
+        self.hits = 1
+        self.alert = None      # Mensaje de Telegram que se va editando
+        self.last_edit = self.started
+        self.event_id = None
+        self.incident_id = None
+
+    def hit(self, zone=None, timestamp=None, cooldown=0):
+        """Sumar un frame con movimiento. Cuenta como detección nueva solo pasado `cooldown`
+        desde la anterior (cada frame de una misma pasada no es otra detección). True si contó."""
+        timestamp = timestamp or time.time()
+        self.last_hit = max(self.last_hit, timestamp)
+        if zone and zone not in self.zones:
+            self.zones.append(zone)
+        if timestamp - self.last_counted < cooldown:
+            return False
+        self.last_counted = timestamp
+        self.hits += 1
+        return True
+
+    @property
+    def where(self):
+        return f"{self.camera_name} (zona {', '.join(self.zones)})" if self.zones else self.camera_name
+
+    def message(self, closed=False):
+        """Texto de la alerta; se edita mientras dura el incidente"""
+        message = "🚨 *ALARMA ACTIVADA*\n\n"
+        message += f"📹 Movimiento detectado en la cámara {self.where}\n"
+        message += f"⏰ Inicio: {datetime.fromtimestamp(self.started).strftime('%Y-%m-%d %H:%M:%S')}\n"
+        message += f"🔁 Detecciones: {self.hits}\n"
+        message += f"⏱️ Duración: {_duration(self.last_hit - self.started)}\n"
+        message += "✅ Terminado, video a continuación\n" if closed else "🎥 En curso, grabando...\n"
+        message += "🏠 Sistema de Vigilancia"
+        return message
+
+
+class IncidentCoalescer:
+    """Agrupa ráfagas de detecciones de una cámara en un solo incidente.
+
+    La primera detección abre el incidente: una fila en `events` y otra en
+    `incidents`, un mensaje de Telegram y una grabación. Las detecciones
+    que siguen mientras el incidente está abierto solo se cuentan, una por
+    `cooldown_seconds` como las alertas (sin threads, base de datos ni
+    mensajes nuevos). La grabación se mantiene
+    hasta que pasan `incident_window_seconds` sin movimiento (o se llega a
+    `max_clip_seconds`); ahí el incidente se cierra con inicio, fin y
+    cantidad de detecciones, el mensaje se edita con el resumen y sale un
+    único video.
+    """
+
+    def __init__(self, config: dict, clip_store=None, notifier=None, event_writer=None):
+        det_config = config.get("detection", {})
+        self.window = det_config.get("incident_window_seconds", 30)
+        self.cooldown = det_config.get("cooldown_seconds", 10)
+        self.edit_interval = det_config.get("incident_edit_interval_seconds", 30)
+        self.clip_store = clip_store
+        self.notifier = notifier
+        db_config = config.get("database", {})
+        self.SessionLocal = get_session_maker(db_config.get("path", "events.db"), db_config)
+        # Los eventos entran por el escritor en lote; la fila del incidente se relaciona con su id
+        self.event_writer = event_writer or EventWriter(self.SessionLocal, db_config)
+        self.lock = threading.Lock()
+        self.active = {}  # cam_id -> ActiveIncident
+        self.stats = {"incidents": 0, "hits": 0, "coalesced": 0, "edits": 0}
+
+    @property
+    def telegram_enabled(self):
+        return self.notifier is not None and self.notifier.enabled
+
+    def extend(self, camera, zone=None, timestamp=None, cooldown=None):
+        """Sumar el frame con movimiento al incidente abierto de la cámara. False si no hay ninguno."""
+        with self.lock:
+            incident = self.active.get(camera.cam_id)
+            if incident is None:
+                return False
+            self.stats["coalesced"] += 1
+            if not incident.hit(zone, timestamp, self.cooldown if cooldown is None else cooldown):
+                return True
+            self.stats["hits"] += 1
+            edit = self.telegram_enabled and time.time() - incident.last_edit >= self.edit_interval
+            if edit:
+                incident.last_edit = time.time()
+                self.stats["edits"] += 1
+        if edit:
+            self.notifier.edit_message(incident.alert, incident.message())
+        return True
+
+    def open(self, camera, zone=None):
+        """Abrir un incidente: alerta inmediata, filas en la base y grabación hasta que se calme"""
+        with self.lock:
+            if camera.cam_id in self.active:
+                return self.active[camera.cam_id]
+            incident = ActiveIncident(camera, zone)
+            self.active[camera.cam_id] = incident
+            self.stats["incidents"] += 1
+            self.stats["hits"] += 1
+
+        if self.telegram_enabled:
+            incident.alert = self.notifier.send_message(incident.message())
+        threading.Thread(target=self._run, args=(camera, incident), daemon=True).start()
+        return incident
+
+    def _run(self, camera, incident):
+        clip = None
+        video_path, seconds = None, 0
+        try:
+            self._save_open(incident)
+
+            # Una sola grabación para todo el incidente: el post-roll es la ventana
+            recorder = camera.event_recorder
+            video_path, seconds = recorder.record(post_roll=max(recorder.post_roll, self.window))
+        except Exception as e:
+            print(f"❌ Error grabando incidente de {incident.where}: {e}")
+        finally:
+            # Desde acá una detección nueva abre otro incidente
+            with self.lock:
+                self.active.pop(incident.camera_id, None)
+
+        try:
+            # El clip queda en el almacén (lo borra el janitor por antigüedad o cuota)
+            if video_path is not None and self.clip_store is not None:
+                clip = self.clip_store.add(video_path, camera_id=incident.camera_id, event_id=incident.event_id,
+                                           duration=seconds)
+                video_path = self.clip_store.path(clip["filename"])
+            self._save_close(incident, clip)
+            print(f"📋 Incidente en {incident.where}: {incident.hits} detecciones en "
+                  f"{_duration(incident.last_hit - incident.started)}")
+
+            if self.telegram_enabled:
+                self.notifier.edit_message(incident.alert, incident.message(closed=True))
+                if video_path is not None:
+                    self.notifier.send_video(video_path, duration=seconds)
+        except Exception as e:
+            print(f"❌ Error cerrando incidente de {incident.where}: {e}")
+
+    def _save_open(self, incident):
+        db = self.SessionLocal()
+        try:
+            incident.event_id = self.event_writer.add(
+                "movimiento_detectado",
+                f"[{incident.camera_id}] Movimiento detectado en {incident.where} - Alarma activada",
+                timestamp=datetime.utcfromtimestamp(incident.started)
+            ).result(timeout=30)
+            row = Incident(event_id=incident.event_id, camera_id=incident.camera_id, zones=",".join(incident.zones),
+                           started_at=datetime.utcfromtimestamp(incident.started))
+            db.add(row)
+            db.commit()
+            incident.incident_id = row.id
+            print("💾 Evento guardado")
+        except Exception as e:
+            db.rollback()
+            print(f"Error guardando evento: {e}")
+        finally:
+            db.close()
+
+    def _save_close(self, incident, clip=None):
+        """Inicio, fin y cantidad de detecciones en una sola escritura al cerrar"""
+        if incident.incident_id is None:
+            return
+        db = self.SessionLocal()
+        try:
+            row = db.query(Incident).filter(Incident.id == incident.incident_id).first()
+            if row is not None:
+                row.ended_at = datetime.utcfromtimestamp(incident.last_hit)
+                row.hits = incident.hits
+                row.zones = ",".join(incident.zones)
+                row.clip_id = clip["id"] if clip else None
+            event = db.query(Event).filter(Event.id == incident.event_id).first()
+            if event is not None:
+                event.info = (f"[{incident.camera_id}] Movimiento detectado en {incident.where} - Alarma activada "
+                              f"({incident.hits} detecciones en {_duration(incident.last_hit - incident.started)})")
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error cerrando incidente: {e}")
+        finally:
+            db.close()
+
+    def for_events(self, event_ids):
+        """{event_id: incidente} de los eventos que lo tienen (una sola consulta)"""
+        if not event_ids:
+            return {}
+        db = self.SessionLocal()
+        try:
+            rows = db.query(Incident).filter(Incident.event_id.in_(list(event_ids))).all()
+            return {row.event_id: row.to_dict() for row in rows}
+        finally:
+            db.close()
+
+    def get_stats(self):
+        with self.lock:
+            active = [{
+                "camera_id": incident.camera_id,
+                "where": incident.where,
+                "hits": incident.hits,
+                "seconds": round(time.time() - incident.started, 1),
+            } for incident in self.active.values()]
+            stats = dict(self.stats)
+        stats["active"] = active
+        stats["window_seconds"] = self.window
+        return stats
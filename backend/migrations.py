@@ -0,0 +1,123 @@
+"""Migraciones de esquema versionadas para bases `events.db` ya existentes.
+
+`create_all` crea las tablas que faltan pero no toca las que ya están
+(índices o columnas nuevas). Cada migración tiene un número y se aplica
+una sola vez, en orden, dentro de su propia transacción; la versión
+aplicada se guarda en `PRAGMA user_version` del archivo.
+
+Para agregar una: sumar una entrada al final de MIGRATIONS con el número
+siguiente. Los pasos son SQL o funciones que reciben la conexión.
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+def _create_events_fts(connection):
+    """Índice de texto completo de events (FTS5), sincronizado por triggers.
+
+    Es de contenido externo: el texto vive solo en `events` y el índice
+    guarda los términos. Si el SQLite del sistema no trae FTS5 se deja
+    como está y la búsqueda usa LIKE.
+    """
+    try:
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5("
+            "event_type, info, content='events', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"  # "camara" encuentra "cámara"
+        ))
+    except OperationalError as e:
+        print(f"⚠️ SQLite sin FTS5 ({e}): la búsqueda de eventos usa LIKE")
+        return
+
+    for statement in (
+        """CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+               INSERT INTO events_fts(rowid, event_type, info) VALUES (new.id, new.event_type, new.info);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+               INSERT INTO events_fts(events_fts, rowid, event_type, info)
+               VALUES ('delete', old.id, old.event_type, old.info);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS events_fts_update AFTER UPDATE OF event_type, info ON events BEGIN
+               INSERT INTO events_fts(events_fts, rowid, event_type, info)
+               VALUES ('delete', old.id, old.event_type, old.info);
+               INSERT INTO events_fts(rowid, event_type, info) VALUES (new.id, new.event_type, new.info);
+           END""",
+        # Indexar los eventos que ya estaban
+        "INSERT INTO events_fts(events_fts) VALUES ('rebuild')",
+    ):
+        connection.execute(text(statement))
+
+
+# Inicio de la hora / del día de un timestamp, en el mismo formato que guarda SQLAlchemy
+# (así se compara bien como texto contra los datetime de las consultas)
+_BUCKETS = {
+    "hour": "strftime('%Y-%m-%d %H:00:00.000000', {ts})",
+    "day": "strftime('%Y-%m-%d 00:00:00.000000', {ts})",
+}
+
+
+def _rollup_upsert(row, delta):
+    return "\n".join(
+        f"""INSERT INTO event_rollups (period, bucket, event_type, event_count)
+               VALUES ('{period}', {bucket.format(ts=f'{row}.timestamp')}, {row}.event_type, {delta})
+               ON CONFLICT (period, bucket, event_type) DO UPDATE SET event_count = event_count + ({delta});"""
+        for period, bucket in _BUCKETS.items()
+    )
+
+
+def _create_event_rollups(connection):
+    """Triggers que mantienen event_rollups al escribir eventos, y carga de lo que ya había"""
+    connection.execute(text(f"""CREATE TRIGGER IF NOT EXISTS event_rollups_insert AFTER INSERT ON events BEGIN
+        {_rollup_upsert('new', 1)}
+    END"""))
+    connection.execute(text(f"""CREATE TRIGGER IF NOT EXISTS event_rollups_delete AFTER DELETE ON events BEGIN
+        {_rollup_upsert('old', -1)}
+    END"""))
+    connection.execute(text(f"""CREATE TRIGGER IF NOT EXISTS event_rollups_update
+        AFTER UPDATE OF event_type, timestamp ON events BEGIN
+        {_rollup_upsert('old', -1)}
+        {_rollup_upsert('new', 1)}
+    END"""))
+
+    connection.execute(text("DELETE FROM event_rollups"))
+    for period, bucket in _BUCKETS.items():
+        connection.execute(text(f"""
+            INSERT INTO event_rollups (period, bucket, event_type, event_count)
+            SELECT '{period}', {bucket.format(ts='timestamp')} AS bucket_start, event_type, COUNT(*)
+            FROM events WHERE timestamp IS NOT NULL GROUP BY bucket_start, event_type
+        """))
+
+
+MIGRATIONS = [
+    (1, "índices de events por fecha y por tipo + fecha", [
+        "CREATE INDEX IF NOT EXISTS ix_events_timestamp ON events (timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_events_event_type_timestamp ON events (event_type, timestamp)",
+        "ANALYZE events",
+    ]),
+    (2, "búsqueda de texto completo en events (FTS5)", [_create_events_fts]),
+    (3, "conteos de eventos por hora y día (event_rollups)", [_create_event_rollups]),
+]
+
+
+def schema_version(connection):
+    return connection.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def migrate(engine):
+    """Aplicar las migraciones pendientes. Devuelve la versión final del esquema."""
+    with engine.connect() as connection:
+        version = schema_version(connection)
+
+    for number, description, steps in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as connection:
+            for step in steps:
+                if callable(step):
+                    step(connection)
+                else:
+                    connection.execute(text(step))
+            connection.execute(text(f"PRAGMA user_version = {int(number)}"))
+        version = number
+        print(f"🛠️ Migración {number} aplicada: {description}")
+    return version
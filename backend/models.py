@@ -1,10 +1,12 @@
 from email.policy import default
 from enum import unique
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
+import threading
 
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -15,7 +17,74 @@ class Event(Base):
     id = Column(Integer, primary_key=True)
     event_type = Column(String(50), nullable=False)
     info = Column(Text, nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # Listado, estadísticas y exportación filtran por tipo y ordenan por fecha
+    __table_args__ = (Index('ix_events_event_type_timestamp', 'event_type', 'timestamp'),)
+
+class EventRollup(Base):
+    """Cantidad de eventos por hora y por día y tipo; la mantienen los triggers de la migración 3"""
+    __tablename__ = 'event_rollups'
+    id = Column(Integer, primary_key=True)
+    period = Column(String(4), nullable=False)   # "hour" o "day"
+    bucket = Column(DateTime, nullable=False)    # Inicio de la hora o del día (UTC, como Event.timestamp)
+    event_type = Column(String(50), nullable=False)
+    event_count = Column(Integer, nullable=False, default=0)
+
+    # Las lecturas son rangos de (period, bucket); el trigger suma con ON CONFLICT sobre esta clave
+    __table_args__ = (UniqueConstraint('period', 'bucket', 'event_type', name='uq_event_rollups_bucket'),)
+
+class Clip(Base):
+    __tablename__ = 'clips'
+    id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, ForeignKey('events.id'), nullable=True, index=True)
+    camera_id = Column(String(50), nullable=True, index=True)
+    filename = Column(String(255), unique=True, nullable=False)  # Relativo a recording.clips_dir
+    duration = Column(Float, nullable=True)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_access = Column(DateTime, default=datetime.utcnow)  # Para desalojar primero lo que nadie mira
+
+    def to_dict(self):
+        version = int(self.created_at.timestamp()) if self.created_at else 0
+        return {
+            'id': self.id,
+            'event_id': self.event_id,
+            'camera_id': self.camera_id,
+            'filename': self.filename,
+            'duration': self.duration,
+            'size_mb': round(self.size_bytes / (1024 * 1024), 2),
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            # `v` cambia si el id se reutiliza: el clip y sus miniaturas se cachean como inmutables
+            'url': f"/api/clips/{self.id}?v={version}",
+            'poster_url': f"/api/clips/{self.id}/poster.jpg?v={version}",
+            'sprite_url': f"/api/clips/{self.id}/sprite.jpg?v={version}",
+        }
+
+class Incident(Base):
+    __tablename__ = 'incidents'
+    id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, ForeignKey('events.id'), nullable=True, index=True)
+    camera_id = Column(String(50), nullable=True, index=True)
+    zones = Column(Text, nullable=True)  # Zonas que dispararon, separadas por coma
+    started_at = Column(DateTime, default=datetime.utcnow, index=True)
+    ended_at = Column(DateTime, nullable=True)  # Última detección; None mientras sigue abierto
+    hits = Column(Integer, nullable=False, default=1)  # Detecciones agrupadas en el incidente
+    clip_id = Column(Integer, ForeignKey('clips.id'), nullable=True)
+
+    def to_dict(self):
+        duration = (self.ended_at - self.started_at).total_seconds() if self.ended_at and self.started_at else None
+        return {
+            'id': self.id,
+            'event_id': self.event_id,
+            'camera_id': self.camera_id,
+            'zones': self.zones.split(",") if self.zones else [],
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+            'ended_at': self.ended_at.strftime('%Y-%m-%d %H:%M:%S') if self.ended_at else None,
+            'duration': round(duration, 1) if duration is not None else None,
+            'hits': self.hits,
+            'clip_id': self.clip_id,
+        }
 
 class User(Base):
     __tablename__ = 'users'
@@ -39,7 +108,55 @@ class User(Base):
             'is_active': self.is_active
         }
 
-def get_session_maker(db_path: str):
-    engine = create_engine(f"sqlite:///{db_path}")
-    Base.metadata.create_all(engine)
-    return sessionmaker(bind=engine)
\ No newline at end of file
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _sqlite_pragmas(db_config: dict):
+    """PRAGMAs de cada conexión según la sección `database:`"""
+    return [
+        f"PRAGMA journal_mode = {db_config.get('journal_mode', 'wal')}",  # Lectores sin bloquear al escritor
+        f"PRAGMA synchronous = {db_config.get('synchronous', 'normal')}",
+        f"PRAGMA mmap_size = {int(db_config.get('mmap_size_mb', 64) * 1024 * 1024)}",
+        f"PRAGMA cache_size = {-int(db_config.get('cache_size_mb', 16) * 1024)}",  # Negativo: en KiB
+        "PRAGMA temp_store = memory",
+    ]
+
+def get_engine(db_path: str, db_config: dict = None):
+    """Engine único por base de datos en todo el proceso.
+
+    El pool deja `pool_size` conexiones abiertas (más `max_overflow` en
+    picos) compartidas entre threads; SQLite espera hasta
+    `busy_timeout_seconds` si otra conexión está escribiendo. Cada conexión
+    nueva aplica los PRAGMAs de rendimiento (WAL, synchronous, mmap, caché).
+    El esquema se crea y se migra una sola vez; la configuración solo
+    cuenta la primera vez que se pide el engine.
+    """
+    from migrations import migrate
+
+    db_config = db_config or {}
+    with _engines_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            engine = create_engine(
+                f"sqlite:///{db_path}",
+                poolclass=QueuePool,
+                pool_size=db_config.get("pool_size", 5),
+                max_overflow=db_config.get("max_overflow", 5),
+                connect_args={"check_same_thread": False, "timeout": db_config.get("busy_timeout_seconds", 15)},
+            )
+            pragmas = _sqlite_pragmas(db_config)
+
+            @event.listens_for(engine, "connect")
+            def set_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+
+            Base.metadata.create_all(engine)
+            migrate(engine)
+            _engines[db_path] = engine
+        return engine
+
+def get_session_maker(db_path: str, db_config: dict = None):
+    return sessionmaker(bind=get_engine(db_path, db_config))
\ No newline at end of file
@@ -1,264 +1,171 @@
 import cv2
 import time
 import threading
-from video_recorder import VideoRecorder
+
+import numpy as np
+
+from detection_engines import create_engine, downscale
+from zones import ZoneMasks, load_zones
+
 
 class MotionDetector:
-    def __init__(self, rtsp_url: str, config: dict = None, is_alarm_enabled_func=None):
-        self.rtsp_url = rtsp_url
+    """Worker de detección de movimiento de una cámara.
+
+    Lee el frame más reciente de `frame_ring` (lo escribe CameraCapture,
+    normalmente desde otro proceso) y entrega cada resultado a `on_result`.
+    Si se le da `annotated_ring`, publica ahí el frame de detección con la
+    máscara y los rectángulos dibujados. La lógica de alarma (LED, buzzer,
+    eventos, Telegram) no vive acá: la consume el proceso web.
+    """
+
+    def __init__(self, frame_ring, config: dict = None, on_result=None, annotated_ring=None, rate=None):
+        self.frame_ring = frame_ring
         self.config = config or {}
-        self.is_alarm_enabled = is_alarm_enabled_func or (lambda: True)
-        self.frame = None
+        self.on_result = on_result or (lambda result: None)
+        self.annotated_ring = annotated_ring
+        self.rate = rate  # AdaptiveRate opcional: decide la cadencia en cada frame
+        self.zones = None
         self.lock = threading.Lock()
         self.running = True
-        self.alarm_triggered = False  # Alarma activada (LED parpadeando)
-        self.led_blink_thread = None
-        self.video_recorder = VideoRecorder()
-        self.thread = threading.Thread(target=self._capture_frames, daemon=True)
+        self.motion_boxes = []  # Rectángulos de la última detección (coordenadas del frame original)
+
+        # Estadísticas del pipeline
+        self.stats = {
+            "frames_processed": 0,
+            "frames_dropped": 0,   # Frames descartados porque la detección iba atrasada
+            "frames_stale": 0,     # Frames descartados por ser demasiado viejos
+            "frames_prefiltered": 0,  # Frames que el prefiltro en cascada resolvió sin el motor completo
+            "lag_frames": 0,       # Frames capturados mientras se procesaba el último
+            "latency_ms": 0.0,     # Captura -> fin de detección
+            "detection_ms": 0.0,   # Tiempo de procesamiento de la última detección
+        }
+
+        self.thread = threading.Thread(target=self._detection_loop, daemon=True)
         self.thread.start()
 
-    def _led_blink_loop(self, blink_interval=0.3):
-        """Parpadeo continuo del LED rojo mientras la alarma está activa"""
-        from gpio_control import encender_rojo, apagar_rojo
-        while self.running and self.alarm_triggered and self.is_alarm_enabled():
-            encender_rojo()
-            time.sleep(blink_interval)
-            apagar_rojo()
-            time.sleep(blink_interval)
-        # Al terminar, apagar LED
-        apagar_rojo()
-
-    def _buzzer_pulse(self, duration):
-        """Activa el buzzer por un tiempo determinado"""
-        from gpio_control import encender_buzzer, apagar_buzzer
-        encender_buzzer()
-        time.sleep(duration)
-        apagar_buzzer()
-
-    def reset_alarm(self):
-        """Resetear estado de alarma (llamado desde web al desactivar)"""
-        self.alarm_triggered = False
-        from gpio_control import apagar_rojo, apagar_buzzer
-        apagar_rojo()
-        apagar_buzzer()
-
-    def _capture_frames(self):
-        # Leer configuración
-        cam_config = self.config.get("camera", {})
+    def _detection_loop(self):
+        """Worker de detección: siempre procesa el frame más reciente y descarta los atrasados"""
         det_config = self.config.get("detection", {})
-        hw_config = self.config.get("hardware", {})
-
-        # Parámetros de cámara
-        buffer_size = cam_config.get("buffer_size", 1)
-        fps = cam_config.get("fps", 10)
-        reconnect_delay = cam_config.get("reconnect_delay", 2)
-        max_reconnect_attempts = cam_config.get("max_reconnect_attempts", 5)
-        transport = cam_config.get("transport", "tcp")
-
-        # Configurar transporte RTSP (TCP más estable que UDP)
-        import os
-        if transport == "tcp":
-            os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|rtsp_flags;prefer_tcp"
 
         # Parámetros de detección
         min_area = det_config.get("min_area", 5000)
-        cooldown = det_config.get("cooldown_seconds", 10)
         motion_skip_frames = det_config.get("process_every_n_frames", 2)
-        motion_print_cooldown = det_config.get("log_cooldown_seconds", 5)
-        bg_history = det_config.get("background_history", 100)
-        detect_shadows = det_config.get("detect_shadows", False)
-        sensitivity = det_config.get("sensitivity", 25)
-
-        # Parámetros de hardware
-        buzzer_duration = hw_config.get("buzzer_duration", 60)
-        led_blink_interval = hw_config.get("led_blink_interval", 0.3)
-
-        cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
+        max_frame_age = det_config.get("max_frame_age", 1.0)  # Segundos
 
-        # OPTIMIZACIONES DE CAPTURA
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
-        cap.set(cv2.CAP_PROP_FPS, fps)
+        # Motor configurable por cámara (mog2, knn, framediff, running_avg),
+        # precedido por el prefiltro en cascada si está activo
+        engine = create_engine(det_config)
 
-        if not cap.isOpened():
-            print("❌ Error: No se pudo abrir el stream de la cámara.")
-            return
+        # Zonas include/exclude: se rasterizan una vez a la resolución de detección
+        zone_list = load_zones(det_config)
+        zones = ZoneMasks(zone_list) if zone_list else None
+        self.zones = zones
 
-        # Background Subtractor con parámetros configurables
-        fgbg = cv2.createBackgroundSubtractorMOG2(
-            history=bg_history,
-            varThreshold=sensitivity,
-            detectShadows=detect_shadows
-        )
+        stride = self.rate.detection_stride if self.rate else motion_skip_frames + 1
+        last_seq = 0
+        self.stats["engine"] = engine.name
 
-        last_alert = 0  # Para notificaciones de Telegram
-        frame_count = 0
-        last_motion_print = 0
-        reconnect_attempts = 0
-
-        print(
-            f" Cámara configurada: {fps} FPS, detección cada {motion_skip_frames + 1} frames, área mínima {min_area}px")
-        print(f" Buzzer: {buzzer_duration}s por detección | Cooldown Telegram: {cooldown}s")
+        cadence = "adaptativa" if self.rate and self.rate.enabled else f"cada {stride} frames (como máximo)"
+        print(f" Detección ({engine.name}): {cadence}, área mínima {min_area}px, "
+              f"frames con más de {max_frame_age}s se descartan")
+        if zone_list:
+            print(f" Zonas: {', '.join(z.name + ('' if z.include else ' (excluida)') for z in zone_list)}")
 
         while self.running:
-            ret, frame = cap.read()
-
-            if not ret:
-                reconnect_attempts += 1
-                if reconnect_attempts >= max_reconnect_attempts:
-                    print(f"⚠️ Stream perdido ({reconnect_attempts} intentos). Esperando {reconnect_delay * 5}s...")
-                    time.sleep(reconnect_delay * 5)
-                    reconnect_attempts = 0
-                else:
-                    print("⚠️ Stream perdido. Reintentando...")
-                    time.sleep(reconnect_delay)
-
-                cap.release()
-                cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
-                cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
-                cap.set(cv2.CAP_PROP_FPS, fps)
+            # Esperar a que haya un frame nuevo respetando la cadencia configurada
+            ref = self.frame_ring.wait_newer(last_seq + stride - 1 if last_seq else 0)
+            if ref is None:
                 continue
+            seq = ref.seq
+            captured_at = ref.timestamp
 
-            reconnect_attempts = 0
-
-            # REDUCIR RESOLUCIÓN para procesamiento
-            height, width = frame.shape[:2]
-            if width > 640:
-                scale = 640 / width
-                display_frame = frame.copy()
-                frame = cv2.resize(frame, (640, int(height * scale)), interpolation=cv2.INTER_LINEAR)
-            else:
-                display_frame = frame.copy()
-
-            self.video_recorder.add_frame(display_frame)
-
-            # DETECTAR MOVIMIENTO SOLO CADA N FRAMES
-            motion = False
-            if frame_count % (motion_skip_frames + 1) == 0:
-                fgmask = fgbg.apply(frame)
+            # Frames que pasaron sin procesarse más allá de la cadencia = atrasos
+            if last_seq:
+                self.stats["frames_dropped"] += max(0, seq - last_seq - stride)
+            last_seq = seq
 
-                # Aplicar filtros para reducir ruido
-                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-                fgmask = cv2.morphologyEx(fgmask, cv2.MORPH_OPEN, kernel)
-                fgmask = cv2.morphologyEx(fgmask, cv2.MORPH_CLOSE, kernel)
-
-                contours, _ = cv2.findContours(fgmask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-                for cnt in contours:
-                    area = cv2.contourArea(cnt)
-                    if area > min_area:
-                        motion = True
-                        x, y, w, h = cv2.boundingRect(cnt)
-
-                        # Dibujar en el frame de display
-                        if width > 640:
-                            scale_back = width / 640
-                            x = int(x * scale_back)
-                            y = int(y * scale_back)
-                            w = int(w * scale_back)
-                            h = int(h * scale_back)
-
-                        cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
-                        cv2.putText(display_frame, f"Area: {int(area)}", (x, y - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-            else:
-                fgbg.apply(frame, learningRate=0.01)
-
-            # ✅ LÓGICA DE ALARMA - Persistente hasta desactivación manual
-            current_time = time.time()
-
-            if motion and self.is_alarm_enabled():
-                # Si es una nueva detección (después del cooldown)
-                if (current_time - last_alert) > cooldown:
-                    last_alert = current_time
-
-                    # Si no había alarma activa, iniciar LED parpadeante
-                    if not self.alarm_triggered:
-                        self.alarm_triggered = True
-                        print("🚨 ¡ALARMA ACTIVADA! LED parpadeando hasta desactivación manual")
-
-                        # Iniciar parpadeo del LED en thread separado
-                        self.led_blink_thread = threading.Thread(
-                            target=self._led_blink_loop,
-                            args=(led_blink_interval,),
-                            daemon=True
-                        )
-                        self.led_blink_thread.start()
-                    else:
-                        print("🚨 Nueva detección de movimiento")
-
-                    # Activar buzzer por 60 segundos (en thread separado)
-                    threading.Thread(
-                        target=self._buzzer_pulse,
-                        args=(buzzer_duration,),
-                        daemon=True
-                    ).start()
-
-                    def save_event():
-                        try:
-                            from models import get_session_maker, Event
-                            db_path = self.config.get("database", {}).get("path", "events.db")
-                            SessionLocal = get_session_maker(db_path)
-                            db = SessionLocal()
-                            evento = Event(
-                                event_type = "movimiento_detectado",
-                                info = "Movimiento detectado - Alarma activada"
-                            )
-                            db.add(evento)
-                            db.commit()
-                            db.close()
-                            print("💾 Evento guardado")
-                        except Exception as e:
-                            print(f"Error guardando evento: {e}")
-
-                    threading.Thread(target=save_event, daemon=True).start()
-
-                    # Grabar video y enviar notificación Telegram
-                    telegram_config = self.config.get("telegram", {})
-                    if telegram_config.get("enabled", False):
-                        def send_alert_with_video():
-                            try:
-                                # Grabar 5 segundos de video
-                                video_path = self.video_recorder.record_motion_video(duration=5)
-
-                                # Enviar notificación con video
-                                from telegram_notifier import send_motion_alert
-                                send_motion_alert(telegram_config, video_path)
+            if time.time() - captured_at > max_frame_age:
+                self.stats["frames_stale"] += 1
+                ref.release()
+                continue
 
-                                # Limpiar video temporal después de 5 minutos
-                                if video_path and os.path.exists(video_path):
-                                    time.sleep(1800)  # 30 minutos
-                                    try:
-                                        os.remove(video_path)
-                                        print(f"🗑️ Video temporal eliminado: {video_path}")
-                                    except:
-                                        pass
+            start = time.time()
 
-                            except Exception as e:
-                                print(f"❌ Error en alerta con video: {e}")
+            # El slot queda reservado mientras se usa (small puede ser la vista del ring)
+            with ref:
+                # REDUCIR RESOLUCIÓN para procesamiento
+                small, scale_back = downscale(ref.frame)
 
-                        threading.Thread(target=send_alert_with_video, daemon=True).start()
+                fgmask, small_boxes, box_zones = engine.detect(small, min_area, zones)
+                if fgmask is None:
+                    self.stats["frames_prefiltered"] += 1
+                boxes = [(int(x * scale_back), int(y * scale_back), int(w * scale_back), int(h * scale_back), area)
+                         for x, y, w, h, area in small_boxes]
 
-            elif motion and not self.is_alarm_enabled():
-                # Alarma desactivada pero hay movimiento
-                if current_time - last_motion_print > motion_print_cooldown:
-                    print(" Movimiento detectado, pero alarma desactivada.")
-                    last_motion_print = current_time
+                if self.annotated_ring is not None:
+                    self._publish_annotated(small, fgmask, small_boxes, captured_at)
 
-            # Actualizar frame para streaming
             with self.lock:
-                self.frame = display_frame.copy()
-
-            frame_count += 1
-            time.sleep(0.03)
-
-        cap.release()
-
-    def get_frame(self):
+                self.motion_boxes = boxes
+
+            now = time.time()
+            self.stats["frames_processed"] += 1
+            self.stats["detection_ms"] = round((now - start) * 1000, 1)
+            self.stats.update({stage: round(ms, 1) for stage, ms in engine.timings.items()})
+            self.stats["latency_ms"] = round((now - captured_at) * 1000, 1)
+            self.stats["lag_frames"] = self.frame_ring.latest_seq - seq
+            if self.rate:
+                stride = self.rate.update(len(boxes) > 0, self.stats["lag_frames"])
+
+            # La lógica de alarma la decide quien consume el resultado
+            # La zona del evento es la del rectángulo más grande
+            zone = box_zones[max(range(len(boxes)), key=lambda i: boxes[i][4])] if boxes else -1
+
+            self.on_result({
+                "seq": seq,
+                "timestamp": captured_at,
+                "motion": len(boxes) > 0,
+                "boxes": boxes,
+                "zone": zone,
+            })
+
+    def _publish_annotated(self, small, fgmask, boxes, captured_at):
+        """Escribir en el ring anotado el frame de detección con máscara y rectángulos"""
+        slot, target = self.annotated_ring.begin_write()
+        if target is None or target.shape != small.shape:
+            # Primer frame o cambio de resolución: commit_write (re)crea el ring
+            self.annotated_ring.cancel_write(slot)
+            slot, target = None, np.empty_like(small)
+
+        # Píxeles en movimiento resaltados en rojo (sin máscara si el prefiltro descartó el frame)
+        np.copyto(target, small)
+        if fgmask is not None:
+            target[fgmask > 0, 2] = 255
+        if self.zones is not None:
+            height, width = target.shape[:2]
+            for zone in self.zones.zones:
+                color = (0, 255, 0) if zone.include else (128, 128, 128)
+                cv2.polylines(target, [self.zones.polygon(zone, width, height)], True, color, 1)
+        for x, y, w, h, area in boxes:
+            cv2.rectangle(target, (x, y), (x + w, y + h), (0, 0, 255), 2)
+            cv2.putText(target, f"Area: {area}", (x, y - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+        self.annotated_ring.commit_write(slot, target, captured_at)
+
+    def get_motion_boxes(self):
+        """Rectángulos de la última detección, en coordenadas del frame original"""
         with self.lock:
-            return self.frame.copy() if self.frame is not None else None
+            return list(self.motion_boxes)
+
+    def get_stats(self):
+        """Estadísticas del pipeline de captura/detección"""
+        stats = dict(self.stats)
+        if self.rate:
+            stats["rate"] = self.rate.get_stats()
+        return stats
 
     def stop(self):
         self.running = False
-        self.reset_alarm()
+        self.frame_ring.close()
         if self.thread.is_alive():
-            self.thread.join(timeout=5)
\ No newline at end of file
+            self.thread.join(timeout=5)
@@ -0,0 +1,108 @@
+"""Mover el átomo `moov` de un MP4 al principio del archivo ("fast start").
+
+cv2.VideoWriter escribe el índice (moov) al final, así que el navegador
+tiene que bajar todo el clip antes de poder reproducirlo o saltar a un
+punto. Con el moov primero alcanza con pedir rangos (HTTP Range) del mdat.
+Es Python puro: solo reescribe los offsets de las tablas stco/co64.
+"""
+import os
+import struct
+
+
+# Átomos que contienen otros átomos en el camino hasta las tablas de offsets
+_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts", b"dinf", b"mvex", b"udta"}
+
+
+def _top_level_atoms(f, file_size):
+    """[(tipo, offset, tamaño)] de los átomos de primer nivel"""
+    atoms = []
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+        elif size == 0:
+            size = file_size - offset
+        if size < 8:
+            raise ValueError(f"átomo {kind!r} inválido en {offset}")
+        atoms.append((kind, offset, size))
+        offset += size
+    return atoms
+
+
+def _shift_offsets(moov, start, end, delta):
+    """Sumar `delta` a los offsets de chunks (stco/co64) dentro de moov[start:end].
+
+    Devuelve False si algún offset de 32 bits se desbordaría.
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", moov, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", moov, offset + 8)[0]
+            header = 16
+        if size < header or offset + size > end:
+            raise ValueError(f"átomo {kind!r} inválido dentro de moov")
+
+        if kind in _CONTAINERS:
+            if not _shift_offsets(moov, offset + header, offset + size, delta):
+                return False
+        elif kind in (b"stco", b"co64"):
+            count = struct.unpack_from(">I", moov, offset + header + 4)[0]
+            table = offset + header + 8
+            width, fmt = (4, ">I") if kind == b"stco" else (8, ">Q")
+            for i in range(count):
+                position = table + i * width
+                value = struct.unpack_from(fmt, moov, position)[0] + delta
+                if kind == b"stco" and value > 0xFFFFFFFF:
+                    return False
+                struct.pack_into(fmt, moov, position, value)
+        offset += size
+    return True
+
+
+def faststart(path):
+    """Reescribir `path` con el moov al principio. Devuelve True si lo movió."""
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        atoms = _top_level_atoms(f, file_size)
+        kinds = [kind for kind, _, _ in atoms]
+        if b"moov" not in kinds or b"mdat" not in kinds or kinds.index(b"moov") < kinds.index(b"mdat"):
+            return False  # Ya está al principio (o no es un MP4 que sepamos mover)
+
+        _, moov_offset, moov_size = atoms[kinds.index(b"moov")]
+        f.seek(moov_offset)
+        moov = bytearray(f.read(moov_size))
+
+        # Todo lo que queda después del moov insertado se corre moov_size bytes
+        first_mdat = kinds.index(b"mdat")
+        if not _shift_offsets(moov, 8, len(moov), moov_size):
+            print(f"⚠️ {os.path.basename(path)}: offsets de 32 bits desbordados, se deja sin fast start")
+            return False
+
+        temp_path = path + ".faststart"
+        try:
+            with open(temp_path, "wb") as out:
+                for index, (kind, offset, size) in enumerate(atoms):
+                    if index == first_mdat:
+                        out.write(moov)
+                    if kind == b"moov":
+                        continue
+                    f.seek(offset)
+                    _copy(f, out, size)
+        except OSError:
+            os.remove(temp_path)
+            raise
+    os.replace(temp_path, path)
+    return True
+
+
+def _copy(src, dst, length, chunk=1024 * 1024):
+    while length > 0:
+        data = src.read(min(chunk, length))
+        if not data:
+            break
+        dst.write(data)
+        length -= len(data)
@@ -0,0 +1,182 @@
+import cv2
+import threading
+import time
+
+
+class FrameBroadcaster:
+    """Codifica cada frame nuevo a JPEG una sola vez por perfil y lo reparte a todos los clientes.
+
+    Un único thread espera frames nuevos en el FrameRing del detector; los
+    clientes de /video_feed se bloquean en una Condition hasta que hay un
+    JPEG con un número de secuencia mayor al último que recibieron. El costo
+    de CPU no crece con la cantidad de espectadores.
+
+    Los perfiles con `source: pre_event` no codifican nada: transmiten los
+    JPEGs que ya genera el buffer pre-evento comprimido (sin rectángulos).
+    Los clientes que no piden perfil usan `streaming.default_profile`: si es
+    uno de esos, los espectadores por defecto no cuestan ninguna codificación.
+    """
+
+    DEFAULT_PROFILE = "normal"
+
+    def __init__(self, detector, streaming_config: dict = None, encoded_buffer=None):
+        streaming_config = streaming_config or {}
+        self.detector = detector
+        self.encoded_buffer = encoded_buffer
+        self.target_fps = streaming_config.get("target_fps", 10)
+
+        # Perfil por defecto (claves de siempre) + perfiles adicionales opcionales
+        self.profiles = {
+            self.DEFAULT_PROFILE: {
+                "jpeg_quality": streaming_config.get("jpeg_quality", 60),
+                "max_width": streaming_config.get("max_width", 640),
+                "source": "live",
+            }
+        }
+        for name, profile in (streaming_config.get("profiles") or {}).items():
+            self.profiles[name] = {
+                "jpeg_quality": profile.get("jpeg_quality", 60),
+                "max_width": profile.get("max_width", 640),
+                "source": profile.get("source", "live"),
+            }
+
+        # Perfil compartido por todos los clientes que no eligen uno
+        self.default_profile = streaming_config.get("default_profile") or self.DEFAULT_PROFILE
+        if self.default_profile not in self.profiles:
+            print(f"⚠️ Perfil de streaming por defecto '{self.default_profile}' no existe, "
+                  f"se usa '{self.DEFAULT_PROFILE}'")
+            self.default_profile = self.DEFAULT_PROFILE
+
+        self.cond = threading.Condition()
+        self.latest = {name: (0, None) for name in self.profiles}  # perfil -> (seq, jpeg)
+        self.subscribers = {name: 0 for name in self.profiles}
+        self.running = True
+        self.stats = {"frames_encoded": 0, "encode_ms": 0.0}
+
+        self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self.thread.start()
+
+    def _shares_pre_event(self, name):
+        return self.encoded_buffer is not None and self.profiles[name]["source"] == "pre_event"
+
+    def _active_profiles(self):
+        """Perfiles con espectadores que este thread tiene que codificar"""
+        return [name for name, count in self.subscribers.items()
+                if count > 0 and not self._shares_pre_event(name)]
+
+    def _encode_loop(self):
+        frame_delay = 1.0 / self.target_fps
+        last_seq = 0
+        last_encode = 0
+
+        while self.running:
+            # Sin espectadores no se codifica nada
+            with self.cond:
+                self.cond.wait_for(lambda: not self.running or self._active_profiles())
+                if not self.running:
+                    break
+
+            # Limitar a target_fps (un solo thread, no por cliente)
+            remaining = frame_delay - (time.time() - last_encode)
+            if remaining > 0:
+                time.sleep(remaining)
+
+            ref = self.detector.frame_ring.wait_newer(last_seq)
+            if ref is None:
+                continue
+
+            start = time.time()
+            with ref:
+                last_seq = ref.seq
+                boxes = self.detector.get_motion_boxes()
+                with self.cond:
+                    active = self._active_profiles()
+                encoded = {name: self._encode(ref.frame, boxes, self.profiles[name]) for name in active}
+
+            last_encode = time.time()
+            with self.cond:
+                for name, jpeg in encoded.items():
+                    if jpeg is not None:
+                        self.latest[name] = (last_seq, jpeg)
+                self.stats["frames_encoded"] += 1
+                self.stats["encode_ms"] = round((last_encode - start) * 1000, 1)
+                self.cond.notify_all()
+
+    def _encode(self, frame, boxes, profile):
+        """Reducir, dibujar la detección y codificar. Nunca escribe sobre el frame del ring."""
+        max_width = profile["max_width"]
+        height, width = frame.shape[:2]
+        scale = 1.0
+        if width > max_width:
+            scale = max_width / width
+            frame = cv2.resize(frame, (max_width, int(height * scale)), interpolation=cv2.INTER_LINEAR)
+        elif boxes:
+            frame = frame.copy()
+
+        for x, y, w, h, area in boxes:
+            x, y, w, h = int(x * scale), int(y * scale), int(w * scale), int(h * scale)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
+            cv2.putText(frame, f"Area: {area}", (x, y - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+        success, buffer = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), profile["jpeg_quality"]])
+        return buffer.tobytes() if success else None
+
+    def subscribe(self, profile=None):
+        """Generador de JPEGs para un cliente. Bloquea hasta que hay un frame nuevo."""
+        if profile not in self.profiles:
+            profile = self.default_profile
+
+        with self.cond:
+            if self.subscribers[profile] == 0:
+                self.latest[profile] = (0, None)  # Descartar el JPEG viejo de la última sesión
+            self.subscribers[profile] += 1
+            self.cond.notify_all()
+
+        last_seq = 0
+        try:
+            if self._shares_pre_event(profile):
+                yield from self._subscribe_pre_event()
+                return
+            while self.running:
+                with self.cond:
+                    self.cond.wait_for(
+                        lambda: not self.running or self.latest[profile][0] > last_seq,
+                        timeout=5.0
+                    )
+                    seq, jpeg = self.latest[profile]
+                if seq <= last_seq or jpeg is None:
+                    continue
+                last_seq = seq
+                yield jpeg
+        finally:
+            with self.cond:
+                self.subscribers[profile] -= 1
+
+    def _subscribe_pre_event(self):
+        """JPEGs del buffer pre-evento, limitados a target_fps.
+
+        Se bloquea en la Condition del buffer hasta que llega un frame
+        capturado al menos 1/target_fps después del último enviado.
+        """
+        frame_delay = 1.0 / self.target_fps
+        last_seq = 0
+        last_timestamp = 0
+        while self.running:
+            item = self.encoded_buffer.wait_newer(last_seq, timeout=5.0, not_before=last_timestamp + frame_delay)
+            if item is None:
+                continue
+            last_seq = item.seq
+            last_timestamp = item.timestamp
+            yield item.jpeg
+
+    def get_stats(self):
+        with self.cond:
+            return dict(self.stats, subscribers=dict(self.subscribers))
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
@@ -1,80 +1,325 @@
 import requests
 from datetime import datetime
 import os
-import cv2
-import tempfile
+import queue
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from requests.adapters import HTTPAdapter
 
-def send_motion_alert(telegram_config, video_path=None):
-    """Envía notificación Completa"""
-    try:
-        token = telegram_config.get("token")
-        chat_id = telegram_config.get("chat_id", [])
 
-        if not token or not chat_id:
+DEFAULT_API_URL = "https://api.telegram.org"
+
+
+def _api_url(telegram_config, method):
+    base_url = telegram_config.get("api_url", DEFAULT_API_URL).rstrip("/")
+    return f"{base_url}/bot{telegram_config.get('token')}/{method}"
+
+
+def _file_id(result):
+    """file_id del video que devolvió Telegram (según el archivo puede venir como animation o document)"""
+    for key in ("video", "animation", "document"):
+        if isinstance(result, dict) and isinstance(result.get(key), dict) and result[key].get("file_id"):
+            return result[key]["file_id"]
+    return None
+
+
+_METHODS = {"message": "sendMessage", "video": "sendVideo", "edit": "editMessageText"}
+
+
+class _Job:
+    __slots__ = ("kind", "data", "path", "original", "queued_at", "pending", "done", "message_ids",
+                 "uploads", "bytes_uploaded", "file_id_sends")
+
+    def __init__(self, kind, data, path=None, original=None):
+        self.kind = kind          # "message", "video" o "edit"
+        self.data = data
+        self.path = path
+        self.original = original  # Mensaje que edita un "edit"
+        self.queued_at = time.time()
+        self.pending = 0          # Entregas (una por chat) que faltan terminar
+        self.done = threading.Event()
+        self.message_ids = {}     # chat_id -> message_id (para editarlo después)
+        self.uploads = 0          # Subidas completas del archivo (incluye reintentos)
+        self.bytes_uploaded = 0
+        self.file_id_sends = 0    # Chats atendidos reenviando el file_id
+
+
+class TelegramDispatcher:
+    """Envío de notificaciones de Telegram en segundo plano.
+
+    Las alertas entran a una cola acotada (si se llena se descartan y se
+    cuentan) y un thread las reparte: cada chat se atiende en paralelo desde
+    un pool de threads que comparte una sola requests.Session, así las
+    conexiones HTTPS se reutilizan. Un 429 respeta el `retry_after` de
+    Telegram; los 5xx y errores de red se reintentan con espera exponencial.
+
+    Los videos se suben una sola vez, al primer chat; al resto se les manda
+    el `file_id` que devolvió Telegram (si falla, se sube de nuevo). Cada
+    video deja un reporte de cuántos bytes se subieron y cuántos se ahorraron.
+
+    Las alertas las manda el IncidentCoalescer: send_message devuelve el
+    trabajo encolado y con edit_message se actualiza ese mismo mensaje en
+    cada chat (editMessageText) mientras dura el incidente.
+
+    Con `telegram.api_url` se puede apuntar a un servidor local que imite
+    la Bot API (pruebas).
+    """
+
+    LATENCY_SAMPLES = 200
+    VIDEO_REPORTS = 20
+
+    def __init__(self, telegram_config: dict):
+        self.config = telegram_config
+        self.chat_ids = list(telegram_config.get("chat_id") or [])
+        self.enabled = bool(telegram_config.get("enabled", False) and telegram_config.get("token") and self.chat_ids)
+        self.max_retries = telegram_config.get("max_retries", 4)
+        self.backoff = telegram_config.get("backoff_seconds", 1.0)
+        self.max_backoff = telegram_config.get("max_backoff_seconds", 30)
+        jobs_in_flight = telegram_config.get("jobs_in_flight", 4)
+        max_parallel = telegram_config.get("max_parallel", max(1, len(self.chat_ids)) * jobs_in_flight)
+
+        self.queue = queue.Queue(maxsize=telegram_config.get("queue_size", 50))
+        # Trabajos repartidos a la vez (un video lento no frena las alertas); el resto espera en la cola
+        self.inflight = threading.BoundedSemaphore(jobs_in_flight)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_parallel)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="telegram")
+        self.lock = threading.Lock()
+        self.running = True
+        self.stats = {"queued": 0, "dropped": 0, "sent": 0, "failed": 0, "retries": 0,
+                      "file_id_sent": 0, "file_id_fallbacks": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+        self.video_reports = deque(maxlen=self.VIDEO_REPORTS)
+        self.latencies = {kind: deque(maxlen=self.LATENCY_SAMPLES) for kind in _METHODS}
+
+        if self.enabled:
+            self.thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+            self.thread.start()
+        elif telegram_config.get("enabled", False):
             print("⚠️ Token o Chat ID de Telegram no configurados")
-            return False
 
-        # Mensaje de alerta
+    # --- API ----------------------------------------------------------
+
+    def send_message(self, text, parse_mode="Markdown"):
+        """Encolar un mensaje. Devuelve el trabajo (para edit_message) o None si no se encoló."""
+        return self._enqueue(_Job("message", {"text": text, "parse_mode": parse_mode}))
+
+    def edit_message(self, original, text, parse_mode="Markdown"):
+        """Reemplazar el texto de un mensaje ya encolado con send_message"""
+        if original is None:
+            return None
+        return self._enqueue(_Job("edit", {"text": text, "parse_mode": parse_mode}, original=original))
+
+    def send_video(self, video_path, duration=None):
+        """Encolar el video de un incidente ya avisado con send_message"""
+        if not video_path or not os.path.exists(video_path):
+            return None
+        if os.path.getsize(video_path) / (1024 * 1024) > 50:
+            print("⚠️ Video muy grande (>50MB), Telegram no lo aceptará")
+            return None
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        message = f"🚨 *ALARMA ACTIVADA*\n\n"
-        message += f"⏰ Hora: {timestamp}\n"
-        message += f"📹 Movimiento detectado en la cámara\n"
-        message += f"🎥 Enviando video...\n"
-        message += f"🏠 Sistema de Vigilancia"
+        return self._enqueue(_Job("video", {
+            "caption": f' Grabación: {timestamp}\n Duración {duration}s',
+            "supports_streaming": True,
+        }, path=video_path))
 
-        # Enviar mensaje
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        success_count = 0
+    def _enqueue(self, job):
+        if not self.enabled:
+            return None
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                self.stats["dropped"] += 1
+            print(f"⚠️ Cola de Telegram llena: se descarta {job.kind}")
+            return None
+        with self.lock:
+            self.stats["queued"] += 1
+        return job
 
-        for chat_ids in chat_id:
-            data = {
-                "chat_id": chat_ids,
-                "text": message,
-                "parse_mode": "Markdown"
-            }
+    # --- Envío --------------------------------------------------------
 
-            response = requests.post(url, data=data, timeout=10)
-            if response.status_code == 200:
-                print(f"✅ Notificación enviada a chat_id {chat_ids}")
-                success_count += 1
+    def _dispatch_loop(self):
+        while self.running:
+            try:
+                job = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self.inflight.acquire()
+            job.pending = len(self.chat_ids)
+            if job.kind == "video" and len(self.chat_ids) > 1:
+                self.pool.submit(self._upload_and_fan_out, job)
             else:
-                print(f"❌ Error enviando a {chat_ids}: {response.status_code} - {response.text}")
+                for chat_id in self.chat_ids:
+                    self.pool.submit(self._deliver_and_release, job, chat_id)
 
-            if video_path and os.path.exists(video_path):
-                try:
-                    video_size_mb = os.path.getsize(video_path) / (1024 * 1024)
+    def _upload_and_fan_out(self, job):
+        """Subir el video al primer chat y mandar su file_id a los demás"""
+        first, others = self.chat_ids[0], self.chat_ids[1:]
+        file_id = None
+        try:
+            file_id = _file_id(self._deliver(job, first))
+        finally:
+            # Sin file_id (falló la subida) cada chat sube el archivo por su cuenta
+            for chat_id in others:
+                self.pool.submit(self._deliver_and_release, job, chat_id, file_id)
+            self._finish(job)
 
-                    if video_size_mb > 50:
-                        print("⚠️ Video muy grande (>50MB), Telegram no lo aceptará")
-                        return False
+    def _deliver_and_release(self, job, chat_id, file_id=None):
+        try:
+            self._deliver(job, chat_id, file_id)
+        finally:
+            self._finish(job)
 
-                    url_video = f"https://api.telegram.org/bot{token}/sendVideo"
-                    with open(video_path, 'rb') as video_file:
-                        files = {'video': video_file}
-                        data_video = {
-                            'chat_id': chat_ids,
-                            'caption': f' Grabación: {timestamp}\n Duración 5s',
-                            'supports_streaming': True
-                        }
-                        response_video = requests.post(url_video, data=data_video, files=files, timeout=120)
+    def _finish(self, job):
+        with self.lock:
+            job.pending -= 1
+            done = job.pending == 0
+        if done:
+            if job.kind == "video":
+                self._report_video(job)
+            job.done.set()
+            self.inflight.release()
 
-                    if response_video.status_code == 200:
-                        print(" Video Enviado")
-                    else:
-                        print(f" Error al enviar video: {response_video.status_code}")
+    def _deliver(self, job, chat_id, file_id=None):
+        """Entregar a un chat. Devuelve el `result` de Telegram o None si falló."""
+        url = _api_url(self.config, _METHODS[job.kind])
+        data = dict(job.data, chat_id=chat_id)
+        if file_id:
+            data["video"] = file_id
+        if job.kind == "edit":
+            # El original salió antes de la cola (FIFO): esperar a que termine de entregarse
+            job.original.done.wait(timeout=120)
+            message_id = job.original.message_ids.get(chat_id)
+            if message_id is None:
+                return None  # El mensaje original no llegó a este chat: no hay nada que editar
+            data["message_id"] = message_id
+        error = None
 
-                except Exception as e:
-                    print(f"❌ Error enviando video: {e}")
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                if job.kind == "video" and not file_id:
+                    with open(job.path, 'rb') as video_file:
+                        size = os.fstat(video_file.fileno()).st_size
+                        with self.lock:
+                            job.uploads += 1
+                            job.bytes_uploaded += size
+                        response = self.session.post(url, data=data, files={'video': video_file}, timeout=(10, 120))
+                else:
+                    response = self.session.post(url, data=data, timeout=10)
+            except requests.RequestException as e:
+                error = str(e)
+            except OSError as e:
+                error = f"no se pudo leer {job.path}: {e}"
+                break
+            else:
+                if response.status_code == 200:
+                    latency = time.time() - job.queued_at
+                    with self.lock:
+                        self.stats["sent"] += 1
+                        self.latencies[job.kind].append(latency)
+                        if file_id:
+                            job.file_id_sends += 1
+                            self.stats["file_id_sent"] += 1
+                    try:
+                        result = response.json().get("result") or {}
+                    except ValueError:
+                        result = {}
+                    if job.kind == "message" and isinstance(result, dict) and result.get("message_id"):
+                        with self.lock:
+                            job.message_ids[chat_id] = result["message_id"]
+                    if job.kind != "edit":
+                        what = "Video enviado" if job.kind == "video" else "Notificación enviada"
+                        print(f"✅ {what} a chat_id {chat_id}{' (file_id)' if file_id else ''} ({latency:.1f}s)")
+                    return result
+                if job.kind == "edit" and "message is not modified" in response.text:
+                    return {}  # Mismo texto que ya tenía: nada que hacer
+                error = f"{response.status_code} - {response.text[:200]}"
+                if response.status_code == 429:
+                    retry_after = self._retry_after(response)
+                elif response.status_code < 500:
+                    break  # Error del pedido (chat inválido, token...): no tiene sentido reintentar
 
+            if attempt == self.max_retries or not self.running:
+                break
+            delay = retry_after if retry_after is not None else min(self.max_backoff, self.backoff * 2 ** attempt)
+            with self.lock:
+                self.stats["retries"] += 1
+            print(f"⚠️ Telegram a {chat_id}: {error}. Reintento en {delay:.0f}s")
+            time.sleep(delay)
 
-        print(f"📬 Enviadas correctamente {success_count}/{len(chat_id)} notificaciones")
-        return success_count > 0
+        if file_id and self.running:
+            # file_id rechazado (o vencido): se sube el archivo como siempre
+            with self.lock:
+                self.stats["file_id_fallbacks"] += 1
+            print(f"⚠️ file_id no aceptado por {chat_id} ({error}), se sube el video")
+            return self._deliver(job, chat_id)
 
-    except Exception as e:
-        print(f"❌ Error en Telegram: {e}")
-        return False
+        with self.lock:
+            self.stats["failed"] += 1
+        print(f"❌ Error enviando a {chat_id}: {error}")
+        return None
+
+    def _retry_after(self, response):
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            value = response.headers.get("Retry-After")
+            return float(value) if value and value.isdigit() else None
+
+    def _report_video(self, job):
+        """Ancho de banda usado por un video frente a subirlo a cada chat"""
+        try:
+            size = os.path.getsize(job.path)
+        except OSError:
+            size = job.bytes_uploaded // max(1, job.uploads)
+        saved = max(0, size * len(self.chat_ids) - job.bytes_uploaded)
+        report = {
+            "file": os.path.basename(job.path),
+            "time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "chats": len(self.chat_ids),
+            "uploads": job.uploads,
+            "file_id_sends": job.file_id_sends,
+            "size_mb": round(size / (1024 * 1024), 2),
+            "uploaded_mb": round(job.bytes_uploaded / (1024 * 1024), 2),
+            "saved_mb": round(saved / (1024 * 1024), 2),
+        }
+        with self.lock:
+            self.stats["bytes_uploaded"] += job.bytes_uploaded
+            self.stats["bytes_saved"] += saved
+            self.video_reports.append(report)
+        print(f"📦 {report['file']}: {report['uploaded_mb']} MB subidos para {report['chats']} chats "
+              f"({report['uploads']} subidas, {report['file_id_sends']} por file_id, "
+              f"{report['saved_mb']} MB ahorrados)")
+
+    # --- Métricas -----------------------------------------------------
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            latencies = {kind: sorted(values) for kind, values in self.latencies.items()}
+            stats["videos"] = list(self.video_reports)
+        stats["enabled"] = self.enabled
+        stats["pending"] = self.queue.qsize()
+        stats["latency"] = {
+            kind: {
+                "avg_s": round(sum(values) / len(values), 2),
+                "p95_s": round(values[int(0.95 * (len(values) - 1))], 2),
+                "max_s": round(values[-1], 2),
+            } if values else {}
+            for kind, values in latencies.items()
+        }
+        return stats
+
+    def stop(self):
+        self.running = False
+        self.pool.shutdown(wait=False)
+        self.session.close()
 
 
 def send_custom_message(telegram_config, message):
@@ -86,7 +331,7 @@ def send_custom_message(telegram_config, message):
         if not token or not chat_id:
             return False
 
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
+        url = _api_url(telegram_config, "sendMessage")
         success = True
 
         for chat in chat_id:
@@ -107,4 +352,4 @@ def send_custom_message(telegram_config, message):
 
     except Exception as e:
         print(f"❌ Error en Telegram: {e}")
-        return False
\ No newline at end of file
+        return False
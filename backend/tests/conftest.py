@@ -0,0 +1,8 @@
+"""Pruebas offline: sin cámaras, GPIO ni Telegram reales.
+
+Se corren desde backend/ con `python -m pytest tests`.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from camera_manager import CameraManager
+
+
+def _video(path, size, frames=45, fps=15):
+    """Archivo de video local con un cuadrado que cruza la imagen (hace de cámara)"""
+    width, height = size
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    side = height // 4
+    for n in range(frames):
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        x = int(n * (width - side) / frames)
+        frame[height // 3:height // 3 + side, x:x + side] = 255
+        out.write(frame)
+    out.release()
+    return str(path)
+
+
+def _config(cameras):
+    return {
+        "camera": {"fps": 15, "loop": True},
+        "detection": {"min_area": 50},
+        "recording": {"max_buffer_seconds": 2},
+        "cameras": cameras,
+    }
+
+
+def _wait(condition, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def _run(config, check):
+    results = {}
+    lock = threading.Lock()
+
+    def on_result(camera, result):
+        with lock:
+            results.setdefault(camera.cam_id, []).append(result)
+
+    manager = CameraManager(config, on_result=on_result)
+    try:
+        return check(manager, results)
+    finally:
+        manager.stop()
+
+
+def test_una_pipeline_por_camara_con_archivos(tmp_path):
+    """Dos archivos locales hacen de cámaras: cada una con sus procesos, su ring y sus detecciones"""
+    config = _config([
+        {"id": "a", "name": "A", "rtsp_url": _video(tmp_path / "a.mp4", (320, 240))},
+        {"id": "b", "name": "B", "rtsp_url": _video(tmp_path / "b.mp4", (160, 120))},
+    ])
+
+    def check(manager, results):
+        assert [camera.cam_id for camera in manager.list()] == ["a", "b"]
+        assert _wait(lambda: all(any(r["motion"] for r in results.get(cam_id, [])) for cam_id in ("a", "b")))
+        a, b = manager.get("a"), manager.get("b")
+        assert a.capture_process.pid != b.capture_process.pid
+        assert a.detection_process.pid != b.detection_process.pid
+        with a.get_frame() as frame_a, b.get_frame() as frame_b:
+            assert frame_a.frame.shape == (240, 320, 3)
+            assert frame_b.frame.shape == (120, 160, 3)
+
+    _run(config, check)
+
+
+def test_doble_stream_con_archivos_de_distinta_resolucion(tmp_path):
+    """El sub-stream chico alimenta la detección y el principal, grande, solo el buffer pre-evento"""
+    config = _config([{
+        "id": "dual",
+        "detection_url": _video(tmp_path / "sub.mp4", (160, 120)),
+        "recording_url": _video(tmp_path / "main.mp4", (640, 480)),
+        "recording_decode": "always",
+    }])
+
+    def check(manager, results):
+        camera = manager.get("dual")
+        assert camera.dual_stream
+        assert _wait(lambda: any(r["motion"] for r in results.get("dual", []))
+                     and camera.recording_ring.latest_seq > 0)
+        with camera.get_frame() as detection_frame, camera.recording_ring.latest() as recording_frame:
+            assert detection_frame.frame.shape == (120, 160, 3)
+            assert recording_frame.frame.shape == (480, 640, 3)
+        # Los clips salen del stream principal (una vez que tiene 2 s de frames)
+        assert _wait(lambda: camera.recording_ring.latest_seq > 45)
+        source, refs = camera.video_recorder.snapshot(3)
+        try:
+            assert source is camera.recording_ring and refs
+        finally:
+            for ref in refs:
+                ref.release()
+
+    _run(config, check)
+
+
+def test_stream_principal_solo_con_alarma_armada(tmp_path):
+    """Con recording_decode: "armed" el principal no se decodifica hasta armar la alarma"""
+    armed = threading.Event()
+    config = _config([{
+        "id": "dual",
+        "detection_url": _video(tmp_path / "sub.mp4", (160, 120)),
+        "recording_url": _video(tmp_path / "main.mp4", (640, 480)),
+    }])
+    results = []
+    manager = CameraManager(config, on_result=lambda camera, result: results.append(result),
+                            is_armed=armed.is_set)
+    try:
+        camera = manager.get("dual")
+        assert _wait(lambda: len(results) > 10)
+        assert camera.recording_ring.latest_seq == 0
+        armed.set()
+        assert _wait(lambda: camera.recording_ring.latest_seq > 0)
+    finally:
+        manager.stop()
@@ -0,0 +1,45 @@
+import threading
+import time
+
+import numpy as np
+
+from event_recorder import EventRecorder
+from frame_ring import FrameRing
+from video_recorder import VideoRecorder
+
+
+def _capture(ring, stop, fps):
+    """Captura simulada: un frame nuevo cada 1/fps con begin_write/commit_write"""
+    n = 0
+    while not stop.is_set():
+        slot, target = ring.begin_write()
+        frame = target if target is not None else np.empty((1080, 1920, 3), dtype=np.uint8)
+        frame[:] = n % 255
+        ring.commit_write(slot, frame)
+        n += 1
+        time.sleep(1 / fps)
+
+
+def test_pre_roll_no_retiene_el_ring(tmp_path):
+    """Grabar un clip desde un ring lleno hasta el presupuesto no deja a la captura sin slots"""
+    fps = 15
+    frame_mb = 1080 * 1920 * 3 / (1024 * 1024)
+    ring = FrameRing(num_slots=200, max_mb=frame_mb * 24)  # ~24 slots: menos que el pre-roll pedido
+    recorder = VideoRecorder(ring, fps=fps, max_buffer_seconds=5, encoder_config={"encoder": "opencv"})
+    events = EventRecorder(recorder, {"pre_roll_seconds": 5, "post_roll_seconds": 1, "max_clip_seconds": 3,
+                                      "clips_dir": str(tmp_path)}, name="test")
+
+    stop = threading.Event()
+    capture = threading.Thread(target=_capture, args=(ring, stop, fps), daemon=True)
+    capture.start()
+    try:
+        time.sleep(2)  # Llenar el ring
+        assert ring.num_slots < 5 * fps
+        path, seconds = events.record()
+    finally:
+        stop.set()
+        capture.join()
+
+    assert path is not None and seconds > 0
+    assert ring.overruns == 0
+    assert ring.get_stats()["slots_in_use"] == 0
@@ -0,0 +1,88 @@
+import multiprocessing as mp
+
+import numpy as np
+
+from frame_ring import FrameRing
+
+
+def _frame(value, shape=(4, 6, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_escritura_y_snapshot_en_orden():
+    ring = FrameRing(num_slots=4)
+    assert ring.begin_write() == (None, None)  # Sin buffer hasta conocer la forma del frame
+    ring.commit_write(None, _frame(1))
+    for value in range(2, 4):
+        slot, target = ring.begin_write()
+        target[:] = value  # Escritura directa en el slot (sin copia)
+        ring.commit_write(slot, target)
+
+    refs = ring.snapshot()
+    try:
+        assert [ref.seq for ref in refs] == [1, 2, 3]
+        assert [int(ref.frame[0, 0, 0]) for ref in refs] == [1, 2, 3]
+        assert not refs[0].frame.flags.writeable
+    finally:
+        for ref in refs:
+            ref.release()
+    assert ring.get_stats()["slots_in_use"] == 0
+
+
+def test_slot_referenciado_no_se_sobreescribe():
+    ring = FrameRing(num_slots=3)
+    ring.commit_write(None, _frame(1))
+    held = ring.latest()
+    for value in range(2, 10):
+        ring.commit_write(None, _frame(value))
+    assert int(held.frame[0, 0, 0]) == 1 and held.seq == 1
+    held.release()
+    assert ring.overruns == 0
+
+
+def test_overrun_si_todos_los_slots_estan_tomados():
+    ring = FrameRing(num_slots=3)
+    for value in range(3):
+        ring.commit_write(None, _frame(value))
+    refs = ring.snapshot()
+    assert ring.commit_write(None, _frame(9)) is None
+    assert ring.overruns == 1
+    for ref in refs:
+        ref.release()
+    assert ring.commit_write(None, _frame(9)) == 4
+
+
+def test_presupuesto_limita_los_slots():
+    frame_mb = 100 * 100 * 3 / (1024 * 1024)
+    ring = FrameRing(num_slots=50, max_mb=frame_mb * 10)
+    ring.commit_write(None, _frame(1, (100, 100, 3)))
+    assert ring.num_slots < 10
+    assert ring.get_stats()["wanted_slots"] == 50
+
+
+def _read_shared(name, shape, slots, cond, results):
+    ring = FrameRing(slots, cond=cond)
+    ring.attach(name, shape, slots)
+    ref = ring.wait_newer(0, timeout=5)
+    results.put((ref.seq, int(ref.frame[0, 0, 0])) if ref else None)
+    if ref:
+        ref.release()
+    ring.destroy()
+
+
+def test_memoria_compartida_entre_procesos():
+    """Otro proceso abre el ring con attach() y lee el mismo slot sin copiar píxeles"""
+    ctx = mp.get_context("fork")
+    cond = ctx.Condition()
+    allocated = []
+    ring = FrameRing(4, cond=cond, shared=True, on_allocate=lambda *info: allocated.append(info))
+    try:
+        ring.commit_write(None, _frame(42))
+        results = ctx.Queue()
+        name, shape, slots = allocated[0]
+        reader = ctx.Process(target=_read_shared, args=(name, shape, slots, cond, results))
+        reader.start()
+        assert results.get(timeout=10) == (1, 42)
+        reader.join(timeout=5)
+    finally:
+        ring.destroy(unlink=True)
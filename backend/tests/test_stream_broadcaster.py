@@ -0,0 +1,103 @@
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from encoded_buffer import EncodedFrameBuffer
+from frame_ring import FrameRing
+from stream_broadcaster import FrameBroadcaster
+
+
+class _Camera:
+    """Lo que FrameBroadcaster usa del detector: el ring y los rectángulos"""
+
+    def __init__(self, ring):
+        self.frame_ring = ring
+
+    def get_motion_boxes(self):
+        return []
+
+
+def _feed(ring, stop, fps=30):
+    for n in itertools.count():
+        if stop.is_set():
+            break
+        ring.commit_write(None, np.full((120, 160, 3), n % 255, dtype=np.uint8))
+        time.sleep(1 / fps)
+
+
+def _read(broadcaster, frames, results, profile=None):
+    stream = broadcaster.subscribe(profile)
+    results.append([next(stream) for _ in range(frames)])
+    stream.close()
+
+
+def _run_viewers(broadcaster, ring, viewers, frames=5, profile=None):
+    stop = threading.Event()
+    feeder = threading.Thread(target=_feed, args=(ring, stop), daemon=True)
+    feeder.start()
+    results = []
+    threads = [threading.Thread(target=_read, args=(broadcaster, frames, results, profile)) for _ in range(viewers)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+    finally:
+        stop.set()
+        feeder.join()
+    return results
+
+
+def test_perfil_por_defecto_reutiliza_el_buffer_pre_evento():
+    """Sin ?perfil= los clientes van al perfil por defecto; si es pre_event no se codifica nada"""
+    ring = FrameRing(num_slots=16)
+    buffer = EncodedFrameBuffer(ring, max_seconds=5)
+    broadcaster = FrameBroadcaster(_Camera(ring), {
+        "target_fps": 30,
+        "default_profile": "grabacion",
+        "profiles": {"grabacion": {"source": "pre_event"}},
+    }, encoded_buffer=buffer)
+    try:
+        results = _run_viewers(broadcaster, ring, viewers=5)
+        assert len(results) == 5 and all(len(jpegs) == 5 for jpegs in results)
+        assert broadcaster.stats["frames_encoded"] == 0
+        assert broadcaster.get_stats()["subscribers"]["grabacion"] == 0
+    finally:
+        broadcaster.stop()
+        buffer.stop()
+        ring.close()
+
+
+def test_espectadores_comparten_una_codificacion():
+    """N clientes del perfil por defecto reciben los mismos JPEG, codificados una sola vez"""
+    ring = FrameRing(num_slots=16)
+    broadcaster = FrameBroadcaster(_Camera(ring), {"target_fps": 30})
+    try:
+        results = _run_viewers(broadcaster, ring, viewers=5)
+        assert len(results) == 5
+        jpegs = {jpeg for stream in results for jpeg in stream}
+        assert broadcaster.stats["frames_encoded"] <= len(jpegs) + 5
+    finally:
+        broadcaster.stop()
+        ring.close()
+
+
+def test_pre_evento_limita_fps_esperando_al_buffer():
+    """El perfil pre_event respeta target_fps aunque el buffer reciba más frames"""
+    ring = FrameRing(num_slots=16)
+    buffer = EncodedFrameBuffer(ring, max_seconds=5)
+    broadcaster = FrameBroadcaster(_Camera(ring), {
+        "target_fps": 5,
+        "profiles": {"grabacion": {"source": "pre_event"}},
+    }, encoded_buffer=buffer)
+    try:
+        start = time.time()
+        _run_viewers(broadcaster, ring, viewers=1, frames=6, profile="grabacion")
+        # 6 frames a 5 FPS: al menos 5 intervalos de 0.2 s (el feed va a 30 FPS)
+        assert time.time() - start >= 0.9
+    finally:
+        broadcaster.stop()
+        buffer.stop()
+        ring.close()
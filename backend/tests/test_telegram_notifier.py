@@ -0,0 +1,145 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from telegram_notifier import TelegramDispatcher
+
+
+class _BotAPI(ThreadingHTTPServer):
+    """Servidor local que imita la Bot API: registra cada pedido y puede fallar a pedido"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.requests = []
+        self.failures = {}           # método -> [códigos a devolver antes del 200]
+        self.reject_file_id = set()  # chats que no aceptan el file_id
+        self.lock = threading.Lock()
+        self.next_message_id = 100
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def calls(self, method):
+        with self.lock:
+            return [r for r in self.requests if r["method"] == method]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Type", "").startswith("multipart/"):
+            fields = dict(re.findall(rb'name="(\w+)"\r\n\r\n([^\r]*)\r\n', body))
+            data = {k.decode(): v.decode() for k, v in fields.items()}
+            upload = b'name="video"; filename=' in body
+        else:
+            data = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+            upload = False
+
+        server = self.server
+        with server.lock:
+            server.requests.append({"method": method, "data": data, "upload": upload})
+            pending = server.failures.get(method) or []
+            status = pending.pop(0) if pending else 200
+            if method == "sendVideo" and not upload and data.get("chat_id") in server.reject_file_id:
+                status = 400
+            server.next_message_id += 1
+            message_id = server.next_message_id
+
+        if status == 200:
+            result = {"message_id": message_id}
+            if method == "sendVideo":
+                result["video"] = {"file_id": "FILE123"}
+            payload = {"ok": True, "result": result}
+        elif status == 429:
+            payload = {"ok": False, "description": "Too Many Requests", "parameters": {"retry_after": 0}}
+        else:
+            payload = {"ok": False, "description": f"error {status}"}
+        raw = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+@pytest.fixture
+def bot_api():
+    server = _BotAPI()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dispatcher(bot_api):
+    notifier = TelegramDispatcher({
+        "enabled": True,
+        "token": "TEST",
+        "chat_id": ["1", "2", "3"],
+        "api_url": bot_api.url,
+        "backoff_seconds": 0.01,
+    })
+    yield notifier
+    notifier.stop()
+
+
+def test_mensaje_a_todos_los_chats_con_reintentos(bot_api, dispatcher):
+    """429 (respeta retry_after) y 5xx (espera exponencial) se reintentan hasta entregar"""
+    bot_api.failures["sendMessage"] = [429, 502]
+    job = dispatcher.send_message("hola")
+    assert job.done.wait(10)
+
+    chats = [r["data"]["chat_id"] for r in bot_api.calls("sendMessage")]
+    assert len(chats) == 5 and set(chats) == {"1", "2", "3"}
+    stats = dispatcher.get_stats()
+    assert stats["sent"] == 3 and stats["retries"] == 2 and stats["failed"] == 0
+    assert stats["latency"]["message"]
+    assert set(job.message_ids) == {"1", "2", "3"}
+
+
+def test_editar_usa_el_message_id_de_cada_chat(bot_api, dispatcher):
+    original = dispatcher.send_message("en curso")
+    edit = dispatcher.edit_message(original, "terminado")
+    assert edit.done.wait(10)
+
+    edits = {r["data"]["chat_id"]: int(r["data"]["message_id"]) for r in bot_api.calls("editMessageText")}
+    assert edits == original.message_ids
+
+
+def test_video_se_sube_una_vez_y_se_reparte_por_file_id(bot_api, dispatcher, tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"\0" * 100_000)
+    job = dispatcher.send_video(str(video), duration=3)
+    assert job.done.wait(10)
+
+    sends = bot_api.calls("sendVideo")
+    assert sum(r["upload"] for r in sends) == 1
+    by_file_id = [r["data"] for r in sends if not r["upload"]]
+    assert sorted(data["chat_id"] for data in by_file_id) == ["2", "3"]
+    assert all(data["video"] == "FILE123" for data in by_file_id)
+    report = dispatcher.get_stats()["videos"][-1]
+    assert report["uploads"] == 1 and report["file_id_sends"] == 2
+
+
+def test_file_id_rechazado_vuelve_a_subir(bot_api, dispatcher, tmp_path):
+    bot_api.reject_file_id.add("3")
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"\0" * 10_000)
+    job = dispatcher.send_video(str(video))
+    assert job.done.wait(10)
+
+    uploads = sorted(r["data"]["chat_id"] for r in bot_api.calls("sendVideo") if r["upload"])
+    assert uploads == ["1", "3"]
+    stats = dispatcher.get_stats()
+    assert stats["file_id_fallbacks"] == 1 and stats["failed"] == 0
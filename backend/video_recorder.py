@@ -1,120 +1,78 @@
-import cv2
-import threading
 import time
-import os
-from datetime import datetime
 
+from clip_encoder import TELEGRAM_LIMIT_MB, open_clip_writer
 
-class VideoRecorder:
-    def __init__(self):
-        self.is_recording = False
-        self.frames_buffer = []
-        self.buffer_lock = threading.Lock()
-        self.max_buffer_seconds = 15  # Buffer de 15 segundos
-        self.fps = 10
-        self.max_frames = self.fps * self.max_buffer_seconds
-
-    def add_frame(self, frame):
-        """Agregar frame al buffer circular"""
-        with self.buffer_lock:
-            self.frames_buffer.append(frame.copy())
-            # Mantener solo los últimos X segundos
-            if len(self.frames_buffer) > self.max_frames:
-                self.frames_buffer.pop(0)
-
-    def record_motion_video(self, duration=5):
-        """Grabar video de X segundos y retornar la ruta"""
-        try:
-            print(f"🎥 Iniciando grabación de {duration} segundos...")
-
-            # Crear nombre de archivo único
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_path = f"/tmp/motion_{timestamp}.mp4"
-
-            # Obtener frames del buffer (los últimos X segundos)
-            with self.buffer_lock:
-                if len(self.frames_buffer) == 0:
-                    print("⚠️ No hay frames en el buffer")
-                    return None
-
-                # Tomar frames para el video
-                frames_to_save = self.frames_buffer[-int(self.fps * duration):]
-
-                if len(frames_to_save) < self.fps * 2:  # Al menos 2 segundos
-                    print("⚠️ No hay suficientes frames para grabar")
-                    return None
-
-                # Obtener dimensiones del primer frame
-                height, width = frames_to_save[0].shape[:2]
-
-            # Configurar el writer de video con H.264 (mejor compresión)
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec MP4
-            out = cv2.VideoWriter(output_path, fourcc, self.fps, (width, height))
-
-            if not out.isOpened():
-                print("❌ Error al crear archivo de video")
-                return None
-
-            # Escribir frames al video
-            frames_written = 0
-            for frame in frames_to_save:
-                out.write(frame)
-                frames_written += 1
-
-            out.release()
 
-            # Verificar que el archivo se creó
-            if os.path.exists(output_path):
-                file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-                print(f"✅ Video grabado: {output_path}")
-                print(f"📹 Frames: {frames_written} | Tamaño: {file_size_mb:.2f} MB")
-
-                # Si es muy grande, intentar reducir calidad
-                if file_size_mb > 50:
-                    print("⚠️ Video muy grande, comprimiendo...")
-                    compressed_path = self._compress_video(output_path)
-                    if compressed_path:
-                        os.remove(output_path)
-                        return compressed_path
-
-                return output_path
-            else:
-                print("❌ El archivo de video no se creó correctamente")
-                return None
-
-        except Exception as e:
-            print(f"❌ Error grabando video: {e}")
-            return None
-
-    def _compress_video(self, input_path):
-        """Comprimir video si es muy grande"""
-        try:
-            output_path = input_path.replace(".mp4", "_compressed.mp4")
-
-            cap = cv2.VideoCapture(input_path)
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-
-            # Reducir resolución a 640x480
-            out = cv2.VideoWriter(output_path, fourcc, self.fps, (640, 480))
-
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                # Reducir resolución
-                frame_resized = cv2.resize(frame, (640, 480))
-                out.write(frame_resized)
-
-            cap.release()
-            out.release()
-
-            if os.path.exists(output_path):
-                new_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-                print(f"✅ Video comprimido: {new_size_mb:.2f} MB")
-                return output_path
-
-            return None
-
-        except Exception as e:
-            print(f"❌ Error comprimiendo video: {e}")
-            return None
\ No newline at end of file
+class VideoRecorder:
+    MAX_BUFFER_SECONDS = 15  # Buffer de 15 segundos
+
+    def __init__(self, frame_ring=None, fps=10, fallback_ring=None, max_buffer_seconds=None,
+                 encoded_buffer=None, encoder_config=None):
+        # El buffer pre-evento es el FrameRing compartido: no se guardan copias propias
+        self.frame_ring = frame_ring
+        # Ring alternativo (sub-stream) si el stream principal no está decodificando
+        self.fallback_ring = fallback_ring
+        # Buffer pre-evento comprimido (JPEG); si existe es la primera fuente de los clips
+        self.encoded_buffer = encoded_buffer
+        # Sección `recording:` (codificador y tamaño objetivo de los clips)
+        self.encoder_config = encoder_config or {}
+        self.max_buffer_seconds = max_buffer_seconds or self.MAX_BUFFER_SECONDS
+        self.fps = fps
+
+    def open_writer(self, output_path, fps, frame_size, max_seconds):
+        """Escritor de una sola pasada planeado para que `max_seconds` entren en el tamaño objetivo"""
+        return open_clip_writer(output_path, fps, frame_size, max_seconds, self.encoder_config)
+
+    def check_size(self, file_size_mb):
+        if file_size_mb > TELEGRAM_LIMIT_MB:
+            print(f"⚠️ El clip ocupa {file_size_mb:.1f} MB: bajar recording.target_mb "
+                  f"o usar el codificador ffmpeg")
+
+    def get_stats(self):
+        """Memoria real del buffer pre-evento y cuántos segundos entran"""
+        if self.encoded_buffer is not None:
+            buffer = self.encoded_buffer.get_stats()
+            return {
+                "format": "jpeg",
+                "buffer_mb": buffer["memory_mb"],
+                "budget_mb": buffer["budget_mb"],
+                "buffer_seconds": buffer["buffer_seconds"],
+                "wanted_seconds": self.max_buffer_seconds,
+                "avg_frame_kb": buffer["avg_frame_kb"],
+                "frames_missed": buffer["frames_missed"],
+                "degraded": buffer["evicted_by_budget"] > 0,
+            }
+        if self.frame_ring is None:
+            return {}
+        ring = self.frame_ring.get_stats()
+        seconds = max(0, ring["slots"] - self.frame_ring.EXTRA_SLOTS) / self.fps
+        return {
+            "format": "raw",
+            "buffer_mb": ring["memory_mb"],
+            "budget_mb": ring["budget_mb"],
+            "buffer_seconds": round(seconds, 1),
+            "wanted_seconds": self.max_buffer_seconds,
+            # Con el presupuesto recortado el pre-evento es más corto que lo configurado
+            "degraded": ring["memory_mb"] > 0 and seconds < self.max_buffer_seconds,
+        }
+
+    def clip_fps(self, refs):
+        """FPS real de los frames (con la captura adaptativa puede haber menos de `fps` por segundo)"""
+        span = refs[-1].timestamp - refs[0].timestamp if len(refs) > 1 else 0
+        return min(self.fps, max(1, round((len(refs) - 1) / span))) if span > 0 else self.fps
+
+    def snapshot(self, duration):
+        """Frames de los últimos `duration` segundos: del buffer comprimido o el ring
+        principal o, si no alcanzan 2 segundos (stream principal en pausa), del alternativo.
+        Devuelve (fuente, frames); la fuente sirve para seguir leyendo frames en vivo."""
+        since = time.time() - duration
+        chosen, refs = None, []
+        for source in (self.encoded_buffer, self.frame_ring, self.fallback_ring):
+            if source is None:
+                continue
+            for ref in refs:
+                ref.release()
+            chosen, refs = source, source.snapshot(since=since)
+            if len(refs) > 1 and refs[-1].timestamp - refs[0].timestamp >= 2:
+                break
+        return chosen, refs
@@ -0,0 +1,93 @@
+import cv2
+
+import numpy as np
+
+
+class Zone:
+    """Zona poligonal de detección (coordenadas normalizadas 0-1 del frame)"""
+
+    def __init__(self, name, points, include=True, min_area=None, sensitivity=None):
+        self.name = name
+        self.points = points
+        self.include = include
+        self.min_area = min_area          # None = detection.min_area
+        self.sensitivity = sensitivity    # None = solo la sensibilidad del motor
+
+
+def load_zones(det_config: dict):
+    """Zonas de `detection.zones` (se pueden definir por cámara)"""
+    zones = []
+    for i, zone in enumerate(det_config.get("zones") or []):
+        if not zone.get("enabled", True):
+            continue
+        name = zone.get("name", f"zona{i + 1}")
+        points = zone.get("points") or []
+        if len(points) < 3:
+            print(f"⚠️ Zona '{name}' ignorada: necesita al menos 3 puntos")
+            continue
+        zones.append(Zone(
+            name,
+            [(float(x), float(y)) for x, y in points],
+            include=zone.get("type", "include") != "exclude",
+            min_area=zone.get("min_area"),
+            sensitivity=zone.get("sensitivity"),
+        ))
+    return zones
+
+
+class ZoneMasks:
+    """Zonas rasterizadas una sola vez por resolución de detección.
+
+    Las zonas `exclude` se restan de todas las demás. Sin zonas `include`
+    cuenta todo el frame (menos lo excluido) con el min_area global.
+    """
+
+    def __init__(self, zones):
+        self.zones = zones
+        self._cache = {}  # (alto, ancho) -> (permitido, [(índice, máscara, min_area, sensibilidad)])
+
+    def polygon(self, zone, width, height):
+        return np.array([[x * width, y * height] for x, y in zone.points], dtype=np.int32)
+
+    def _rasterize(self, shape):
+        height, width = shape[:2]
+        allowed = np.full((height, width), 255, dtype=np.uint8)
+        for zone in self.zones:
+            if not zone.include:
+                cv2.fillPoly(allowed, [self.polygon(zone, width, height)], 0)
+
+        regions = []
+        for i, zone in enumerate(self.zones):
+            if zone.include:
+                mask = np.zeros((height, width), dtype=np.uint8)
+                cv2.fillPoly(mask, [self.polygon(zone, width, height)], 255)
+                regions.append((i, cv2.bitwise_and(mask, allowed), zone.min_area, zone.sensitivity))
+        if not regions:
+            regions.append((-1, allowed, None, None))
+        else:
+            allowed = np.zeros_like(allowed)
+            for _, mask, _, _ in regions:
+                cv2.bitwise_or(allowed, mask, dst=allowed)
+        return allowed, regions
+
+    def _get(self, shape):
+        key = tuple(shape[:2])
+        if key not in self._cache:
+            self._cache[key] = self._rasterize(key)
+        return self._cache[key]
+
+    def allowed(self, shape):
+        """Máscara (uint8 0/255) de todo lo que puede disparar una detección"""
+        return self._get(shape)[0]
+
+    def regions(self, shape):
+        """[(índice_de_zona o -1, máscara, min_area o None, sensibilidad o None)]"""
+        return self._get(shape)[1]
+
+    def smallest_area(self, default):
+        """El min_area más chico entre las zonas (para el prefiltro en cascada)"""
+        areas = [default if zone.min_area is None else zone.min_area for zone in self.zones if zone.include]
+        return min(areas) if areas else default
+
+    def name(self, index):
+        return self.zones[index].name if 0 <= index < len(self.zones) else None